@@ -140,6 +140,78 @@ contract UniswapExchange {
         tokenToTokenOut(_tokenPurchased, msg.sender, _recipient, _tokensSold, _minTokensReceived);
     }
 
+    // Pays several recipients in one transaction. Every leg is priced exactly like a separate
+    // ethToTokenPayment executed in order and emits the same event, so the results match N
+    // single payments. The pools are written once per batch and _minTokens bounds the total.
+    function ethToTokenBatchPayment(
+        address[] _recipients,
+        uint256[] _ethAmounts,
+        uint256 _minTokens,
+        uint256 _timeout
+    )
+        external
+        payable
+        exchangeInitialized
+    {
+        require(_recipients.length > 0 && _recipients.length == _ethAmounts.length);
+        require(_minTokens > 0 && now < _timeout);
+        uint256[3] memory pools = [ethPool, tokenPool, invariant];
+        uint256[] memory tokensOut = new uint256[](_recipients.length);
+        uint256 ethTotal = 0;
+        uint256 tokensTotal = 0;
+        uint256 i;
+        for (i = 0; i < _recipients.length; i++) {
+            require(_recipients[i] != address(0) && _recipients[i] != address(this));
+            ethTotal = ethTotal.add(_ethAmounts[i]);
+            tokensOut[i] = ethToTokenLeg(pools, _ethAmounts[i]);
+            tokensTotal = tokensTotal.add(tokensOut[i]);
+        }
+        require(ethTotal == msg.value && tokensTotal >= _minTokens);
+        ethPool = pools[0];
+        tokenPool = pools[1];
+        invariant = pools[2];
+        for (i = 0; i < _recipients.length; i++) {
+            EthToTokenPurchase(msg.sender, _ethAmounts[i], tokensOut[i]);
+            require(token.transfer(_recipients[i], tokensOut[i]));
+        }
+    }
+
+    // Token to ETH counterpart of ethToTokenBatchPayment, with a single transferFrom per batch
+    function tokenToEthBatchPayment(
+        address[] _recipients,
+        uint256[] _tokenAmounts,
+        uint256 _minEth,
+        uint256 _timeout
+    )
+        external
+        exchangeInitialized
+    {
+        require(_recipients.length > 0 && _recipients.length == _tokenAmounts.length);
+        require(_minEth > 0 && now < _timeout);
+        uint256[3] memory pools = [ethPool, tokenPool, invariant];
+        uint256[] memory ethOut = new uint256[](_recipients.length);
+        uint256 tokensTotal = 0;
+        uint256 ethTotal = 0;
+        uint256 i;
+        for (i = 0; i < _recipients.length; i++) {
+            require(_recipients[i] != address(0) && _recipients[i] != address(this));
+            tokensTotal = tokensTotal.add(_tokenAmounts[i]);
+            ethOut[i] = tokenToEthLeg(pools, _tokenAmounts[i]);
+            ethTotal = ethTotal.add(ethOut[i]);
+        }
+        require(ethTotal >= _minEth);
+        ethPool = pools[0];
+        tokenPool = pools[1];
+        invariant = pools[2];
+        for (i = 0; i < _recipients.length; i++) {
+            TokenToEthPurchase(msg.sender, _tokenAmounts[i], ethOut[i]);
+        }
+        require(token.transferFrom(msg.sender, address(this), tokensTotal));
+        for (i = 0; i < _recipients.length; i++) {
+            _recipients[i].transfer(ethOut[i]);
+        }
+    }
+
     // Function called by another Uniswap exchange in Token to Token swaps and payments
     function tokenToTokenIn(
         address _recipient,
@@ -265,6 +337,32 @@ contract UniswapExchange {
         recipient.transfer(ethOut);
     }
 
+    // One leg of ethToTokenBatchPayment, pools = [ethPool, tokenPool, invariant] in memory
+    function ethToTokenLeg(uint256[3] memory pools, uint256 ethIn) internal pure returns (uint256) {
+        require(ethIn > 0);
+        uint256 newEthPool = pools[0].add(ethIn);
+        uint256 newTokenPool = pools[2].div(newEthPool.sub(ethIn.div(FEE_RATE)));
+        uint256 tokensOut = pools[1].sub(newTokenPool);
+        require(tokensOut > 0 && tokensOut <= pools[1]);
+        pools[0] = newEthPool;
+        pools[1] = newTokenPool;
+        pools[2] = newEthPool.mul(newTokenPool);
+        return tokensOut;
+    }
+
+    // One leg of tokenToEthBatchPayment, pools = [ethPool, tokenPool, invariant] in memory
+    function tokenToEthLeg(uint256[3] memory pools, uint256 tokensIn) internal pure returns (uint256) {
+        require(tokensIn > 0);
+        uint256 newTokenPool = pools[1].add(tokensIn);
+        uint256 newEthPool = pools[2].div(newTokenPool.sub(tokensIn.div(FEE_RATE)));
+        uint256 ethOut = pools[0].sub(newEthPool);
+        require(ethOut > 0 && ethOut <= pools[0]);
+        pools[0] = newEthPool;
+        pools[1] = newTokenPool;
+        pools[2] = newEthPool.mul(newTokenPool);
+        return ethOut;
+    }
+
     function tokenToTokenOut(
         address tokenPurchased,
         address buyer,
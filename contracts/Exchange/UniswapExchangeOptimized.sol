@@ -0,0 +1,420 @@
+pragma solidity ^0.4.18;
+import "./SafeMath.sol";
+import "./ERC20Interface.sol";
+import "./UniswapFactory.sol";
+
+
+/// Same external ABI and integer results as UniswapExchange, with less storage traffic:
+/// - invariant is derived from ethPool * tokenPool instead of being stored
+/// - token and factory are stored once, as interfaces, instead of again as tokenAddress and factoryAddress
+/// - pools are read into memory once per call
+contract UniswapExchangeOptimized {
+    using SafeMath for uint256;
+
+    /// EVENTS
+    event EthToTokenPurchase(address indexed buyer, uint256 indexed ethIn, uint256 indexed tokensOut);
+    event TokenToEthPurchase(address indexed buyer, uint256 indexed tokensIn, uint256 indexed ethOut);
+    event Investment(address indexed liquidityProvider, uint256 indexed sharesPurchased);
+    event Divestment(address indexed liquidityProvider, uint256 indexed sharesBurned);
+
+    /// CONSTANTS
+    uint256 public constant FEE_RATE = 500;        //fee = 1/feeRate = 0.2%
+
+    /// STORAGE
+    uint256 public ethPool;
+    uint256 public tokenPool;
+    uint256 public totalShares;
+    ERC20Interface token;
+    FactoryInterface factory;
+    mapping(address => uint256) shares;
+
+    /// MODIFIERS
+    modifier exchangeInitialized() {
+        require(totalShares > 0 && ethPool > 0 && tokenPool > 0);
+        _;
+    }
+
+    /// CONSTRUCTOR
+    function UniswapExchangeOptimized(address _tokenAddress) public {
+        token = ERC20Interface(_tokenAddress);
+        factory = FactoryInterface(msg.sender);
+    }
+
+    /// FALLBACK FUNCTION
+    function() public payable {
+        require(msg.value != 0);
+        ethToToken(msg.sender, msg.sender, msg.value, 1);
+    }
+
+    /// VIEW FUNCTIONS
+    // Stored as a separate slot in UniswapExchange, always equal to ethPool * tokenPool while shares exist
+    function invariant() public view returns (uint256) {
+        if (totalShares == 0) {
+            return 0;
+        }
+        return ethPool.mul(tokenPool);
+    }
+
+    function tokenAddress() public view returns (address) {
+        return address(token);
+    }
+
+    function factoryAddress() public view returns (address) {
+        return address(factory);
+    }
+
+    /// EXTERNAL FUNCTIONS
+    function initializeExchange(uint256 _tokenAmount) external payable {
+        require(totalShares == 0);
+        // Prevents share cost from being too high or too low - potentially needs work
+        require(msg.value >= 10000 && _tokenAmount >= 10000 && msg.value <= 5*10**18);
+        ethPool = msg.value;
+        tokenPool = _tokenAmount;
+        requireInvariant(msg.value, _tokenAmount);
+        shares[msg.sender] = 1000;
+        totalShares = 1000;
+        require(token.transferFrom(msg.sender, address(this), _tokenAmount));
+    }
+
+    // Buyer swaps ETH for Tokens
+    function ethToTokenSwap(
+        uint256 _minTokens,
+        uint256 _timeout
+    )
+        external
+        payable
+    {
+        require(msg.value > 0 && _minTokens > 0 && now < _timeout);
+        ethToToken(msg.sender, msg.sender, msg.value,  _minTokens);
+    }
+
+    // Payer pays in ETH, recipient receives Tokens
+    function ethToTokenPayment(
+        uint256 _minTokens,
+        uint256 _timeout,
+        address _recipient
+    )
+        external
+        payable
+    {
+        require(msg.value > 0 && _minTokens > 0 && now < _timeout);
+        require(_recipient != address(0) && _recipient != address(this));
+        ethToToken(msg.sender, _recipient, msg.value,  _minTokens);
+    }
+
+    // Buyer swaps Tokens for ETH
+    function tokenToEthSwap(
+        uint256 _tokenAmount,
+        uint256 _minEth,
+        uint256 _timeout
+    )
+        external
+    {
+        require(_tokenAmount > 0 && _minEth > 0 && now < _timeout);
+        tokenToEth(msg.sender, msg.sender, _tokenAmount, _minEth);
+    }
+
+    // Payer pays in Tokens, recipient receives ETH
+    function tokenToEthPayment(
+        uint256 _tokenAmount,
+        uint256 _minEth,
+        uint256 _timeout,
+        address _recipient
+    )
+        external
+    {
+        require(_tokenAmount > 0 && _minEth > 0 && now < _timeout);
+        require(_recipient != address(0) && _recipient != address(this));
+        tokenToEth(msg.sender, _recipient, _tokenAmount, _minEth);
+    }
+
+    // Buyer swaps Tokens in current exchange for Tokens of provided address
+    function tokenToTokenSwap(
+        address _tokenPurchased,                  // Must be a token with an attached Uniswap exchange
+        uint256 _tokensSold,
+        uint256 _minTokensReceived,
+        uint256 _timeout
+    )
+        external
+    {
+        require(_tokensSold > 0 && _minTokensReceived > 0 && now < _timeout);
+        tokenToTokenOut(_tokenPurchased, msg.sender, msg.sender, _tokensSold, _minTokensReceived);
+    }
+
+    // Payer pays in exchange Token, recipient receives Tokens of provided address
+    function tokenToTokenPayment(
+        address _tokenPurchased,
+        address _recipient,
+        uint256 _tokensSold,
+        uint256 _minTokensReceived,
+        uint256 _timeout
+    )
+        external
+    {
+        require(_tokensSold > 0 && _minTokensReceived > 0 && now < _timeout);
+        require(_recipient != address(0) && _recipient != address(this));
+        tokenToTokenOut(_tokenPurchased, msg.sender, _recipient, _tokensSold, _minTokensReceived);
+    }
+
+    // Pays several recipients in one transaction. Every leg is priced exactly like a separate
+    // ethToTokenPayment executed in order and emits the same event, so the results match N
+    // single payments. The pools are written once per batch and _minTokens bounds the total.
+    function ethToTokenBatchPayment(
+        address[] _recipients,
+        uint256[] _ethAmounts,
+        uint256 _minTokens,
+        uint256 _timeout
+    )
+        external
+        payable
+        exchangeInitialized
+    {
+        require(_recipients.length > 0 && _recipients.length == _ethAmounts.length);
+        require(_minTokens > 0 && now < _timeout);
+        uint256[2] memory pools = [ethPool, tokenPool];
+        uint256[] memory tokensOut = new uint256[](_recipients.length);
+        uint256 ethTotal = 0;
+        uint256 tokensTotal = 0;
+        uint256 i;
+        for (i = 0; i < _recipients.length; i++) {
+            require(_recipients[i] != address(0) && _recipients[i] != address(this));
+            ethTotal = ethTotal.add(_ethAmounts[i]);
+            tokensOut[i] = ethToTokenLeg(pools, _ethAmounts[i]);
+            tokensTotal = tokensTotal.add(tokensOut[i]);
+        }
+        require(ethTotal == msg.value && tokensTotal >= _minTokens);
+        ethPool = pools[0];
+        tokenPool = pools[1];
+        for (i = 0; i < _recipients.length; i++) {
+            EthToTokenPurchase(msg.sender, _ethAmounts[i], tokensOut[i]);
+            require(token.transfer(_recipients[i], tokensOut[i]));
+        }
+    }
+
+    // Token to ETH counterpart of ethToTokenBatchPayment, with a single transferFrom per batch
+    function tokenToEthBatchPayment(
+        address[] _recipients,
+        uint256[] _tokenAmounts,
+        uint256 _minEth,
+        uint256 _timeout
+    )
+        external
+        exchangeInitialized
+    {
+        require(_recipients.length > 0 && _recipients.length == _tokenAmounts.length);
+        require(_minEth > 0 && now < _timeout);
+        uint256[2] memory pools = [ethPool, tokenPool];
+        uint256[] memory ethOut = new uint256[](_recipients.length);
+        uint256 tokensTotal = 0;
+        uint256 ethTotal = 0;
+        uint256 i;
+        for (i = 0; i < _recipients.length; i++) {
+            require(_recipients[i] != address(0) && _recipients[i] != address(this));
+            tokensTotal = tokensTotal.add(_tokenAmounts[i]);
+            ethOut[i] = tokenToEthLeg(pools, _tokenAmounts[i]);
+            ethTotal = ethTotal.add(ethOut[i]);
+        }
+        require(ethTotal >= _minEth);
+        ethPool = pools[0];
+        tokenPool = pools[1];
+        for (i = 0; i < _recipients.length; i++) {
+            TokenToEthPurchase(msg.sender, _tokenAmounts[i], ethOut[i]);
+        }
+        require(token.transferFrom(msg.sender, address(this), tokensTotal));
+        for (i = 0; i < _recipients.length; i++) {
+            _recipients[i].transfer(ethOut[i]);
+        }
+    }
+
+    // Function called by another Uniswap exchange in Token to Token swaps and payments
+    function tokenToTokenIn(
+        address _recipient,
+        uint256 _minTokens
+    )
+        external
+        payable
+        returns (bool)
+    {
+        require(msg.value > 0);
+        address exchangeToken = factory.exchangeToTokenLookup(msg.sender);
+        require(exchangeToken != address(0));   // Only a Uniswap exchange can call this function
+        ethToToken(msg.sender, _recipient, msg.value, _minTokens);
+        return true;
+    }
+
+    // Invest liquidity and receive market shares
+    function investLiquidity(
+        uint256 _minShares
+    )
+        external
+        payable
+        exchangeInitialized
+    {
+        require(msg.value > 0 && _minShares > 0);
+        uint256 _ethPool = ethPool;
+        uint256 _tokenPool = tokenPool;
+        uint256 _totalShares = totalShares;
+        uint256 ethPerShare = _ethPool.div(_totalShares);
+        require(msg.value >= ethPerShare);
+        uint256 sharesPurchased = msg.value.div(ethPerShare);
+        require(sharesPurchased >= _minShares);
+        uint256 tokensPerShare = _tokenPool.div(_totalShares);
+        uint256 tokensRequired = sharesPurchased.mul(tokensPerShare);
+        shares[msg.sender] = shares[msg.sender].add(sharesPurchased);
+        totalShares = _totalShares.add(sharesPurchased);
+        _ethPool = _ethPool.add(msg.value);
+        _tokenPool = _tokenPool.add(tokensRequired);
+        requireInvariant(_ethPool, _tokenPool);
+        ethPool = _ethPool;
+        tokenPool = _tokenPool;
+        Investment(msg.sender, sharesPurchased);
+        require(token.transferFrom(msg.sender, address(this), tokensRequired));
+    }
+
+    // Divest market shares and receive liquidity
+    function divestLiquidity(
+        uint256 _sharesBurned,
+        uint256 _minEth,
+        uint256 _minTokens
+    )
+        external
+    {
+        require(_sharesBurned > 0);
+        shares[msg.sender] = shares[msg.sender].sub(_sharesBurned);
+        uint256 _ethPool = ethPool;
+        uint256 _tokenPool = tokenPool;
+        uint256 _totalShares = totalShares;
+        uint256 ethPerShare = _ethPool.div(_totalShares);
+        uint256 tokensPerShare = _tokenPool.div(_totalShares);
+        uint256 ethDivested = ethPerShare.mul(_sharesBurned);
+        uint256 tokensDivested = tokensPerShare.mul(_sharesBurned);
+        require(ethDivested >= _minEth && tokensDivested >= _minTokens);
+        _totalShares = _totalShares.sub(_sharesBurned);
+        totalShares = _totalShares;
+        ethPool = _ethPool.sub(ethDivested);
+        tokenPool = _tokenPool.sub(tokensDivested);
+        Divestment(msg.sender, _sharesBurned);
+        require(token.transfer(msg.sender, tokensDivested));
+        msg.sender.transfer(ethDivested);
+    }
+
+    // View share balance of an address
+    function getShares(
+        address _provider
+    )
+        external
+        view
+        returns(uint256 _shares)
+    {
+        return shares[_provider];
+    }
+
+    /// INTERNAL FUNCTIONS
+    // Reverts where UniswapExchange would overflow computing the invariant it stores
+    function requireInvariant(uint256 _ethPool, uint256 _tokenPool) internal pure {
+        require(_ethPool == 0 || _ethPool * _tokenPool / _ethPool == _tokenPool);
+    }
+
+    function ethToToken(
+        address buyer,
+        address recipient,
+        uint256 ethIn,
+        uint256 minTokensOut
+    )
+        internal
+        exchangeInitialized
+    {
+        uint256 _ethPool = ethPool;
+        uint256 _tokenPool = tokenPool;
+        uint256 fee = ethIn.div(FEE_RATE);
+        uint256 newEthPool = _ethPool.add(ethIn);
+        uint256 tempEthPool = newEthPool.sub(fee);
+        uint256 newTokenPool = _ethPool.mul(_tokenPool).div(tempEthPool);
+        uint256 tokensOut = _tokenPool.sub(newTokenPool);
+        require(tokensOut >= minTokensOut && tokensOut <= _tokenPool);
+        requireInvariant(newEthPool, newTokenPool);
+        ethPool = newEthPool;
+        tokenPool = newTokenPool;
+        EthToTokenPurchase(buyer, ethIn, tokensOut);
+        require(token.transfer(recipient, tokensOut));
+    }
+
+    function tokenToEth(
+        address buyer,
+        address recipient,
+        uint256 tokensIn,
+        uint256 minEthOut
+    )
+        internal
+        exchangeInitialized
+    {
+        uint256 _ethPool = ethPool;
+        uint256 _tokenPool = tokenPool;
+        uint256 fee = tokensIn.div(FEE_RATE);
+        uint256 newTokenPool = _tokenPool.add(tokensIn);
+        uint256 tempTokenPool = newTokenPool.sub(fee);
+        uint256 newEthPool = _ethPool.mul(_tokenPool).div(tempTokenPool);
+        uint256 ethOut = _ethPool.sub(newEthPool);
+        require(ethOut >= minEthOut && ethOut <= _ethPool);
+        requireInvariant(newEthPool, newTokenPool);
+        tokenPool = newTokenPool;
+        ethPool = newEthPool;
+        TokenToEthPurchase(buyer, tokensIn, ethOut);
+        require(token.transferFrom(buyer, address(this), tokensIn));
+        recipient.transfer(ethOut);
+    }
+
+    // One leg of ethToTokenBatchPayment, pools = [ethPool, tokenPool] in memory
+    function ethToTokenLeg(uint256[2] memory pools, uint256 ethIn) internal pure returns (uint256) {
+        require(ethIn > 0);
+        uint256 newEthPool = pools[0].add(ethIn);
+        uint256 newTokenPool = pools[0].mul(pools[1]).div(newEthPool.sub(ethIn.div(FEE_RATE)));
+        uint256 tokensOut = pools[1].sub(newTokenPool);
+        require(tokensOut > 0 && tokensOut <= pools[1]);
+        requireInvariant(newEthPool, newTokenPool);
+        pools[0] = newEthPool;
+        pools[1] = newTokenPool;
+        return tokensOut;
+    }
+
+    // One leg of tokenToEthBatchPayment, pools = [ethPool, tokenPool] in memory
+    function tokenToEthLeg(uint256[2] memory pools, uint256 tokensIn) internal pure returns (uint256) {
+        require(tokensIn > 0);
+        uint256 newTokenPool = pools[1].add(tokensIn);
+        uint256 newEthPool = pools[0].mul(pools[1]).div(newTokenPool.sub(tokensIn.div(FEE_RATE)));
+        uint256 ethOut = pools[0].sub(newEthPool);
+        require(ethOut > 0 && ethOut <= pools[0]);
+        requireInvariant(newEthPool, newTokenPool);
+        pools[0] = newEthPool;
+        pools[1] = newTokenPool;
+        return ethOut;
+    }
+
+    function tokenToTokenOut(
+        address tokenPurchased,
+        address buyer,
+        address recipient,
+        uint256 tokensIn,
+        uint256 minTokensOut
+    )
+        internal
+        exchangeInitialized
+    {
+        require(tokenPurchased != address(0) && tokenPurchased != address(this));
+        address exchangeAddress = factory.tokenToExchangeLookup(tokenPurchased);
+        require(exchangeAddress != address(0) && exchangeAddress != address(this));
+        uint256 _ethPool = ethPool;
+        uint256 _tokenPool = tokenPool;
+        uint256 newTokenPool = _tokenPool.add(tokensIn);
+        // tempTokenPool = newTokenPool - fee, inlined to stay clear of the stack limit
+        uint256 newEthPool = _ethPool.mul(_tokenPool).div(newTokenPool.sub(tokensIn.div(FEE_RATE)));
+        uint256 ethOut = _ethPool.sub(newEthPool);
+        require(ethOut <= _ethPool);
+        TokenToEthPurchase(buyer, tokensIn, ethOut);
+        requireInvariant(newEthPool, newTokenPool);
+        tokenPool = newTokenPool;
+        ethPool = newEthPool;
+        require(token.transferFrom(buyer, address(this), tokensIn));
+        require(UniswapExchangeOptimized(exchangeAddress).tokenToTokenIn.value(ethOut)(recipient, minTokensOut));
+    }
+}
@@ -14,7 +14,8 @@ contract FactoryInterface {
 }
 
 
-contract UniswapFactory is FactoryInterface {
+/// Exchange registry shared by the factories, each deploys its own exchange contract in createExchange
+contract UniswapFactoryBase is FactoryInterface {
     event ExchangeLaunch(address indexed exchange, address indexed token);
 
     // index of tokens with registered exchanges
@@ -25,7 +26,7 @@ contract UniswapFactory is FactoryInterface {
     function launchExchange(address _token) public returns (address exchange) {
         require(tokenToExchange[_token] == address(0));             //There can only be one exchange per token
         require(_token != address(0) && _token != address(this));
-        UniswapExchange newExchange = new UniswapExchange(_token);
+        address newExchange = createExchange(_token);
         tokenList.push(_token);
         tokenToExchange[_token] = newExchange;
         exchangeToToken[newExchange] = _token;
@@ -33,6 +34,8 @@ contract UniswapFactory is FactoryInterface {
         return newExchange;
     }
 
+    function createExchange(address _token) internal returns (address exchange);
+
     function getExchangeCount() public view returns (uint exchangeCount) {
         return tokenList.length;
     }
@@ -45,3 +48,10 @@ contract UniswapFactory is FactoryInterface {
         return exchangeToToken[_exchange];
     }
 }
+
+
+contract UniswapFactory is UniswapFactoryBase {
+    function createExchange(address _token) internal returns (address exchange) {
+        return new UniswapExchange(_token);
+    }
+}
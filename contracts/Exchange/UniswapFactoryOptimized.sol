@@ -0,0 +1,10 @@
+pragma solidity ^0.4.20;
+import "./UniswapFactory.sol";
+import "./UniswapExchangeOptimized.sol";
+
+
+contract UniswapFactoryOptimized is UniswapFactoryBase {
+    function createExchange(address _token) internal returns (address exchange) {
+        return new UniswapExchangeOptimized(_token);
+    }
+}
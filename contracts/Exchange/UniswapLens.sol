@@ -0,0 +1,51 @@
+pragma solidity ^0.4.18;
+import "./UniswapFactory.sol";
+
+
+contract ExchangeStateInterface {
+    function ethPool() public view returns (uint256);
+    function tokenPool() public view returns (uint256);
+    function invariant() public view returns (uint256);
+    function totalShares() public view returns (uint256);
+}
+
+
+/// Read-only view of every exchange registered in a factory, one page per call.
+/// Works with UniswapFactory and UniswapFactoryOptimized.
+contract UniswapLens {
+    uint256 public constant FIELDS = 6;
+
+    // Rows of FIELDS words for tokenList[_start:_start + _count], clamped to the exchange count:
+    // token, exchange, ethPool, tokenPool, invariant, totalShares
+    function getExchangeStates(
+        address _factory,
+        uint256 _start,
+        uint256 _count
+    )
+        external
+        view
+        returns (uint256 exchangeCount, uint256[] states)
+    {
+        FactoryInterface factory = FactoryInterface(_factory);
+        exchangeCount = factory.getExchangeCount();
+        uint256 end = exchangeCount;
+        if (_start >= end) {
+            return (exchangeCount, new uint256[](0));
+        }
+        if (_count < end - _start) {
+            end = _start + _count;
+        }
+        states = new uint256[]((end - _start) * FIELDS);
+        for (uint256 i = _start; i < end; i++) {
+            address token = factory.tokenList(i);
+            ExchangeStateInterface exchange = ExchangeStateInterface(factory.tokenToExchangeLookup(token));
+            uint256 row = (i - _start) * FIELDS;
+            states[row] = uint256(token);
+            states[row + 1] = uint256(address(exchange));
+            states[row + 2] = exchange.ethPool();
+            states[row + 3] = exchange.tokenPool();
+            states[row + 4] = exchange.invariant();
+            states[row + 5] = exchange.totalShares();
+        }
+    }
+}
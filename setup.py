@@ -17,6 +17,7 @@ setup(
         'ethereum',
         'web3',
         'py-solc',
-        'pytest'
+        'pytest',
+        'pytest-xdist'
     ],
 )
@@ -0,0 +1,65 @@
+import random
+import pytest
+from ethereum.abi import ContractTranslator, EncodingError
+from uniswap import abi
+
+EXTRA_ABI = [
+    {'type': 'function', 'name': 'mixed', 'constant': True,
+     'inputs': [{'type': 'bool', 'name': 'a'}, {'type': 'int256', 'name': 'b'}, {'type': 'bytes32', 'name': 'c'},
+                {'type': 'uint8', 'name': 'd'}],
+     'outputs': [{'type': 'bool', 'name': ''}, {'type': 'int256', 'name': ''}, {'type': 'uint8', 'name': ''}]},
+    {'type': 'function', 'name': 'dynamic', 'constant': False,
+     'inputs': [{'type': 'address[]', 'name': 'a'}, {'type': 'string', 'name': 'b'}],
+     'outputs': [{'type': 'string', 'name': ''}]},
+]
+
+def random_value(rng, typ):
+    if typ.endswith('[]'):
+        return [random_value(rng, typ[:-2]) for _ in range(rng.randrange(4))]
+    if typ == 'address':
+        value = bytes(rng.getrandbits(8) for _ in range(20))
+        return rng.choice([value, '0x' + value.hex(), value.hex(), int.from_bytes(value, 'big')])
+    if typ.startswith('uint'):
+        return rng.choice([0, 1, 2**int(typ[4:]) - 1, rng.getrandbits(int(typ[4:]))])
+    if typ == 'int256':
+        return rng.randrange(-2**255, 2**255)
+    if typ == 'bool':
+        return rng.choice([True, False])
+    if typ == 'bytes32':
+        return bytes(rng.getrandbits(8) for _ in range(32))
+    if typ == 'string':
+        return 'x' * rng.randrange(40)
+    raise ValueError(typ)
+
+@pytest.mark.parametrize('entries', ['exchange', 'extra'])
+def test_codec_matches_translator(entries, exchange_abi):
+    entries = exchange_abi if entries == 'exchange' else EXTRA_ABI
+    rng = random.Random(0)
+    translator = ContractTranslator(entries)
+    codec = abi.codec(entries)
+    for name, data in translator.function_data.items():
+        for _ in range(20):
+            args = [random_value(rng, typ) for typ in data['encode_types']]
+            calldata = codec.encode(name, args)
+            assert calldata == translator.encode_function_call(name, args), name
+            if 'string' not in data['decode_types']:
+                outputs = bytes(rng.getrandbits(8) for _ in range(32 * len(data['decode_types'])))
+                assert codec.decode(name, outputs) == translator.decode_function_result(name, outputs), name
+
+def test_codec_errors(exchange_abi):
+    codec = abi.codec(exchange_abi)
+    with pytest.raises(EncodingError):
+        codec.encode('ethToTokenSwap', [2**256, 1])
+    with pytest.raises(EncodingError):
+        codec.encode('getShares', ['0x12'])
+    with pytest.raises(ValueError):
+        codec.encode('noSuchFunction', [])
+
+def test_codec_is_shared(exchange_abi):
+    copy = [dict(entry) for entry in exchange_abi]
+    assert abi.codec(copy) is abi.codec(exchange_abi)
+    assert abi.translator(copy) is abi.codec(exchange_abi).translator
+    assert abi.codec(abi.translator(copy)) is abi.codec(copy)
+    rows = [[1, 2], [3, 4]]
+    assert abi.codec(copy).encode_many('ethToTokenSwap', rows) == \
+        [ContractTranslator(copy).encode_function_call('ethToTokenSwap', row) for row in rows]
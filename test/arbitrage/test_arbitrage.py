@@ -0,0 +1,73 @@
+import random
+from uniswap import model
+from uniswap.arbitrage import Scanner, maximize
+from uniswap.router import Book
+
+A, B, C = b'\x0a' * 20, b'\x0b' * 20, b'\x0c' * 20
+EXCHANGE_A, EXCHANGE_B = b'\xea' * 20, b'\xeb' * 20
+
+def test_maximize():
+    assert maximize(lambda x: -(x - 1234567) ** 2, 1, 10**24) == (1234567, 0)
+    assert maximize(lambda x: None if x < 500 else 1000 - x, 1, 10**6) == (500, 500)
+
+def test_eth_cycle_is_exact_and_optimal():
+    scanner = Scanner({'cheap': Book.from_reserves([(A, EXCHANGE_A, 5*10**18, 20*10**18)]),
+                       'dear': Book.from_reserves([(A, EXCHANGE_A, 5*10**18, 10*10**18)])})
+    opportunities = scanner.scan()
+    assert [(o.kind, o.token) for o in opportunities] == [('eth', A)]
+    best = opportunities[0]
+    buy, sell = best.hops
+    assert (buy.factory, buy.function, sell.factory, sell.function) == ('cheap', 'ethToTokenSwap', 'dear', 'tokenToEthSwap')
+    cheap, dear = scanner.books['cheap'].state(A).copy(), scanner.books['dear'].state(A).copy()
+    assert dear.token_to_eth(cheap.eth_to_token(best.amount_in)) - best.amount_in == best.profit
+    for x in range(best.amount_in // 100, 5*10**18, 5*10**16):
+        tokens = scanner.books['cheap'].state(A).eth_to_token_out(x)[0]
+        assert scanner.books['dear'].state(A).token_to_eth_out(tokens)[0] - x <= best.profit
+
+def test_token_cycle():
+    scanner = Scanner({
+        'f1': Book.from_reserves([(A, EXCHANGE_A, 5*10**18, 10*10**18), (B, EXCHANGE_B, 5*10**18, 10*10**18)]),
+        'f2': Book.from_reserves([(A, EXCHANGE_A, 5*10**18, 12*10**18), (B, EXCHANGE_B, 5*10**18, 8*10**18)]),
+    })
+    cycles = [o for o in scanner.scan() if o.kind == 'token']
+    # the same loop entered from either token, A sold on f1 or B sold on f2
+    assert {(o.token, o.hops[0].factory) for o in cycles} == {(A, 'f1'), (B, 'f2')}
+    cycle, = [o for o in cycles if o.token == A]
+    f1, f2 = scanner.books['f1'], scanner.books['f2']
+    bought = model.token_to_token(f1.state(A).copy(), f1.state(B).copy(), cycle.amount_in)
+    assert model.token_to_token(f2.state(B).copy(), f2.state(A).copy(), bought) - cycle.amount_in == cycle.profit
+
+def test_balanced_pools_and_references():
+    scanner = Scanner({'f1': Book.from_reserves([(A, EXCHANGE_A, 5*10**18, 10*10**18)]),
+                       'f2': Book.from_reserves([(A, EXCHANGE_A, 10**18, 2*10**18)])})
+    assert scanner.scan() == []
+    scanner.set_reference(A, '0.6')
+    trades = scanner.scan()
+    assert sorted(o.hops[0].factory for o in trades) == ['f1', 'f2']
+    for trade in trades:
+        assert (trade.kind, trade.hops[0].function) == ('reference', 'ethToTokenSwap')
+        state = scanner.books[trade.hops[0].factory].state(A)
+        assert state.eth_to_token_out(trade.amount_in)[0] * 6 // 10 - trade.amount_in == trade.profit
+    assert trades[0].hops[0].factory == 'f1'
+    scanner.set_reference(A, '0.4')
+    assert {o.hops[0].function for o in scanner.scan()} == {'tokenToEthSwap'}
+
+def test_incremental_update():
+    rng = random.Random(3)
+    tokens = [i.to_bytes(20, 'big') for i in range(1, 301)]
+    pools = [(t, b'x' + t[1:], rng.randint(10**17, 5*10**18), rng.randint(10**18, 10**20)) for t in tokens]
+    scanner = Scanner({'f1': Book.from_reserves(pools), 'f2': Book.from_reserves(pools)})
+    assert scanner.scan() == []
+    # one pool of f2 gets cheap: only the cycles through its token are evaluated
+    state = scanner.books['f2'].state(tokens[7])
+    state.eth_to_token(state.eth_pool // 5)
+    scanner.update('f2', tokens[7], *state.pools())
+    evaluations = scanner.evaluations
+    found = scanner.scan()
+    exchange = scanner._exchange('f2', tokens[7])
+    assert 'eth' in {o.kind for o in found}
+    assert all(any(hop.exchange == exchange for hop in o.hops) for o in found)
+    assert scanner.evaluations - evaluations <= 2 * scanner.top + 1
+    evaluations = scanner.evaluations
+    assert scanner.scan() == found
+    assert scanner.evaluations == evaluations
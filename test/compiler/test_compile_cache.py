@@ -0,0 +1,63 @@
+import os
+import pytest
+from ethereum.tools import _solidity
+from uniswap import compiler
+
+
+@pytest.fixture
+def sources(tmp_path):
+    (tmp_path / 'Lib').mkdir()
+    (tmp_path / 'Lib' / 'Math.sol').write_text('library Math {}\n')
+    (tmp_path / 'Lib' / 'Base.sol').write_text('import "./Math.sol";\ncontract Base {}\n')
+    (tmp_path / 'Lib' / 'Main.sol').write_text('import "./Base.sol";\ncontract Main is Base {}\n')
+    return str(tmp_path)
+
+@pytest.fixture
+def fake_solc(monkeypatch):
+    calls = []
+    def compile_file(path, combined='bin,abi', optimize=True, extra_args=None):
+        calls.append(path)
+        return {'Main.sol:Main': {'bin': b'\x60\x00', 'bin_hex': '6000', 'abi': []}}
+    monkeypatch.setattr(_solidity, 'compile_file', compile_file)
+    monkeypatch.setattr(compiler, 'solc_id', lambda: 'solc-0.4.21')
+    monkeypatch.setattr(compiler, '_artifacts', {})
+    return calls
+
+def test_source_files_are_transitive(sources):
+    files = compiler.source_files(os.path.join(sources, 'Lib/Main.sol'), sources)
+    assert [os.path.basename(f) for f in files] == ['Base.sol', 'Main.sol', 'Math.sol']
+
+def test_warm_cache_skips_solc(sources, fake_solc, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    artifact = compiler.compile_contract('Lib/Main.sol', contracts_dir=sources, cache_dir=cache_dir)
+    assert artifact['bin'] == b'\x60\x00'
+    assert len(fake_solc) == 1
+    # fresh process: empty in-memory table, artifact comes from disk
+    monkeypatch.setattr(compiler, '_artifacts', {})
+    artifact = compiler.compile_contract('Lib/Main.sol', contracts_dir=sources, cache_dir=cache_dir)
+    assert artifact['bin'] == b'\x60\x00'
+    assert artifact['abi'] == []
+    assert len(fake_solc) == 1
+
+def test_cache_invalidation(sources, fake_solc, tmp_path, monkeypatch):
+    key = compiler.cache_key(os.path.join(sources, 'Lib/Main.sol'), contracts_dir=sources)
+    assert key == compiler.cache_key(os.path.join(sources, 'Lib/Main.sol'), contracts_dir=sources)
+    # Transitive import changes
+    with open(os.path.join(sources, 'Lib/Math.sol'), 'a') as f:
+        f.write('// edited\n')
+    new_key = compiler.cache_key(os.path.join(sources, 'Lib/Main.sol'), contracts_dir=sources)
+    assert new_key != key
+    # Optimizer flags change
+    assert compiler.cache_key(os.path.join(sources, 'Lib/Main.sol'), optimize=False, contracts_dir=sources) != new_key
+    # Compiler changes
+    monkeypatch.setattr(compiler, 'solc_id', lambda: 'solc-0.4.24')
+    assert compiler.cache_key(os.path.join(sources, 'Lib/Main.sol'), contracts_dir=sources) != new_key
+
+def test_compile_all_warms_the_cache(sources, fake_solc, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    assert compiler.compile_all(contracts_dir=sources, cache_dir=cache_dir) == ['Lib/Base.sol', 'Lib/Main.sol', 'Lib/Math.sol']
+    assert len(fake_solc) == 3
+    # a worker process reads every artifact from disk
+    monkeypatch.setattr(compiler, '_artifacts', {})
+    compiler.compile_contract('Lib/Main.sol', contracts_dir=sources, cache_dir=cache_dir)
+    assert len(fake_solc) == 3
@@ -1,45 +1,88 @@
 import os
+import time
 import pytest
-import json
-from ethereum.tools import _solidity, tester
-from ethereum.abi import ContractTranslator
+from ethereum.tools import tester
 from ethereum import utils as ethereum_utils
+from uniswap import compiler
+from uniswap.abi import Contract, load_abi
+from uniswap.deploy import FACTORIES, deploy_contract, load_world, world_file
 
 """
+    install with:       pip install -e .
     run tests with:     pytest -v
+    run in parallel:    pytest -n 16
+
+    Every worker builds its own World, so workers share no chain. Contracts
+    are compiled and deployed once by the controller before the workers
+    start, the workers only read the compile cache and the stored world.
 """
 
 OWN_DIR = os.path.dirname(os.path.realpath(__file__))
 EXCHANGE_ABI = os.path.join(OWN_DIR, 'ABI/exchangeABI.json')
+EXCHANGE_FIXTURES = ('uni_token_exchange', 'swap_token_exchange')
+
+def pytest_addoption(parser):
+    parser.addoption('--gas-threshold', type=float, default=0.02,
+                     help='allowed relative gas increase over test/gas/gas_baseline.json')
+    parser.addoption('--update-gas-baseline', action='store_true',
+                     help='record the measured gas as the new baseline')
+
+_durations = []
+_started = []
+
+def pytest_configure(config):
+    # plain runs and the xdist controller compile and deploy, workers (config.workerinput) find a warm cache
+    if not hasattr(config, 'workerinput') and compiler.solc_id() != 'missing':
+        compiler.compile_all()
+        for factory in FACTORIES:
+            world_file(factory=factory)
+
+def pytest_sessionstart(session):
+    _started.append(time.time())
+
+def pytest_runtest_logreport(report):
+    # the xdist controller receives the reports of every worker here
+    _durations.append(report.duration)
+
+def pytest_terminal_summary(terminalreporter, config):
+    workers = getattr(config.option, 'numprocesses', None)
+    if hasattr(config, 'workerinput') or not workers or not _started:
+        return
+    wall = time.time() - _started[0]
+    serial = sum(_durations)
+    terminalreporter.write_sep('-', 'parallel run')
+    # an estimate, not a serial run: per-test durations include the session fixtures every worker sets up again
+    terminalreporter.write_line('{} workers: {:.1f}s of summed test time in {:.1f}s wall, estimated speedup {:.1f}x '
+                                '({:.0%} per worker)'.format(workers, serial, wall, serial / max(wall, 1e-9),
+                                                             serial / max(wall, 1e-9) / workers))
+
+class ChainTester(object):
+    """ The tester module with s bound to one chain instead of the tester.s global. """
+
+    # contracts built through t.ABIContract share the memoized codec of their ABI
+    ABIContract = Contract
+
+    def __init__(self, chain):
+        self.s = chain
+
+    def __getattr__(self, name):
+        return getattr(tester, name)
 
-def get_dirs(path):
-    abs_contract_path = os.path.realpath(os.path.join(OWN_DIR, '..', 'contracts'))
-    sub_dirs = [x[0] for x in os.walk(abs_contract_path)]
-    extra_args = ' '.join(['{}={}'.format(d.split('/')[-1], d) for d in sub_dirs])
-    path = '{}/{}'.format(abs_contract_path, path)
-    return path, extra_args
+@pytest.fixture(scope='session', params=FACTORIES, ids=lambda path: path.split('/')[-1].split('.')[0])
+def world(request):
+    # Loaded once per session and factory variant from the stored deployment, every test starts from one of its stages
+    return load_world(exchange_abi=load_abi(EXCHANGE_ABI), factory=request.param)
 
 @pytest.fixture
-def t():
-    tester.s = tester.Chain({account: {'balance': 10**30}for account in tester.accounts})
-    return tester
+def t(request, world):
+    launched = any(name in request.fixturenames for name in EXCHANGE_FIXTURES)
+    world.reset('launched' if launched else 'deployed')
+    return ChainTester(world.chain)
 
 @pytest.fixture
 def contract_tester(t):
     def create_contract(path, args=None, sender=t.k0):
-        t.s.mine();
-        contract_name = path.split('/')[1]
-        contract_name += ':' + contract_name.split('.')[0]
-        path, extra_args = get_dirs(path)
-        if args:
-                args = [x.address if isinstance(x, t.ABIContract) else x for x in args]
-        compiler = t.languages['solidity']
-        combined = _solidity.compile_file(path, combined='bin,abi', optimize=True, extra_args=extra_args)
-        abi = combined[contract_name]['abi']
-        ct = ContractTranslator(abi)
-        code = combined[contract_name]['bin'] + (ct.encode_constructor_arguments(args) if args else b'')
-        address = t.s.tx(sender=sender, to=b'', value=0, data=code)
-        return t.ABIContract(t.s, abi, address)
+        return deploy_contract(t.s, path, args=args, sender=sender)
     return create_contract
 
 @pytest.fixture
@@ -56,30 +99,25 @@ def utils():
     return ethereum_utils
 
 @pytest.fixture
-def uni_token(t, contract_tester):
-    return contract_tester('Token/TestToken.sol', args=["UNI Token", "UNI", 18])
+def uni_token(t, world):
+    return world.tokens[0]
 
 @pytest.fixture
-def swap_token(t, contract_tester):
-    return contract_tester('Token/TestToken.sol', args=["SWAP Token", "SWAP", 18])
+def swap_token(t, world):
+    return world.tokens[1]
 
 @pytest.fixture
-def uniswap_factory(t, contract_tester):
-    return contract_tester('Exchange/UniswapFactory.sol', args=[])
+def uniswap_factory(t, world):
+    return world.factory
 
 @pytest.fixture
-def exchange_abi(t, contract_tester):
-    abi = json.load(open(EXCHANGE_ABI))
-    return abi
+def exchange_abi():
+    return load_abi(EXCHANGE_ABI)
 
 @pytest.fixture
-def uni_token_exchange(t, contract_tester, uniswap_factory, exchange_abi, uni_token):
-    t.s.mine()
-    uni_exchange_address = uniswap_factory.launchExchange(uni_token.address)
-    return t.ABIContract(t.s, exchange_abi, uni_exchange_address)
+def uni_token_exchange(t, world):
+    return world.exchanges[0]
 
 @pytest.fixture
-def swap_token_exchange(t, contract_tester, uniswap_factory, exchange_abi, swap_token):
-    t.s.mine()
-    swap_token_address = uniswap_factory.launchExchange(swap_token.address)
-    return t.ABIContract(t.s, exchange_abi, swap_token_address)
+def swap_token_exchange(t, world):
+    return world.exchanges[1]
@@ -0,0 +1,46 @@
+from ethereum.tools import tester
+from uniswap import deploy
+
+def test_world_key_follows_bytecode(monkeypatch):
+    bytecode = {'Token/TestToken.sol': b'\x60\x00', 'Exchange/UniswapFactory.sol': b'\x60\x01',
+                'Exchange/UniswapFactoryOptimized.sol': b'\x60\x02'}
+    monkeypatch.setattr(deploy, 'compile_contract', lambda path: {'bin': bytecode[path]})
+    key = deploy.world_key()
+    assert key == deploy.world_key()
+    assert key != deploy.world_key(factory=deploy.FACTORIES[1])
+    assert key != deploy.world_key(tokens=deploy.TOKENS[:1])
+    bytecode['Token/TestToken.sol'] += b'\x00'
+    assert key != deploy.world_key()
+
+def test_load_world(tmpdir, monkeypatch):
+    built = deploy.build_world()
+    loaded = deploy.load_world(cache_dir=str(tmpdir))
+    assert [t.address for t in loaded.tokens] == [t.address for t in built.tokens]
+    assert loaded.factory.address == built.factory.address
+    assert [e.address for e in loaded.exchanges] == [e.address for e in built.exchanges]
+    assert loaded.tokens[0].symbol().decode('utf-8') == 'UNI'
+    assert loaded.factory.getExchangeCount() == 2
+    loaded.reset('deployed')
+    assert loaded.factory.getExchangeCount() == 0
+    # Later sessions load the stored stage without deploying anything
+    monkeypatch.setattr(deploy, 'build_world', None)
+    again = deploy.load_world(cache_dir=str(tmpdir))
+    assert again.factory.tokenToExchangeLookup(again.tokens[1].address) == built.exchanges[1].address
+def test_reset_rewinds_the_canonical_chain():
+    chain = tester.Chain(deploy.ALLOC)
+    world = deploy.World(chain, [], None, [], {})
+    world.seal('deployed')
+    stage = chain.chain.head
+    for _ in range(3):
+        chain.tx(to=tester.a1, value=1)
+        chain.mine()
+    world.reset('deployed')
+    assert chain.chain.head_hash == stage.hash and chain.chain.get_blockhash_by_number(stage.number + 1) is None
+    # the next test's blocks are the canonical chain, whatever the previous test mined
+    chain.tx(to=tester.a2, value=7)
+    block = chain.mine()
+    assert chain.chain.head_hash == block.hash and chain.chain.get_block_by_number(stage.number + 1) == block
+    assert chain.chain.get_tx_position(block.transactions[0]) == (stage.number + 1, 0)
+    assert chain.chain.state.get_balance(tester.a2) == chain.head_state.get_balance(tester.a2)
+    world.reset('deployed')
+    assert chain.head_state.get_balance(tester.a1) == chain.head_state.get_balance(tester.a2) == 10**30
@@ -0,0 +1,80 @@
+from ethereum import abi, utils
+from ethereum.tools import tester
+from uniswap import batch
+from uniswap.model import ExchangeState
+
+def initialize(t, token, exchange):
+    t.s.mine()
+    token.mint(t.a1, 10*10**18)
+    token.approve(exchange.address, 10*10**18, sender=t.k1)
+    exchange.initializeExchange(10*10**18, value=5*10**18, sender=t.k1)
+    expected = ExchangeState()
+    expected.initialize(t.a1, 5*10**18, 10*10**18)
+    return expected
+
+def test_encode_batch():
+    recipients = [tester.a3, tester.a4, tester.a5]
+    amounts = [10**17, 3*10**17, 2**256 - 1]
+    data = batch.encode_batch(batch.ETH_TO_TOKEN, recipients, amounts, 7, 1234)
+    assert data[:4] == batch.SELECTORS[batch.ETH_TO_TOKEN]
+    assert data[4:] == abi.encode_abi(['address[]', 'uint256[]', 'uint256', 'uint256'], [recipients, amounts, 7, 1234])
+    assert [len(r) for r, a in batch.chunks(list(range(250)), list(range(250)))] == [100, 100, 50]
+
+def test_eth_to_token_batch_payment(t, uni_token, uni_token_exchange, assert_tx_failed):
+    expected = initialize(t, uni_token, uni_token_exchange)
+    timeout = t.s.head_state.timestamp + 300
+    recipients = [t.a3, t.a4, t.a5]
+    amounts = [1*10**17, 3*10**17, 1*10**18]
+    # Every leg is priced like a separate ethToTokenPayment
+    purchased = expected.eth_to_token_batch(amounts)
+    # Sent ETH != sum of the amounts
+    assert_tx_failed(t, lambda: uni_token_exchange.ethToTokenBatchPayment(recipients, amounts, 1, timeout, value=sum(amounts) - 1, sender=t.k2))
+    # Total purchased tokens < min tokens
+    assert_tx_failed(t, lambda: uni_token_exchange.ethToTokenBatchPayment(recipients, amounts, sum(purchased) + 1, timeout, value=sum(amounts), sender=t.k2))
+    # Recipient = exchange, amount = 0, length mismatch, empty batch, timeout < now
+    assert_tx_failed(t, lambda: uni_token_exchange.ethToTokenBatchPayment([t.a3, uni_token_exchange.address], [1, 1], 1, timeout, value=2, sender=t.k2))
+    assert_tx_failed(t, lambda: uni_token_exchange.ethToTokenBatchPayment(recipients, [10**17, 0, 10**17], 1, timeout, value=2*10**17, sender=t.k2))
+    assert_tx_failed(t, lambda: uni_token_exchange.ethToTokenBatchPayment(recipients, amounts[:2], 1, timeout, value=sum(amounts[:2]), sender=t.k2))
+    assert_tx_failed(t, lambda: uni_token_exchange.ethToTokenBatchPayment([], [], 1, timeout, value=0, sender=t.k2))
+    assert_tx_failed(t, lambda: uni_token_exchange.ethToTokenBatchPayment(recipients, amounts, 1, timeout - 301, value=sum(amounts), sender=t.k2))
+    uni_token_exchange.ethToTokenBatchPayment(recipients, amounts, sum(purchased), timeout, value=sum(amounts), sender=t.k2)
+    assert [uni_token.balanceOf(r) for r in recipients] == purchased
+    assert uni_token_exchange.ethPool() == expected.eth_pool == 5*10**18 + sum(amounts)
+    assert uni_token_exchange.tokenPool() == expected.token_pool == 10*10**18 - sum(purchased)
+    assert uni_token_exchange.invariant() == expected.invariant
+    assert t.s.head_state.get_balance(t.a2) == 10**30 - sum(amounts)
+    assert t.s.head_state.get_balance(uni_token_exchange.address) == expected.eth_pool
+
+def test_token_to_eth_batch_payment(t, uni_token, uni_token_exchange, assert_tx_failed):
+    expected = initialize(t, uni_token, uni_token_exchange)
+    timeout = t.s.head_state.timestamp + 300
+    uni_token.mint(t.a2, 3*10**18)
+    uni_token.approve(uni_token_exchange.address, 3*10**18, sender=t.k2)
+    recipients = [t.a3, t.a4, t.a5]
+    amounts = [2*10**17, 8*10**17, 2*10**18]
+    purchased = expected.token_to_eth_batch(amounts)
+    # Total purchased ETH < min ETH
+    assert_tx_failed(t, lambda: uni_token_exchange.tokenToEthBatchPayment(recipients, amounts, sum(purchased) + 1, timeout, sender=t.k2))
+    # Sum of the amounts > allowance
+    assert_tx_failed(t, lambda: uni_token_exchange.tokenToEthBatchPayment(recipients, amounts + [1], 1, timeout, sender=t.k2))
+    # Recipient = 0x0
+    assert_tx_failed(t, lambda: uni_token_exchange.tokenToEthBatchPayment([t.a3, b'\x00'*20, t.a5], amounts, 1, timeout, sender=t.k2))
+    uni_token_exchange.tokenToEthBatchPayment(recipients, amounts, sum(purchased), timeout, sender=t.k2)
+    assert [t.s.head_state.get_balance(r) for r in recipients] == [10**30 + x for x in purchased]
+    assert uni_token.balanceOf(t.a2) == 0
+    assert uni_token_exchange.ethPool() == expected.eth_pool == 5*10**18 - sum(purchased)
+    assert uni_token_exchange.tokenPool() == expected.token_pool == 10*10**18 + sum(amounts)
+    assert uni_token_exchange.invariant() == expected.invariant
+    assert uni_token.balanceOf(uni_token_exchange.address) == expected.token_pool
+
+def test_send_batch(t, uni_token, uni_token_exchange):
+    expected = initialize(t, uni_token, uni_token_exchange)
+    recipients = [utils.int_to_addr(0x10000 + i) for i in range(40)]
+    amounts = [10**15 * (i + 1) for i in range(40)]
+    purchased = expected.eth_to_token_batch(amounts)
+    for chunk_recipients, chunk_amounts in batch.chunks(recipients, amounts, 15):
+        t.s.mine()
+        batch.send_batch(t.s, uni_token_exchange.address, batch.ETH_TO_TOKEN, chunk_recipients, chunk_amounts,
+                         1, t.s.head_state.timestamp + 300, t.k2)
+    assert [uni_token.balanceOf(r) for r in recipients] == purchased
+    assert uni_token_exchange.tokenPool() == expected.token_pool
@@ -0,0 +1,40 @@
+import random
+import pytest
+from uniswap.deploy import FACTORIES
+from uniswap.fuzz import ChainRunner, ModelWorld, observe_model, random_sequence, shrink
+
+@pytest.fixture(scope='module', params=FACTORIES, ids=lambda path: path.split('/')[-1].split('.')[0])
+def runner(request):
+    return ChainRunner(request.param)
+
+def test_shrink():
+    # Fails whenever an op with amount >= 1000 follows an op on exchange 1
+    def fails(ops):
+        seen = False
+        for op in ops:
+            if seen and op[3] >= 1000:
+                return True
+            seen = seen or op[1] == 1
+        return False
+    ops = random_sequence(random.Random(3), 30)
+    assert fails(ops)
+    shrunk = shrink(ops, fails)
+    assert fails(shrunk)
+    assert len(shrunk) == 2
+    assert shrunk[1][3] == 1000
+
+def test_model_world_reverts_atomically():
+    world = ModelWorld({'accounts': ['a1', 'a2', 'a3', 'a4'], 'exchanges': ['e0', 'e1']})
+    assert world.apply(('initialize', 0, 1, 5*10**18, 10*10**18, 0))
+    before = observe_model(world)
+    # Purchased tokens < min tokens: neither the pool nor the ETH balance moves
+    assert not world.apply(('eth_to_token', 0, 2, 10**18, 10**19, 0))
+    assert observe_model(world) == before
+    assert world.apply(('eth_to_token', 0, 2, 10**18, 1, 0))
+    assert world.tokens[0]['a2'] == 10**30 + 1663887962654218073
+
+@pytest.mark.parametrize('seed', range(5))
+def test_chain_matches_model(runner, seed):
+    ops = random_sequence(random.Random(seed), 25)
+    steps, error = runner.run(ops)
+    assert error is None, (ops[:steps + 1], error)
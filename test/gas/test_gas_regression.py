@@ -0,0 +1,37 @@
+import pytest
+from uniswap import gas
+from uniswap.deploy import FACTORIES, build_world
+
+def test_gas_regression(world, request):
+    results = gas.measure(world)
+    if request.config.getoption('--update-gas-baseline'):
+        gas.write_baseline(results, world.variant)
+        pytest.skip('{} gas baseline recorded in {}'.format(world.variant, gas.BASELINE))
+    baseline = gas.load_baseline(world.variant)
+    assert baseline is not None, 'no {} gas baseline in {}, record it with --update-gas-baseline'.format(
+        world.variant, gas.BASELINE)
+    regressions, improvements, new = gas.compare(results, baseline, request.config.getoption('--gas-threshold'))
+    assert not new, 'scenarios missing from the baseline, rerun with --update-gas-baseline: {}'.format(new)
+    assert not regressions, '\n'.join('{}: {} -> {}'.format(*r) for r in regressions)
+
+def test_compare():
+    baseline = {'a': 100000, 'b': 50000, 'c': 20000}
+    results = {'a': 101000, 'b': 52000, 'c': 19000, 'd': 1}
+    regressions, improvements, new = gas.compare(results, baseline, threshold=0.02)
+    assert regressions == [('b', 50000, 52000)]
+    assert improvements == [('c', 20000, 19000)]
+    assert new == ['d']
+
+def test_optimized_exchange_gas():
+    swaps = ('ethToTokenSwap', 'tokenToEthSwap', 'tokenToTokenSwap', 'investLiquidity', 'divestLiquidity')
+    original, optimized = [gas.measure(build_world(factory=factory), swaps) for factory in FACTORIES]
+    assert set(original) == set(optimized)
+    for scenario in original:
+        if scenario.split('/')[0] in swaps:
+            assert optimized[scenario] < original[scenario], scenario
+
+def test_batch_gas_per_payment(world):
+    results = gas.measure_batches(world)
+    for function in ('ethToTokenBatchPayment', 'tokenToEthBatchPayment'):
+        per_payment = [results['{}/pool=medium/legs={}'.format(function, size)] for size in gas.BATCH_SIZES]
+        assert per_payment == sorted(per_payment, reverse=True), (function, per_payment)
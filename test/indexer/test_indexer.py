@@ -0,0 +1,55 @@
+from ethereum.tools import tester
+from ethereum import utils
+from uniswap.deploy import build_world
+from uniswap.indexer import ChainSource, Indexer, PoolState, Table
+
+def test_table(tmpdir):
+    columns = (('block', 8), ('address', 20), ('value', 32))
+    table = Table(str(tmpdir), columns)
+    for block in (1, 1, 3, 4, 4, 4, 9):
+        table.append(block, bytes([block]) * 20, 2**256 - block)
+    assert len(table) == 7
+    assert [table.bisect(b) for b in (0, 1, 3, 4, 8, 9)] == [0, 2, 3, 6, 6, 7]
+    assert table.read(2, 4) == [(3, b'\x03' * 20, 2**256 - 3), (4, b'\x04' * 20, 2**256 - 4)]
+    assert list(table.scan(rows=2)) == table.read()
+    # Reopened tables see the flushed rows, truncate cuts every column
+    table.truncate(3)
+    table = Table(str(tmpdir), columns)
+    assert len(table) == 3 and table.read()[-1][0] == 3
+
+def test_indexer_history_resume_and_reorg(tmpdir):
+    world = build_world()
+    chain = world.chain
+    uni_token, uni_exchange = world.tokens[0], world.exchanges[0]
+    uni_token.mint(tester.a1, 10*10**18)
+    uni_token.approve(uni_exchange.address, 10*10**18, sender=tester.k1)
+    uni_exchange.initializeExchange(10*10**18, value=5*10**18, sender=tester.k1)
+    chain.mine()
+    uni_exchange.ethToTokenSwap(1, chain.head_state.timestamp + 300, value=1*10**18, sender=tester.k2)
+    chain.mine()
+    initialized, swapped = chain.chain.head.number - 1, chain.chain.head.number
+    indexer = Indexer(str(tmpdir), ChainSource(chain), [world.factory.address], batch_blocks=2)
+    assert indexer.run() == swapped
+    assert set(indexer.exchanges) == set(utils.normalize_address(e.address) for e in world.exchanges)
+    assert indexer.state_at(uni_exchange.address, initialized - 1) == PoolState(0, 0, 0, 0, 0)
+    assert indexer.state_at(uni_exchange.address, initialized) == PoolState(initialized, 5*10**18, 10*10**18, 50*10**36, 1000)
+    assert indexer.state_at(uni_exchange.address, swapped + 10) == PoolState(
+        swapped, 6*10**18, 8336112037345781927, 50016672224074691562000000000000000000, 1000)
+    names = [e.name for e in indexer.iter_events()]
+    assert names == ['ExchangeLaunch', 'ExchangeLaunch', 'Transfer', 'EthToTokenPurchase', 'Transfer']
+    # Rows appended after the last checkpoint are dropped when the index is reopened
+    indexer.events.append(*indexer.events.read(0, 1)[0])
+    indexer.events.flush()
+    resumed = Indexer(str(tmpdir), ChainSource(chain), [world.factory.address])
+    assert len(resumed.events) == 5
+    # A longer fork replacing the swap block rewinds the index to the common ancestor
+    chain.change_head(chain.chain.get_block_by_number(initialized).header.hash)
+    uni_token.mint(tester.a1, 2*10**18)
+    uni_token.approve(uni_exchange.address, 2*10**18, sender=tester.k1)
+    uni_exchange.tokenToEthSwap(2*10**18, 1, chain.head_state.timestamp + 300, sender=tester.k1)
+    chain.mine(2)
+    assert resumed.run() == swapped + 1
+    assert [e.name for e in resumed.iter_events(swapped)] == ['TokenToEthPurchase', 'Transfer']
+    assert resumed.state_at(uni_exchange.address, swapped).eth_pool == 4168056018672890963
+    assert list(resumed.history(uni_exchange.address)) == [
+        resumed.state_at(uni_exchange.address, initialized), resumed.state_at(uni_exchange.address, swapped)]
@@ -0,0 +1,48 @@
+from uniswap.lens import LensClient, columns, deploy_lens
+
+def test_columns(utils):
+    snapshot = columns([1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12])
+    assert snapshot.tokens == (utils.int_to_addr(1), utils.int_to_addr(7))
+    assert snapshot.exchanges == (utils.int_to_addr(2), utils.int_to_addr(8))
+    assert snapshot.total_shares == (6, 12)
+
+class ListLens(object):
+    """ getExchangeStates of UniswapLens over a list of rows, clamped the same way. """
+    def __init__(self, rows):
+        self.rows = rows
+    def getExchangeStates(self, factory, start, count, startgas=None):
+        return len(self.rows), [x for row in self.rows[start:start + count] for x in row]
+
+def test_snapshot_across_pages(utils):
+    rows = [[i, 100 + i, 10 * i, 20 * i, 200 * i * i, 1000] for i in range(1, 6)]
+    client = LensClient(ListLens(rows), b'\x00' * 20, page_size=2)
+    snapshot = client.snapshot()
+    # 2 + 2 + 1 rows
+    assert client.calls == 3
+    assert snapshot == columns([x for row in rows for x in row])
+    assert snapshot.tokens == tuple(utils.int_to_addr(i) for i in range(1, 6))
+    assert snapshot.eth_pool == (10, 20, 30, 40, 50)
+    assert client.page(4) == (5, rows[4])
+    assert client.page(5) == (5, [])
+def test_lens_snapshot(t, utils, uni_token, swap_token, uniswap_factory, uni_token_exchange, swap_token_exchange):
+    t.s.mine()
+    uni_token.mint(t.a1, 10*10**18)
+    uni_token.approve(uni_token_exchange.address, 10*10**18, sender=t.k1)
+    uni_token_exchange.initializeExchange(10*10**18, value=5*10**18, sender=t.k1)
+    lens = deploy_lens(t.s)
+    # One call per page, the first page also returns the exchange count
+    client = LensClient(lens, uniswap_factory.address, page_size=1)
+    snapshot = client.snapshot()
+    assert client.calls == 2
+    assert snapshot.tokens == (uni_token.address, swap_token.address)
+    # exchange contracts come from launchExchange, which returns a 0x-prefixed address
+    assert snapshot.exchanges == (utils.normalize_address(uni_token_exchange.address), utils.normalize_address(swap_token_exchange.address))
+    assert snapshot.eth_pool == (5*10**18, 0)
+    assert snapshot.token_pool == (10*10**18, 0)
+    assert snapshot.invariant == (50*10**36, 0)
+    assert snapshot.total_shares == (1000, 0)
+    client = LensClient(lens, uniswap_factory.address)
+    assert client.snapshot() == snapshot
+    assert client.calls == 1
+    # Pages past the end are empty
+    assert client.page(2) == (2, [])
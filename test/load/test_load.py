@@ -0,0 +1,30 @@
+import io
+import pytest
+from uniswap import load
+from uniswap.deploy import TOKENS
+
+def test_percentile_and_mix():
+    assert load.percentile(list(range(1, 101)), 50) == 50
+    assert load.percentile(list(range(1, 101)), 99) == 99
+    assert load.percentile([7], 90) == 7
+    assert load.percentile([], 50) is None
+    assert load.parse_mix('ethToTokenSwap=3,divestLiquidity') == {'ethToTokenSwap': 3.0, 'divestLiquidity': 1.0}
+    with pytest.raises(ValueError):
+        load.parse_mix('ethToTokenSwap=3,transfer=1')
+    assert load.generated_tokens(2) == TOKENS
+    assert len(load.generated_tokens(5)) == 5
+
+def test_load_run():
+    generator = load.LoadGenerator(exchanges=3, accounts=4, per_block=5)
+    generator.setup()
+    report = generator.run(txs=60)
+    assert report['txs'] == 60
+    assert report['blocks'] >= 12
+    swaps = ('ethToTokenSwap', 'tokenToEthSwap', 'tokenToTokenSwap', 'investLiquidity')
+    assert sum(report['calls'][name]['count'] for name in load.MIX) == 60
+    # every swap and investment is funded and approved, only divesting without shares may revert
+    assert all(report['calls'][name]['failed'] == 0 for name in swaps)
+    assert report['calls']['mine']['count'] == report['blocks']
+    out = io.StringIO()
+    load.summary(report, out)
+    assert 'tx/s' in out.getvalue()
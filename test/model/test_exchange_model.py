@@ -0,0 +1,109 @@
+import pytest
+from uniswap.model import ExchangeState, TransactionFailed, token_to_token, token_to_token_quotes
+
+PROVIDER = 'provider'
+
+def initialized_exchange(eth=5*10**18, tokens=10*10**18):
+    exchange = ExchangeState()
+    exchange.initialize(PROVIDER, eth, tokens)
+    return exchange
+
+def test_eth_to_token():
+    exchange = initialized_exchange()
+    assert exchange.eth_to_token(1*10**18) == 1663887962654218073
+    assert exchange.eth_pool == 6*10**18
+    assert exchange.token_pool == 8336112037345781927
+    assert exchange.invariant == 50016672224074691562000000000000000000
+    # Min tokens = 0
+    with pytest.raises(TransactionFailed):
+        exchange.eth_to_token(1*10**18, 0)
+    # Purchased tokens < min tokens
+    state = exchange.pools()
+    with pytest.raises(TransactionFailed):
+        exchange.eth_to_token(1*10**18, 5*10**18)
+    assert exchange.pools() == state
+    # msg.value = 0
+    with pytest.raises(TransactionFailed):
+        exchange.eth_to_token(0)
+
+def test_token_to_eth():
+    exchange = initialized_exchange()
+    assert exchange.token_to_eth(2*10**18) == 831943981327109037
+    assert exchange.token_pool == 12*10**18
+    assert exchange.eth_pool == 4168056018672890963
+    assert exchange.invariant == 50016672224074691556000000000000000000
+
+def test_token_to_token():
+    uni_exchange = initialized_exchange(5*10**18, 10*10**18)
+    swap_exchange = initialized_exchange(5*10**18, 20*10**18)
+    assert token_to_token_quotes(uni_exchange, swap_exchange, [2*10**18, 0]) == [2848165371366673513, None]
+    assert token_to_token(uni_exchange, swap_exchange, 2*10**18) == 2848165371366673513
+    assert uni_exchange.pools() == (4168056018672890963, 12*10**18, 50016672224074691556000000000000000000, 1000)
+    assert swap_exchange.pools() == (5831943981327109037, 17151834628633326487, 100028538731176018770023024800269163019, 1000)
+    # Purchased tokens < min tokens, neither exchange changes
+    uni_state, swap_state = uni_exchange.copy(), swap_exchange.copy()
+    with pytest.raises(TransactionFailed):
+        token_to_token(uni_exchange, swap_exchange, 2*10**18, 5*10**18)
+    assert uni_exchange == uni_state and swap_exchange == swap_state
+    # Same exchange on both sides
+    with pytest.raises(TransactionFailed):
+        token_to_token(uni_exchange, uni_exchange, 2*10**18)
+
+def test_batched_quotes_match_single_swaps():
+    exchange = initialized_exchange()
+    amounts = [0, 1, 499, 500, 10**15, 10**18, 7*10**19, 2**255]
+    eth_quotes = exchange.eth_to_token_quotes(amounts)
+    token_quotes = exchange.token_to_eth_quotes(amounts)
+    for amount, eth_quote, token_quote in zip(amounts, eth_quotes, token_quotes):
+        for quote, swap in ((eth_quote, 'eth_to_token'), (token_quote, 'token_to_eth')):
+            trial = exchange.copy()
+            try:
+                assert getattr(trial, swap)(amount) == quote
+            except TransactionFailed:
+                assert quote is None
+
+def test_invest_divest():
+    exchange = initialized_exchange()
+    assert exchange.invest('a2', 15*10**18) == (3000, 30*10**18)
+    assert exchange.pools() == (20*10**18, 40*10**18, 40*10**18*20*10**18, 4000)
+    assert exchange.divest('a2', 1000, 1, 1) == (5*10**18, 10*10**18)
+    assert exchange.pools() == (15*10**18, 30*10**18, 30*10**18*15*10**18, 3000)
+    exchange.divest(PROVIDER, 1000, 1, 1)
+    # Not enough shares
+    with pytest.raises(TransactionFailed):
+        exchange.divest('a2', 3000)
+    # Shares cannnot be zero
+    with pytest.raises(TransactionFailed):
+        exchange.divest('a2', 0)
+    exchange.divest('a2', 2000, 1, 1)
+    assert exchange.total_shares == 0
+    assert exchange.invariant == 0
+    # Uninitialized exchange rejects swaps
+    with pytest.raises(TransactionFailed):
+        exchange.eth_to_token(10**18)
+
+def test_initialize_limits():
+    with pytest.raises(TransactionFailed):
+        initialized_exchange(9999, 10*10**18)
+    with pytest.raises(TransactionFailed):
+        initialized_exchange(5*10**18 + 1, 10*10**18)
+    exchange = initialized_exchange()
+    with pytest.raises(TransactionFailed):
+        exchange.initialize(PROVIDER, 5*10**18, 10*10**18)
+
+def test_batch_payments_match_sequential():
+    batched, sequential = initialized_exchange(), initialized_exchange()
+    amounts = [10**17, 3*10**17, 10**15, 2*10**18]
+    assert batched.eth_to_token_batch(amounts) == [sequential.eth_to_token(x) for x in amounts]
+    assert batched == sequential
+    assert batched.token_to_eth_batch(amounts) == [sequential.token_to_eth(x) for x in amounts]
+    assert batched == sequential
+    # A zero leg or an aggregate minimum that is not met reverts the whole batch
+    state = batched.pools()
+    with pytest.raises(TransactionFailed):
+        batched.eth_to_token_batch([10**17, 0])
+    with pytest.raises(TransactionFailed):
+        batched.token_to_eth_batch(amounts, 10**19)
+    with pytest.raises(TransactionFailed):
+        batched.token_to_eth_batch([])
+    assert batched.pools() == state
@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from ethereum.tools import tester
+from ethereum import utils
+from uniswap.deploy import ALLOC, World, deploy_runtime
+from uniswap.monitor import PoolMonitor, RpcClient, selector
+from uniswap.node import Node, start
+
+def run(loop, coroutine):
+    return loop.run_until_complete(coroutine)
+
+def test_monitor_publishes_changed_pools():
+    chain = tester.Chain()
+    # any call returns slot 0 for every getter, a call with value stores the value in slot 0
+    pools = [deploy_runtime(chain, bytes.fromhex('34600f576000546000526020' + '6000f35b3460005500')) for _ in range(20)]
+    server = start(Node(chain))
+    loop = asyncio.new_event_loop()
+    client = RpcClient(server.url, connections=4)
+    monitor = PoolMonitor(client, exchanges={pool: b'\x01' * 20 for pool in pools}, batch_size=15, queue_size=10)
+    try:
+        async def poll_and_consume(count):
+            return (await asyncio.gather(monitor.poll(), *[monitor.next_update() for _ in range(count)]))[1:]
+        # the first poll publishes every pool, at most ten at a time as the consumer drains the queue
+        updates = run(loop, poll_and_consume(20))
+        assert sorted(u.exchange for u in updates) == sorted('0x' + utils.encode_hex(p) for p in pools)
+        assert {(u.eth_pool, u.token_pool, u.total_shares) for u in updates} == {(0, 0, 0)}
+        requests = client.requests
+        # nothing is read while the head does not move
+        assert run(loop, monitor.poll()) == 0 and client.requests == requests + 1
+        chain.tx(to=pools[7], value=12345)
+        chain.mine()
+        assert run(loop, monitor.poll()) == 1
+        update = run(loop, monitor.next_update())
+        assert (update.exchange, update.eth_pool, update.total_shares) == ('0x' + utils.encode_hex(pools[7]), 12345, 12345)
+        # the head twice, then 60 getters in batches of 15 over the kept-alive connections
+        assert client.requests == requests + 2 + 4
+        metrics = monitor.metrics()
+        assert metrics['polls'] == 2 and metrics['updates'] == 21 and metrics['queued'] == 0
+        assert metrics['lag_ms']['max'] is not None
+    finally:
+        client.close()
+        loop.close()
+        server.shutdown()
+        server.server_close()
+
+def test_monitor_discovers_exchanges(t, world, uni_token, uni_token_exchange):
+    server = start(Node(world.chain))
+    loop = asyncio.new_event_loop()
+    client = RpcClient(server.url)
+    monitor = PoolMonitor(client, [world.factory.address])
+    try:
+        run(loop, monitor.poll())
+        assert sorted(monitor.exchanges) == sorted('0x' + utils.encode_hex(utils.normalize_address(e.address))
+                                                   for e in world.exchanges)
+        uni_token.mint(t.a1, 10*10**18)
+        uni_token.approve(uni_token_exchange.address, 10*10**18, sender=t.k1)
+        uni_token_exchange.initializeExchange(10*10**18, value=5*10**18, sender=t.k1)
+        world.chain.mine()
+        assert run(loop, monitor.poll()) == 1
+        updates = [run(loop, monitor.next_update()) for _ in range(3)]
+        assert (updates[-1].eth_pool, updates[-1].token_pool, updates[-1].total_shares) == (5*10**18, 10*10**18, 1000)
+    finally:
+        client.close()
+        loop.close()
+        server.shutdown()
+        server.server_close()
+def test_monitor_follows_the_chain_after_a_world_reset():
+    chain = tester.Chain(ALLOC)
+    pool = deploy_runtime(chain, bytes.fromhex('34600f576000546000526020' + '6000f35b3460005500'))
+    world = World(chain, [], None, [], {})
+    world.seal('launched')
+    # a previous test's block, the next test starts from the stage again
+    chain.tx(to=pool, value=5)
+    chain.mine()
+    world.reset('launched')
+    server = start(Node(chain))
+    loop = asyncio.new_event_loop()
+    client = RpcClient(server.url)
+    monitor = PoolMonitor(client, exchanges={pool: b'\x01' * 20})
+    try:
+        assert run(loop, monitor.poll()) == 1 and run(loop, monitor.next_update()).eth_pool == 0
+        chain.tx(to=pool, value=7)
+        chain.mine()
+        assert run(loop, monitor.poll()) == 1 and run(loop, monitor.next_update()).eth_pool == 7
+    finally:
+        client.close()
+        loop.close()
+        server.shutdown()
+        server.server_close()
+def test_discover_keeps_listings_of_a_failed_lookup():
+    factory, token, exchange = b'\xfa' * 20, b'\x70' * 20, b'\xee' * 20
+    class Client(object):
+        lookups = 0
+        async def batch(self, calls):
+            data = calls[0][1][0]['data']
+            if data.startswith(selector('tokenToExchangeLookup(address)')):
+                self.lookups += 1
+                if self.lookups == 1:
+                    raise IOError('eth_call failed')
+            answers = {selector('getExchangeCount()'): 1,
+                       selector('tokenList(uint256)'): utils.big_endian_to_int(token)}
+            return ['0x{:064x}'.format(answers.get(data[:10], utils.big_endian_to_int(exchange))) for _ in calls]
+    monitor = PoolMonitor(Client(), [factory])
+    loop = asyncio.new_event_loop()
+    try:
+        with pytest.raises(IOError):
+            run(loop, monitor.discover())
+        assert monitor.listed == {'0x' + utils.encode_hex(factory): 0} and monitor.exchanges == {}
+        assert run(loop, monitor.discover()) == 1
+        assert monitor.exchanges == {'0x' + utils.encode_hex(exchange): '0x' + utils.encode_hex(token)}
+        assert run(loop, monitor.discover()) == 0
+    finally:
+        loop.close()
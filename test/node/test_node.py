@@ -0,0 +1,67 @@
+import json
+from urllib import request
+from ethereum.tools import tester
+from ethereum import utils
+from uniswap.deploy import deploy_runtime
+from uniswap.indexer import ChainSource, RpcSource
+from uniswap.node import Node, bench, data, start
+
+TOPIC = 0xfeed
+
+def post(url, body):
+    req = request.Request(url, json.dumps(body).encode(), {'Content-Type': 'application/json'})
+    with request.urlopen(req) as response:
+        return json.loads(response.read().decode())
+
+def rpc(url, method, *params):
+    return post(url, {'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params})
+
+def test_node_serves_calls_transactions_and_logs():
+    chain = tester.Chain()
+    # returns the number stored in slot 0
+    reader = deploy_runtime(chain, bytes.fromhex('60005460005260206000f3'))
+    # stores CALLVALUE and logs it under TOPIC, reverts without value
+    logger = deploy_runtime(chain, bytes.fromhex('34600857600080fd5b3460005534600052') +
+                            bytes.fromhex('61{:04x}60206000a100'.format(TOPIC)))
+    node = Node(chain)
+    server = start(node)
+    try:
+        url = server.url
+        replies = post(url, [
+            {'jsonrpc': '2.0', 'id': 1, 'method': 'eth_blockNumber'},
+            {'jsonrpc': '2.0', 'id': 2, 'method': 'eth_call', 'params': [{'to': data(reader)}, 'latest']},
+            {'jsonrpc': '2.0', 'id': 3, 'method': 'eth_nothing'},
+        ])
+        assert [r['id'] for r in replies] == [1, 2, 3]
+        assert int(replies[0]['result'], 16) == chain.chain.head.number
+        assert int(replies[1]['result'], 16) == 0
+        assert replies[2]['error']['code'] == -32601
+        assert post(url, [])['error']['code'] == -32600
+        # repeated calls against a mined block come from the cache
+        rpc(url, 'eth_call', {'to': data(reader)}, 'latest')
+        assert node.cache_hits == 1
+        tx_hash = rpc(url, 'eth_sendTransaction', {'from': data(tester.a1), 'to': data(logger), 'value': '0x2a'})['result']
+        receipt = rpc(url, 'eth_getTransactionReceipt', tx_hash)['result']
+        assert receipt['status'] == '0x1' and receipt['blockNumber'] == hex(chain.chain.head.number)
+        assert receipt['logs'][0]['topics'] == ['0x{:064x}'.format(TOPIC)]
+        failed = rpc(url, 'eth_sendTransaction', {'from': data(tester.a1), 'to': data(logger), 'gas': '0x186a0'})
+        assert rpc(url, 'eth_getTransactionReceipt', failed['result'])['result']['status'] == '0x0'
+        logs = rpc(url, 'eth_getLogs', {'fromBlock': '0x0', 'toBlock': 'latest', 'address': data(logger),
+                                        'topics': [hex(TOPIC)]})['result']
+        assert [log['transactionHash'] for log in logs] == [tx_hash]
+        assert logs[0]['data'] == receipt['logs'][0]['data'] == '0x' + '00' * 31 + '2a'
+        assert rpc(url, 'eth_getLogs', {'fromBlock': '0x0', 'topics': [hex(TOPIC + 1)]})['result'] == []
+        # the indexer reads the same blocks and logs over JSON-RPC as from the chain
+        source, local = RpcSource(url), ChainSource(chain)
+        assert source.head() == local.head()
+        for number in range(1, local.head() + 1):
+            assert source.block_hash(number) == local.block_hash(number)
+            assert source.logs(number) == local.logs(number)
+        gas = int(rpc(url, 'eth_estimateGas', {'from': data(tester.a2), 'to': data(logger), 'value': '0x1'})['result'], 16)
+        assert 21000 < gas < 50000
+        report = bench(url, [{'method': 'eth_call', 'params': [{'to': data(reader)}, 'latest']},
+                             {'method': 'eth_getBlockByNumber', 'params': ['latest', True]}], 200, clients=4, batch=5)
+        assert report['errors'] == 0 and report['requests'] == 200 and report['http_requests'] == 40
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,79 @@
+import random
+import time
+from ethereum import utils
+from uniswap import model
+from uniswap.indexer import ChainSource, Event, Indexer
+from uniswap.positions import Portfolio
+
+EXCHANGE, TOKEN = b'\xee' * 20, b'\x70' * 20
+
+def test_revalue_matches_divest():
+    rng = random.Random(5)
+    state, portfolio = model.ExchangeState(), Portfolio()
+    providers = [utils.int_to_addr(i + 1) for i in range(20)]
+    state.initialize(providers[0], 5*10**18, 10*10**18)
+    portfolio.invest(EXCHANGE, providers[0], model.INITIAL_SHARES)
+    for _ in range(300):
+        provider = rng.choice(providers)
+        if rng.random() < 0.3 and state.shares.get(provider):
+            burned = rng.randint(1, state.shares[provider])
+            state.divest(provider, burned)
+            portfolio.divest(EXCHANGE, provider, burned)
+        elif rng.random() < 0.5:
+            portfolio.invest(EXCHANGE, provider, state.invest(provider, rng.randint(10**16, 10**18))[0])
+        else:
+            state.eth_to_token(rng.randint(10**15, 10**17))
+    portfolio.set_pools(EXCHANGE, *state.pools())
+    assert portfolio.unattributed() == {}
+    positions = list(portfolio.positions())
+    assert len(positions) == len([s for s in state.shares.values() if s])
+    for position in positions:
+        assert (position.eth, position.tokens) == state.copy().divest(position.provider, position.shares)
+    eth, value = portfolio.totals()[positions[0].provider]
+    assert eth == positions[0].eth and value == eth + positions[0].tokens * state.eth_pool // state.token_pool
+
+def test_initialization_from_transfer():
+    portfolio, provider, trader = Portfolio(), b'\x01' * 20, b'\x02' * 20
+    def event(tx, name, address, *args):
+        return Event(7, tx, 0, name, address, args)
+    portfolio.apply(event(0, 'ExchangeLaunch', b'\xfa' * 20, utils.big_endian_to_int(EXCHANGE),
+                          utils.big_endian_to_int(TOKEN)))
+    # initializeExchange only shows as a Transfer into the exchange, swaps come with their own event
+    portfolio.apply(event(1, 'Transfer', TOKEN, utils.big_endian_to_int(provider), utils.big_endian_to_int(EXCHANGE), 10))
+    portfolio.apply(event(2, 'TokenToEthPurchase', EXCHANGE, utils.big_endian_to_int(trader), 5, 1))
+    portfolio.apply(event(2, 'Transfer', TOKEN, utils.big_endian_to_int(trader), utils.big_endian_to_int(EXCHANGE), 5))
+    portfolio.apply(event(3, 'Investment', EXCHANGE, utils.big_endian_to_int(trader), 30))
+    portfolio.set_pools(EXCHANGE, 1030, 2060, 1030 * 2060, 1030)
+    assert [(p.provider, p.shares, p.eth) for p in portfolio.positions()] == [(provider, 1000, 1000), (trader, 30, 30)]
+    assert portfolio.unattributed() == {}
+
+def test_revalue_many_positions():
+    portfolio = Portfolio()
+    for e in range(10):
+        exchange = utils.int_to_addr(0x1000 + e)
+        for p in range(20000):
+            portfolio.invest(exchange, utils.int_to_addr(p + 1), 1000 + p)
+        portfolio.set_pools(exchange, 10**24, 3 * 10**24, 3 * 10**48, 1000 * 20000 + 20000 * 19999 // 2)
+    started = time.time()
+    valuations = portfolio.revalue()
+    assert time.time() - started < 1
+    assert sum(len(v.eth) for v in valuations.values()) == 200000
+
+def test_portfolio_from_indexer(tmpdir, t, world, uni_token, uni_token_exchange):
+    chain = world.chain
+    for key, account in ((t.k1, t.a1), (t.k2, t.a2)):
+        uni_token.mint(account, 100*10**18)
+        uni_token.approve(uni_token_exchange.address, 100*10**18, sender=key)
+    uni_token_exchange.initializeExchange(10*10**18, value=5*10**18, sender=t.k1)
+    uni_token_exchange.tokenToEthSwap(10**18, 1, chain.head_state.timestamp + 300, sender=t.k2)
+    uni_token_exchange.investLiquidity(1, value=10**18, sender=t.k2)
+    uni_token_exchange.divestLiquidity(50, 1, 1, sender=t.k1)
+    chain.mine()
+    indexer = Indexer(str(tmpdir), ChainSource(chain), [world.factory.address])
+    indexer.run()
+    portfolio = Portfolio.from_indexer(indexer)
+    assert portfolio.unattributed() == {}
+    for provider in (t.a1, t.a2):
+        position, = portfolio.positions(provider)
+        assert position.shares == uni_token_exchange.getShares(provider)
+        assert position.eth == uni_token_exchange.ethPool() // uni_token_exchange.totalShares() * position.shares
@@ -0,0 +1,36 @@
+from ethereum.tools import tester
+from ethereum import utils
+from uniswap import compiler
+from uniswap.deploy import deploy_runtime
+from uniswap.profiler import Profiler, SourceMap, instruction_offsets, parse_srcmap
+
+def test_parse_srcmap():
+    assert parse_srcmap('0:10:0:-;:5;;2:3:1:i;-1:-1:-1:o') == [
+        (0, 10, 0, '-'), (0, 5, 0, '-'), (0, 5, 0, '-'), (2, 3, 1, 'i'), (-1, -1, -1, 'o')]
+    assert instruction_offsets(bytes.fromhex('6001610002007f' + '00' * 32 + '01')) == {0: 0, 2: 1, 5: 2, 6: 3, 39: 4}
+
+def test_source_location():
+    path = 'Exchange/UniswapExchange.sol'
+    with open(compiler.CONTRACTS_DIR + '/' + path, 'rb') as f:
+        offset = f.read().index(b'factory.exchangeToTokenLookup(msg.sender)')
+    # ERC20Interface.sol, SafeMath.sol, UniswapExchange.sol, UniswapFactory.sol
+    source_map = SourceMap(path, {'bin-runtime': '600100', 'srcmap-runtime': '{}:41:2:-;-1:0:-1:-'.format(offset)})
+    assert source_map.location(0) == ('Exchange/UniswapExchange.sol', 225, 'UniswapExchange.tokenToTokenIn')
+    assert source_map.location(2) is None
+    assert source_map.location(1) is None
+
+def test_profiler_accounts_for_all_gas():
+    chain = tester.Chain()
+    store = deploy_runtime(chain, bytes.fromhex('602a60005500'))
+    caller = deploy_runtime(chain, bytes.fromhex('6000' * 5 + '73') + store + bytes.fromhex('5af15000'))
+    with Profiler(source_maps=[]) as profiler:
+        profiler.profile('call', lambda: chain.tx(to=caller, startgas=200000))
+    used = chain.last_gas_used()
+    assert sum(stat.gas for stat in profiler.opcodes.values()) == used
+    assert profiler.opcodes['SSTORE'].gas == 20000
+    assert profiler.opcodes['SSTORE'].count == 1
+    assert profiler.opcodes['PUSH1'].count == 7
+    assert sum(stat.count for stat in profiler.frames.values()) == 2
+    assert sum(int(line.rsplit(' ', 1)[1]) for line in profiler.folded()) == used
+    store_label = '0x' + utils.encode_hex(store)[:8]
+    assert 'call;0x{};{};SSTORE 20000'.format(utils.encode_hex(caller)[:8], store_label) in profiler.folded()
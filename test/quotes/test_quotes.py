@@ -0,0 +1,62 @@
+import random
+from uniswap import model
+from uniswap.indexer import Event
+from uniswap.quotes import MAX_MEMO, Curve, QuoteCache, bench
+
+A, B = b'\x0a' * 20, b'\x0b' * 20
+
+def pool(eth, tokens):
+    state = model.ExchangeState()
+    state.initialize('provider', eth, tokens)
+    return state
+
+def test_curve_is_exact():
+    rng = random.Random(11)
+    for eth, tokens in ((10**15, 2*10**15), (5*10**18, 10*10**18), (10000, 10**30)):
+        state = pool(eth, tokens)
+        state.eth_to_token(eth // 3)
+        sizes = [rng.randint(1, 10**rng.randint(1, 26)) for _ in range(300)] + [0, 1, 499, 500, 501]
+        for direction, quotes in (('eth', state.eth_to_token_quotes), ('token', state.token_to_eth_quotes)):
+            curve = Curve(state.eth_pool, state.token_pool, state.invariant, direction)
+            assert [curve.output(x) for x in sizes] == quotes(sizes)
+            assert [curve.output(x) for x in sizes] == quotes(sizes)
+            for y in [curve.output(x) for x in sizes if curve.output(x)]:
+                x = curve.input_for(y)
+                assert curve.output(x) >= y and (curve.output(x - 1) or 0) < y
+            assert curve.input_for(curve.pool_out + 1) is None
+    # sizes keep being remembered once the memo is full
+    for x in range(1, 3 * MAX_MEMO):
+        curve.output(x)
+    assert 3 * MAX_MEMO - 1 in curve.memo and len(curve.memo) <= MAX_MEMO
+
+def test_cache_lookups_and_invalidation():
+    states = {A: pool(5*10**18, 10*10**18), B: pool(10**18, 3*10**18)}
+    loads = []
+    def loader(exchange):
+        loads.append(exchange)
+        return states[exchange].pools()
+    cache = QuoteCache(loader, max_curves=3)
+    assert cache.token_to_token(A, B, 10**17) == model.token_to_token_quotes(states[A], states[B], [10**17])[0]
+    assert cache.token_to_token(A, A, 10**17) is None
+    for x in (10**15, 10**16, 10**15):
+        assert cache.eth_to_token(A, x) == states[A].eth_to_token_quotes([x])[0]
+    assert (loads, cache.misses, cache.hits) == ([A, B], 3, 0)
+    # a pool back in a state it had before finds its curves
+    cache.invalidate(A)
+    assert cache.eth_to_token(A, 10**15) == states[A].eth_to_token_quotes([10**15])[0]
+    assert (loads, cache.misses, cache.hits) == ([A, B, A], 3, 1)
+    # an exchange event drops the state, the next quote reads it again
+    states[A].eth_to_token(10**18)
+    cache.apply(Event(5, 0, 0, 'EthToTokenPurchase', A, (1, 10**18, 1)))
+    cache.apply(Event(5, 0, 1, 'Transfer', B, (1, 2, 3)))
+    assert cache.eth_to_token(A, 10**15) == states[A].eth_to_token_quotes([10**15])[0]
+    assert cache.token_to_eth(B, 10**15) == states[B].token_to_eth_quotes([10**15])[0]
+    assert loads == [A, B, A, A]
+    # least recently used curves go first
+    assert len(cache.curves) == 3
+    assert (5*10**18, 10*10**18, 50*10**36, 'token') not in cache.curves
+    tokens = states[A].token_pool // 100
+    assert cache.eth_to_token_input(A, tokens) == cache.curve(A, 'eth').input_for(tokens)
+def test_bench_agrees_with_model():
+    report = bench(5000, exchanges=10, sizes=5, event_every=100)
+    assert report['quotes'] == 5000 and report['loads'] >= 10
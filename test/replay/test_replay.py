@@ -0,0 +1,95 @@
+import os
+from ethereum.tools import tester
+from uniswap import model
+from uniswap.deploy import build_world
+from uniswap.indexer import ChainSource, Indexer
+from uniswap.replay import ChainTarget, ModelTarget, Replayer, TradeLog, record, synthetic
+
+def synthetic_log(directory, trades=2000, exchanges=3):
+    log = TradeLog(directory)
+    synthetic(log, trades, exchanges, accounts=20, per_block=10, seed=4)
+    return TradeLog(directory)
+
+def test_log_round_trip(tmpdir):
+    log = TradeLog(str(tmpdir))
+    pool, other, account = log.exchange('0xaa'), log.exchange('0xbb'), log.account('0x01')
+    log.append(3, 'initialize', pool, account, 5*10**18, 10*10**18)
+    log.append(3, 'token_to_token', pool, account, 10**18, target=other)
+    log.append(9, 'divest', pool, account, 10)
+    log.flush()
+    # rows appended after the last flush are not part of the log
+    log.append(10, 'divest', pool, account, 10)
+    log.trades.flush()
+    log = TradeLog(str(tmpdir))
+    assert (log.exchanges, log.accounts, log.last_block()) == (['0xaa', '0xbb'], ['0x01'], 9)
+    assert list(log.blocks()) == [(3, 0, [[0, 0, 0, 0, 5*10**18, 10*10**18], [5, 0, 1, 0, 10**18, 0]]),
+                                  (9, 2, [[2, 0, 0, 0, 10, 0]])]
+
+def test_replay_resumes_and_seeks(tmpdir):
+    log = synthetic_log(str(tmpdir.join('trades')))
+    full = Replayer(log, str(tmpdir.join('full')), ModelTarget(3), checkpoint_blocks=25)
+    last = full.run()
+    assert full.row == len(log) and full.applied + full.reverted == len(log) and full.reverted < len(log) // 10
+    # stopped half way, then resumed by a new replayer from its last checkpoint
+    part = Replayer(log, str(tmpdir.join('part')), ModelTarget(3), checkpoint_blocks=25)
+    part.run(until=last // 2)
+    part = Replayer(log, str(tmpdir.join('part')), ModelTarget(3), checkpoint_blocks=25)
+    assert part.run() == last
+    assert part.series.read() == full.series.read()
+    assert part.target.save() == full.target.save()
+    states = ModelTarget(3)
+    for _, _, trades in log.blocks():
+        for trade in trades:
+            states.apply(*trade)
+    assert [states.pools(i) for i in range(3)] == [full.target.pools(i) for i in range(3)]
+    assert len(os.listdir(str(tmpdir.join('full', 'checkpoints')))) == last // 25 + 2
+    series = full.series.read()
+    for block in (last // 3, 60, last):
+        full.seek(block)
+        for pool in range(3):
+            assert full.target.pools(pool) == list(full.history(pool, end=block))[-1][1:]
+    assert full.series.read() == series
+
+def test_chain_target_matches_model(tmpdir):
+    log = synthetic_log(str(tmpdir.join('trades')), trades=120, exchanges=2)
+    chain = Replayer(log, str(tmpdir.join('chain')), ChainTarget(2), checkpoint_blocks=5)
+    modeled = Replayer(log, str(tmpdir.join('model')), ModelTarget(2), checkpoint_blocks=5)
+    assert chain.run() == modeled.run()
+    assert chain.series.read() == modeled.series.read()
+    assert (chain.applied, chain.reverted) == (modeled.applied, modeled.reverted)
+    chain.seek(4)
+    assert chain.target.pools(0) == list(modeled.history(0, end=4))[-1][1:]
+
+def test_record_from_indexer(tmpdir):
+    world = build_world()
+    chain = world.chain
+    (uni_token, swap_token), (uni_exchange, swap_exchange) = world.tokens, world.exchanges
+    for token, exchange in zip(world.tokens, world.exchanges):
+        for key, account in ((tester.k1, tester.a1), (tester.k2, tester.a2)):
+            token.mint(account, 100*10**18)
+            token.approve(exchange.address, 100*10**18, sender=key)
+        exchange.initializeExchange(10*10**18, value=5*10**18, sender=tester.k1)
+        chain.mine()
+    timeout = chain.head_state.timestamp + 300
+    uni_exchange.ethToTokenSwap(1, timeout, value=10**17, sender=tester.k2)
+    uni_exchange.tokenToTokenSwap(swap_token.address, 10**18, 1, timeout, sender=tester.k2)
+    swap_exchange.tokenToEthSwap(10**17, 1, timeout, sender=tester.k2)
+    chain.mine()
+    # whole shares, the ETH of an investment is estimated from the share price
+    uni_exchange.investLiquidity(1, value=7 * (uni_exchange.ethPool() // uni_exchange.totalShares()), sender=tester.k2)
+    chain.mine()
+    uni_exchange.divestLiquidity(50, 1, 1, sender=tester.k1)
+    chain.mine()
+    indexer = Indexer(str(tmpdir.join('index')), ChainSource(chain), [world.factory.address])
+    indexer.run()
+    log = TradeLog(str(tmpdir.join('trades')))
+    assert record(indexer, log) == 7
+    kinds = [trade[0] for _, _, trades in log.blocks() for trade in trades]
+    assert kinds == [0, 0, 3, 5, 4, 1, 2]
+    replayer = Replayer(log, str(tmpdir.join('replay')), ModelTarget(2))
+    replayer.run()
+    assert replayer.reverted == 0
+    for exchange in world.exchanges:
+        pool = log.exchanges.index('0x' + exchange.address.hex())
+        assert replayer.target.pools(pool) == (exchange.ethPool(), exchange.tokenPool(), exchange.invariant(),
+                                               exchange.totalShares())
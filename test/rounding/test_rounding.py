@@ -0,0 +1,44 @@
+from fractions import Fraction
+from uniswap import model
+from uniswap.rounding import ATTO, Losses, divest_losses, grid, invest_losses, jittered, swap_losses, sweep
+
+E, T, S = 7 * 10**18 + 12345, 3 * 10**20 + 6789, 1000
+
+def atto(fraction):
+    return int(fraction * ATTO)
+
+def test_swap_losses_are_the_dropped_remainders():
+    losses = Losses()
+    sizes = [1, 499, 501, 10**15 + 1]
+    swap_losses(losses, E, T, sizes, 'eth')
+    fee, out = losses.tallies['eth_to_token', 'fee', 'pool', 'trader'], \
+        losses.tallies['eth_to_token', 'invariant', 'pool', 'trader']
+    assert fee.count == out.count == 4
+    assert fee.total == sum(atto(Fraction(x, model.FEE_RATE) - x // model.FEE_RATE) for x in sizes)
+    state = model.ExchangeState(E, T, E * T, S)
+    exact = [T - Fraction(E * T, E + x - x // model.FEE_RATE) for x in sizes]
+    dropped = [y - e for y, e in zip(state.eth_to_token_quotes(sizes), exact)]
+    assert out.total == sum(atto(d * E / T) for d in dropped)
+    assert fee.worst_at == (E, T, 499)
+
+def test_invest_and_divest_match_the_model():
+    losses = Losses()
+    invest_losses(losses, E, T, S, [10**16 + 1])
+    state = model.ExchangeState(E, T, E * T, S, {'a': S})
+    shares, tokens = state.invest('b', 10**16 + 1)
+    assert losses.tallies['invest', 'shares', 'investor', 'pool'].total == \
+        (10**16 + 1 - shares * (E // S)) * ATTO
+    assert losses.tallies['invest', 'tokens_per_share', 'pool', 'investor'].total == \
+        atto(Fraction(shares * T, S) - tokens) * E // T
+    divest_losses(losses, E, T, S, [1, S])
+    eth, tokens = model.ExchangeState(E, T, E * T, S, {'a': S}).divest('a', S)
+    stranded = losses.tallies['divest', 'eth_per_share', 'divester', 'stranded']
+    assert stranded.total == (E - eth) * ATTO and stranded.worst_at == (E, T, S, S)
+    assert losses.tallies['divest', 'eth_per_share', 'divester', 'pool'].count == 1
+
+def test_sweep_splits_over_workers():
+    pools, sizes = jittered(grid(4, 10)), grid(0, 12)
+    serial, parallel = sweep(pools, pools, sizes, (1000, 10**4), 1), sweep(pools, pools, sizes, (1000, 10**4), 2)
+    assert serial.operations() == parallel.operations() > 0
+    assert {key: (t.count, t.total, t.worst) for key, t in serial.tallies.items()} == \
+        {key: (t.count, t.total, t.worst) for key, t in parallel.tallies.items()}
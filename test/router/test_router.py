@@ -0,0 +1,58 @@
+import random
+from uniswap.deploy import FACTORIES
+from uniswap.lens import deploy_lens
+from uniswap.router import Book, Router, calls
+
+def test_quote_all_matches_model():
+    rng = random.Random(1)
+    pools = [(i.to_bytes(20, 'big'), rng.randint(10**4, 5*10**18), rng.randint(10**4, 10**24)) for i in range(1, 2001)]
+    pools = [(t, b'x' + t[1:], eth, tokens) for t, eth, tokens in pools]
+    router = Router({'f': Book.from_reserves(pools)})
+    quotes = router.quote_all('f', pools[0][0], 10**20)
+    for token, _, _, _ in rng.sample(pools[1:], 50):
+        assert quotes.get(token) == router.quotes('f', pools[0][0], token, [10**20])[0]
+
+def test_best_split():
+    a, b = b'\x01' * 20, b'\x02' * 20
+    router = Router({
+        'deep': Book.from_reserves([(a, b'x' + a[1:], 5*10**18, 10*10**18), (b, b'x' + b[1:], 5*10**18, 20*10**18)]),
+        'shallow': Book.from_reserves([(a, b'x' + a[1:], 10**18, 2*10**18), (b, b'x' + b[1:], 10**18, 4*10**18)]),
+    })
+    amount = 3*10**18
+    legs = router.best_split(a, b, amount)
+    assert sum(leg.tokens_in for leg in legs) == amount
+    assert [leg.factory for leg in legs] == ['deep', 'shallow']
+    # At least as good as any split in 1% steps
+    best = 0
+    for step in range(101):
+        x = amount * step // 100
+        deep, shallow = router.quotes('deep', a, b, [x])[0] or 0, router.quotes('shallow', a, b, [amount - x])[0] or 0
+        best = max(best, deep + shallow)
+    assert router.quote(a, b, amount) >= best
+    assert router.routes(a, b'\x03' * 20) == []
+    call = calls(legs, b'\x09' * 20, 1000, slippage=0.01)[0]
+    assert call.function == 'tokenToTokenPayment' and call.exchange == b'x' + a[1:]
+    assert call.args == (b, b'\x09' * 20, legs[0].tokens_in, legs[0].tokens_out * 99 // 100 + (legs[0].tokens_out * 99 % 100 > 0), 1000)
+
+def test_split_order_on_chain(t, world, contract_tester, exchange_abi, uni_token_exchange, swap_token_exchange):
+    chain = world.chain
+    factory = contract_tester(FACTORIES[1])
+    exchanges = [uni_token_exchange, swap_token_exchange]
+    for token in world.tokens:
+        chain.mine()
+        exchanges.append(t.ABIContract(chain, exchange_abi, factory.launchExchange(token.address)))
+    for exchange, token, eth, tokens in zip(exchanges, world.tokens * 2, (5, 5, 1, 1), (10, 20, 2, 4)):
+        token.mint(t.a1, tokens * 10**18)
+        token.approve(exchange.address, tokens * 10**18, sender=t.k1)
+        exchange.initializeExchange(tokens * 10**18, value=eth * 10**18, sender=t.k1)
+        chain.mine()
+    router = Router.from_lens(deploy_lens(chain), [world.factory.address, factory.address])
+    uni, swap = world.tokens[0].address, world.tokens[1].address
+    legs = router.best_split(uni, swap, 3*10**18)
+    assert len(legs) == 2
+    world.tokens[0].mint(t.a2, 3*10**18)
+    for call in calls(legs, t.a3, chain.head_state.timestamp + 300):
+        exchange = t.ABIContract(chain, exchange_abi, call.exchange)
+        world.tokens[0].approve(call.exchange, call.args[2], sender=t.k2)
+        getattr(exchange, call.function)(*call.args, sender=t.k2)
+    assert world.tokens[1].balanceOf(t.a3) == sum(leg.tokens_out for leg in legs)
@@ -0,0 +1,43 @@
+import io
+import pytest
+from uniswap import gas, scale
+from uniswap.deploy import FACTORIES
+
+REPORT = {
+    'format': 1, 'variant': 'UniswapFactory', 'bytecode': '00' * 32, 'count': 4, 'genesis_ms': 1.0,
+    'launch': [{'exchanges': 2, 'gas': 1000, 'max_gas': 1010, 'ms': 1.5},
+               {'exchanges': 4, 'gas': 1000, 'max_gas': 1000, 'ms': 1.5}],
+    'lookup': [{'exchanges': 2, 'tokenToExchangeLookup': 30, 'exchangeToTokenLookup': 31,
+                'tokenToExchangeLookup_ms': 0.1, 'exchangeToTokenLookup_ms': 0.1},
+               {'exchanges': 4, 'tokenToExchangeLookup': 30, 'exchangeToTokenLookup': 31,
+                'tokenToExchangeLookup_ms': 0.1, 'exchangeToTokenLookup_ms': 0.1}],
+    'enumerate': {'tokenList': {'calls': 4, 'gas': 40, 'ms': 2.0},
+                  'lens': {'calls': 1, 'exchanges': 4, 'ms': 1.0}},
+    'initialize': {'pools': 2, 'gas': 500, 'setup_gas': 200, 'ms': 3.0},
+}
+
+def test_metrics():
+    results = scale.metrics(REPORT)
+    assert results == {
+        'launchExchange/exchanges=2': 1000, 'launchExchange/exchanges=4': 1000,
+        'tokenToExchangeLookup/exchanges=2': 30, 'tokenToExchangeLookup/exchanges=4': 30,
+        'exchangeToTokenLookup/exchanges=2': 31, 'exchangeToTokenLookup/exchanges=4': 31,
+        'tokenList/exchanges=4': 40, 'initializeExchange/pools=2': 500,
+    }
+    grown = dict(results, **{'launchExchange/exchanges=4': 1100})
+    assert gas.compare(grown, results)[0] == [('launchExchange/exchanges=4', 1000, 1100)]
+    out = io.StringIO()
+    scale.summary(REPORT, out)
+    assert 'initializeExchange: 2 pools' in out.getvalue()
+
+@pytest.mark.parametrize('factory', FACTORIES)
+def test_scale_run(factory):
+    report = scale.run(count=30, step=10, initialize_pools=3, factory=factory, samples=5)
+    assert [row['exchanges'] for row in report['launch']] == [10, 20, 30]
+    assert report['enumerate']['lens']['exchanges'] == 30
+    assert report['initialize']['pools'] == 3
+    # Listing more tokens must not make launches or lookups more expensive
+    first, last = report['launch'][0], report['launch'][-1]
+    assert abs(last['gas'] - first['gas']) <= first['gas'] * 0.01
+    for function in scale.LOOKUPS:
+        assert len(set(row[function] for row in report['lookup'])) == 1
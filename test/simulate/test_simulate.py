@@ -0,0 +1,48 @@
+from ethereum.tools import tester
+from uniswap import model
+from uniswap.deploy import deploy_runtime
+from uniswap.simulate import Simulator, Step
+
+def test_sequences_run_on_forks_of_one_state():
+    chain = tester.Chain()
+    # any call returns slot 0 for every getter, a call with value adds the value to slot 0
+    pool = deploy_runtime(chain, bytes.fromhex('34600f576000546000526020' + '6000f35b3460005401600055' + '00'))
+    reverter = deploy_runtime(chain, bytes.fromhex('600080fd'))
+    head = chain.head_state.trie.root_hash
+    simulator = Simulator(chain.head_state, [pool], [pool], [tester.a1, tester.a2])
+    balance = chain.head_state.get_balance(tester.a1)
+    sequences = [[Step(tester.a1, pool, 10 * i + 10, b''), Step(tester.a2, reverter, 5, b''), Step(tester.a2, pool, 1, b'')]
+                 for i in range(300)]
+    outcomes = simulator.run_all(sequences)
+    for i, outcome in enumerate(outcomes):
+        assert outcome.outputs[1] is None and outcome.outputs[0] == outcome.outputs[2] == b''
+        assert outcome.pools == ((10 * i + 11,) * 4,)
+        assert outcome.balances[0] == (balance - 10 * i - 10, 10 * i + 11)
+        assert outcome.gas[0] > 5000
+    # every sequence started from the same state and the chain was left alone
+    assert chain.head_state.trie.root_hash == head
+    assert simulator.run([]).pools == ((0,) * 4,)
+    # the same outcomes from forked workers
+    assert simulator.run_all(sequences, workers=2, chunk=20) == outcomes
+
+def test_simulation_matches_model(t, world, uni_token, uni_token_exchange):
+    uni_token.mint(t.a1, 100*10**18)
+    uni_token.approve(uni_token_exchange.address, 100*10**18, sender=t.k1)
+    uni_token_exchange.initializeExchange(10*10**18, value=5*10**18, sender=t.k1)
+    world.chain.mine()
+    eth_balance, token_balance = world.chain.head_state.get_balance(t.a1), uni_token.balanceOf(t.a1)
+    simulator = Simulator.from_world(world, [t.a1])
+    timeout = simulator.timestamp() + 300
+    amounts = (10**15, 10**17, 10**18)
+    sequences = [[simulator.step(uni_token_exchange.address, 'ethToTokenSwap', [1, timeout], t.a1, x),
+                  simulator.step(uni_token_exchange.address, 'tokenToEthSwap', [2 * x, 1, timeout], t.a1)]
+                 for x in amounts]
+    outcomes = simulator.run_all(sequences, workers=2, chunk=1)
+    for x, outcome in zip(amounts, outcomes):
+        state = model.ExchangeState()
+        state.initialize(t.a1, 5*10**18, 10*10**18)
+        tokens_out = state.eth_to_token(x)
+        eth_out = state.token_to_eth(2 * x)
+        assert outcome.pools[0] == state.pools()
+        assert outcome.balances[0][:2] == (eth_balance - x + eth_out, token_balance + tokens_out - 2 * x)
+    assert uni_token_exchange.ethPool() == 5*10**18
@@ -0,0 +1,208 @@
+"""
+    Memoized ABI translation shared by the tests, the deploy helpers and the
+    off-chain tools.
+
+    A Codec is built once per ABI (keyed by the sha256 of its canonical JSON)
+    and holds, for every function, the 4 byte selector and an encoder and a
+    decoder closure. Functions whose inputs or outputs are all static
+    elementary types (uint, int, bool, address, bytes1-32) get closures
+    that write and read 32 byte words directly, everything else goes through
+    ethereum.abi. Values that the direct path does not recognise fall back to
+    ethereum.abi.encode_single, so results and errors are those of
+    ContractTranslator, including addresses decoded as 0x-prefixed strings.
+
+    Contract is a tester.ABIContract whose methods use the Codec of its ABI.
+"""
+
+import hashlib
+import json
+import os
+import weakref
+from collections import namedtuple
+from ethereum.tools import tester
+from ethereum.abi import ContractTranslator, decode_abi, decode_single, encode_abi, encode_single, process_type
+
+STATIC_BASES = ('uint', 'int', 'bool', 'address', 'bytes')
+TT256 = 2**256
+
+Function = namedtuple('Function', 'name selector encode decode is_constant')
+
+_abis = {}
+_codecs = {}
+# id of a ContractTranslator -> the Codec built on it, the Codec keeps the translator and the entry alive together
+_translated = weakref.WeakValueDictionary()
+
+
+def abi_hash(abi):
+    return hashlib.sha256(json.dumps(abi, sort_keys=True).encode()).hexdigest()
+
+
+def load_abi(path):
+    """ ABI of a JSON file, parsed once per file modification. Do not mutate the result. """
+    path = os.path.realpath(path)
+    stamp = (path, os.stat(path).st_mtime)
+    if stamp not in _abis:
+        with open(path) as f:
+            _abis[stamp] = json.load(f)
+    return _abis[stamp]
+
+
+def _static(typ):
+    base, sub, dims = process_type(typ)
+    if dims or base not in STATIC_BASES or (base == 'bytes' and not sub):
+        return None
+    return base, sub, dims
+
+
+def _word_encoder(typ):
+    base, sub, dims = typ
+    if base == 'uint':
+        bound = 2**int(sub)
+
+        def encode(value):
+            if type(value) is int and 0 <= value < bound:
+                return value.to_bytes(32, 'big')
+            return encode_single(typ, value)
+    elif base == 'address':
+        def encode(value):
+            if type(value) is bytes and len(value) == 20:
+                return b'\x00' * 12 + value
+            if type(value) is str and len(value) == 42 and value[:2] == '0x':
+                return b'\x00' * 12 + bytes.fromhex(value[2:])
+            return encode_single(typ, value)
+    else:
+        def encode(value):
+            return encode_single(typ, value)
+    return encode
+
+
+def _word_decoder(typ):
+    base, sub, dims = typ
+    if base == 'uint':
+        bound = 2**int(sub)
+        if bound == TT256:
+            return lambda word: int.from_bytes(word, 'big')
+        return lambda word: int.from_bytes(word, 'big') % bound
+    if base == 'address':
+        return lambda word: '0x' + word[12:].hex()
+    if base == 'bool':
+        return lambda word: word != b'\x00' * 32
+    return lambda word: decode_single(typ, word)
+
+
+def _encoder(selector, types):
+    static = [_static(typ) for typ in types]
+    if None in static:
+        return lambda args: selector + encode_abi(types, args)
+    words = [_word_encoder(typ) for typ in static]
+    n = len(words)
+
+    def encode(args):
+        if len(args) != n:
+            return selector + encode_abi(types, args)
+        return selector + b''.join([word(arg) for word, arg in zip(words, args)])
+    return encode
+
+
+def _decoder(types):
+    static = [_static(typ) for typ in types]
+    if None in static:
+        return lambda data: decode_abi(types, data)
+    words = [_word_decoder(typ) for typ in static]
+    size = 32 * len(words)
+
+    def decode(data):
+        if len(data) < size:
+            return decode_abi(types, data)
+        return [word(data[32 * i:32 * i + 32]) for i, word in enumerate(words)]
+    return decode
+
+
+class Codec(object):
+    """ Selectors and encoder/decoder closures of every function of one ABI. """
+
+    def __init__(self, abi):
+        if isinstance(abi, ContractTranslator):
+            self.abi, self.hash, self.translator = None, None, abi
+        else:
+            self.abi, self.hash, self.translator = abi, abi_hash(abi), ContractTranslator(abi)
+        self.functions = {}
+        for name, data in self.translator.function_data.items():
+            selector = data['prefix'].to_bytes(4, 'big')
+            self.functions[name] = Function(name, selector, _encoder(selector, data['encode_types']),
+                                            _decoder(data['decode_types']), data['is_constant'])
+        self.by_selector = {f.selector: f for f in self.functions.values()}
+
+    def _function(self, name):
+        try:
+            return self.functions[name]
+        except KeyError:
+            raise ValueError('Unknown function {}'.format(name))
+
+    def encode(self, name, args):
+        """ Calldata of one call, same bytes as ContractTranslator.encode_function_call. """
+        return self._function(name).encode(args)
+
+    def decode(self, name, data):
+        """ Decoded return values, same values as ContractTranslator.decode_function_result. """
+        return self._function(name).decode(data)
+
+    def encode_many(self, name, rows):
+        """ Calldata of one call per row of arguments. """
+        encode = self._function(name).encode
+        return [encode(args) for args in rows]
+
+    def decode_many(self, name, results):
+        decode = self._function(name).decode
+        return [decode(data) for data in results]
+
+
+def codec(abi):
+    """ The shared Codec of abi, a list of ABI entries, its JSON or a ContractTranslator. """
+    if isinstance(abi, Codec):
+        return abi
+    if isinstance(abi, ContractTranslator):
+        # a translator built elsewhere has no JSON to key on, its Codec lives as long as someone uses it
+        shared = _translated.get(id(abi))
+        if shared is None:
+            shared = _translated[id(abi)] = Codec(abi)
+        return shared
+    entries = json.loads(abi) if isinstance(abi, str) else abi
+    key = abi_hash(entries)
+    if key not in _codecs:
+        shared = _codecs[key] = Codec(entries)
+        _translated[id(shared.translator)] = shared
+    return _codecs[key]
+
+
+def translator(abi):
+    """ The shared ContractTranslator of abi. """
+    return codec(abi).translator
+
+
+class Contract(tester.ABIContract):
+    """ tester.ABIContract encoding calls and decoding results through the shared Codec of its ABI. """
+
+    def __init__(self, _tester, _abi, address):
+        self.codec = _abi if isinstance(_abi, Codec) else codec(_abi)
+        super(Contract, self).__init__(_tester, self.codec.translator, address)
+
+    @staticmethod
+    def method_factory(tx_or_call, function_name):
+        def kall(self, *args, **kwargs):
+            function = self.codec.functions[function_name]
+            result = tx_or_call(
+                sender=kwargs.get('sender', tester.k0),
+                to=self.address,
+                value=kwargs.get('value', 0),
+                data=function.encode(args),
+                startgas=kwargs.get('startgas', tester.STARTGAS),
+                gasprice=kwargs.get('gasprice', tester.GASPRICE)
+            )
+            if result is False:
+                return result
+            if result == b'':
+                return None
+            o = function.decode(result)
+            return o[0] if len(o) == 1 else o
+        return kall
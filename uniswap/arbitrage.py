@@ -0,0 +1,230 @@
+"""
+    Arbitrage scanner over the pools of one or more factories.
+
+    Inside one factory a cycle has to go back through the pools it used on
+    the way out and only pays fees, so price gaps exist between factories
+    listing the same token (e.g. UniswapFactory and UniswapFactoryOptimized)
+    and between a pool and an external reference price. Three kinds of
+    trades are evaluated:
+
+        'eth'        ethToTokenSwap on the cheap factory, tokenToEthSwap on
+                     the expensive one, profit in wei
+        'token'      tokenToTokenSwap A -> B on one factory and B -> A on the
+                     other, profit in A
+        'reference'  a pool trade closed at the reference price, profit in wei
+
+    Candidates are screened on marginal prices, one float per pool kept as
+    columns per factory. A token cycle gains g(A) / g(B) at the margin, with
+    g the price ratio between the two factories, so only the tokens with the
+    largest and the smallest g are paired instead of every pair. Candidates
+    are then sized and valued with uniswap.model, i.e. the exchange's fee and
+    truncation to the wei.
+
+    update() changes one pool. Only the prices of the changed tokens are
+    recomputed and only the cycles going through them are evaluated again,
+    the others are reused from the previous scan.
+"""
+
+import heapq
+import math
+from collections import namedtuple
+from fractions import Fraction
+from uniswap import model
+from uniswap.router import Router
+
+# Marginal gain of one swap after its 1/FEE_RATE fee
+FEE_FACTOR = 1 - 1.0 / model.FEE_RATE
+TOP = 20
+
+Hop = namedtuple('Hop', 'factory exchange function amount_in amount_out')
+Opportunity = namedtuple('Opportunity', 'kind token profit value amount_in hops')
+
+
+def maximize(profit, lo, hi):
+    """ (x, profit(x)) maximizing a concave integer function on [lo, hi], None where it reverts.
+
+    Reverts are only expected for small amounts, below the smallest amount that buys anything.
+    """
+    cache = {}
+
+    def f(x):
+        if x not in cache:
+            value = profit(x)
+            cache[x] = float('-inf') if value is None else value
+        return cache[x]
+
+    while hi - lo > 2:
+        m1 = lo + (hi - lo) // 3
+        m2 = hi - (hi - lo) // 3
+        a, b = f(m1), f(m2)
+        if a == b == float('-inf'):
+            lo = m2
+        elif a < b:
+            lo = m1 + 1
+        elif a > b:
+            hi = m2 - 1
+        else:
+            # a plateau from truncation, the maximum is between the two
+            lo, hi = m1, m2
+    best = max(range(lo, hi + 1), key=f)
+    return best, f(best)
+
+
+def _price(state):
+    """ Marginal ETH per token of a pool, None while it is not initialized. """
+    if state.invariant == 0 or state.total_shares == 0 or state.token_pool == 0:
+        return None
+    return state.eth_pool / state.token_pool
+
+
+def _quiet(operation):
+    try:
+        return operation()
+    except model.TransactionFailed:
+        return None
+
+
+class Scanner(object):
+    """ Profitable cycles across factories and against reference prices. """
+
+    def __init__(self, books, references=None, top=TOP):
+        self.books = books
+        self.references = {token: Fraction(price) for token, price in (references or {}).items()}
+        self.top = top
+        self.factories = sorted(books)
+        self.prices = {factory: {} for factory in self.factories}
+        self.evaluations = 0
+        self._results = {}
+        self._dirty = set()
+        for factory in self.factories:
+            book = self.books[factory]
+            self.prices[factory] = {token: E / T if I and S and T else None for token, E, T, I, S in zip(
+                book.tokens, book.eth_pool, book.token_pool, book.invariant, book.total_shares)}
+
+    @classmethod
+    def from_lens(cls, lens, factories, references=None, page_size=None):
+        return cls(Router.from_lens(lens, factories, page_size).books, references)
+
+    def update(self, factory, token, eth_pool, token_pool, invariant, total_shares):
+        """ New state of one pool, e.g. after one of its events. """
+        self.books[factory].update(token, eth_pool, token_pool, invariant, total_shares)
+        self._dirty.add(token)
+
+    def set_reference(self, token, price):
+        """ External price of token in wei per token unit, None to drop it. """
+        if price is None:
+            self.references.pop(token, None)
+        else:
+            self.references[token] = Fraction(price)
+        self._dirty.add(token)
+
+    def _refresh(self):
+        if not self._dirty:
+            return
+        for factory in self.factories:
+            book = self.books[factory]
+            for token in self._dirty:
+                if token in book.index:
+                    self.prices[factory][token] = _price(book.state(token))
+        self._results = {key: result for key, result in self._results.items()
+                         if not self._dirty.intersection(key[1:3])}
+        self._dirty = set()
+
+    def _evaluate(self, key, evaluate):
+        if key not in self._results:
+            self.evaluations += 1
+            self._results[key] = evaluate()
+        return self._results[key]
+
+    def _exchange(self, factory, token):
+        book = self.books[factory]
+        return book.exchanges[book.index[token]]
+
+    def _eth_cycle(self, token, buy, sell):
+        buy_state, sell_state = self.books[buy].state(token), self.books[sell].state(token)
+
+        def profit(x):
+            tokens = _quiet(lambda: buy_state.eth_to_token_out(x)[0])
+            eth = tokens and _quiet(lambda: sell_state.token_to_eth_out(tokens)[0])
+            return None if eth is None else eth - x
+        x, gain = maximize(profit, 1, buy_state.eth_pool)
+        if gain <= 0:
+            return None
+        tokens = buy_state.eth_to_token_out(x)[0]
+        return Opportunity('eth', token, gain, gain, x, (
+            Hop(buy, self._exchange(buy, token), 'ethToTokenSwap', x, tokens),
+            Hop(sell, self._exchange(sell, token), 'tokenToEthSwap', tokens, x + gain)))
+
+    def _token_cycle(self, a, b, out, back):
+        a_out, b_out = self.books[out].state(a), self.books[out].state(b)
+        a_back, b_back = self.books[back].state(a), self.books[back].state(b)
+
+        def profit(x):
+            bought = model.token_to_token_quotes(a_out, b_out, [x])[0]
+            returned = bought and model.token_to_token_quotes(b_back, a_back, [bought])[0]
+            return None if returned is None else returned - x
+        x, gain = maximize(profit, 1, a_out.token_pool)
+        if gain <= 0:
+            return None
+        bought = model.token_to_token_quotes(a_out, b_out, [x])[0]
+        # valued at the marginal price of A on the factory it is bought back from
+        value = int(gain * self.prices[back][a])
+        return Opportunity('token', a, gain, value, x, (
+            Hop(out, self._exchange(out, a), 'tokenToTokenSwap', x, bought),
+            Hop(back, self._exchange(back, b), 'tokenToTokenSwap', bought, x + gain)))
+
+    def _reference_trade(self, token, factory):
+        state, price = self.books[factory].state(token), self.references[token]
+        pool_price = self.prices[factory].get(token)
+        if pool_price is None:
+            return None
+        exchange = self._exchange(factory, token)
+        if price * FEE_FACTOR > pool_price:
+            # buy from the pool, sell at the reference price
+            def profit(x):
+                tokens = _quiet(lambda: state.eth_to_token_out(x)[0])
+                return None if tokens is None else math.floor(tokens * price) - x
+            x, gain = maximize(profit, 1, state.eth_pool)
+            hop = Hop(factory, exchange, 'ethToTokenSwap', x, _quiet(lambda: state.eth_to_token_out(x)[0]))
+        elif price < pool_price * FEE_FACTOR:
+            # buy at the reference price, sell to the pool
+            def profit(y):
+                eth = _quiet(lambda: state.token_to_eth_out(y)[0])
+                return None if eth is None else eth - math.ceil(y * price)
+            x, gain = maximize(profit, 1, state.token_pool)
+            hop = Hop(factory, exchange, 'tokenToEthSwap', x, _quiet(lambda: state.token_to_eth_out(x)[0]))
+        else:
+            return None
+        if gain <= 0:
+            return None
+        return Opportunity('reference', token, gain, gain, x, (hop,))
+
+    def scan(self, min_value=1):
+        """ Opportunities worth at least min_value wei, most valuable first. """
+        self._refresh()
+        found = []
+        for out in self.factories:
+            for back in self.factories:
+                if out == back:
+                    continue
+                p_out, p_back = self.prices[out], self.prices[back]
+                gaps = {token: p_out[token] / p_back[token] for token in p_out
+                        if p_out[token] and p_back.get(token)}
+                for token, gap in gaps.items():
+                    # buying on back and selling on out gains gap at the margin
+                    if gap * FEE_FACTOR ** 2 > 1:
+                        found.append(self._evaluate(('eth', token, token, back, out),
+                                                    lambda: self._eth_cycle(token, back, out)))
+                high = heapq.nlargest(self.top, gaps.items(), key=lambda item: item[1])
+                low = heapq.nsmallest(self.top, gaps.items(), key=lambda item: item[1])
+                for a, gap_a in high:
+                    for b, gap_b in low:
+                        if a != b and gap_a / gap_b * FEE_FACTOR ** 4 > 1:
+                            found.append(self._evaluate(('token', a, b, out, back),
+                                                        lambda: self._token_cycle(a, b, out, back)))
+        for token in self.references:
+            for factory in self.factories:
+                if token in self.books[factory].index:
+                    found.append(self._evaluate(('reference', token, token, factory),
+                                                lambda: self._reference_trade(token, factory)))
+        return sorted((o for o in found if o is not None and o.value >= min_value), key=lambda o: -o.value)
@@ -0,0 +1,55 @@
+"""
+    Calldata for ethToTokenBatchPayment and tokenToEthBatchPayment.
+
+    Both functions take (address[] recipients, uint256[] amounts, uint256 minOut,
+    uint256 timeout). The ABI layout of that signature is fixed, so the calldata
+    is written word by word instead of going through the generic encoder, which
+    keeps encoding linear and cheap for batches of thousands of payments.
+
+    Every leg of a batch is priced exactly like a single payment executed in
+    order, see UniswapExchange.ethToTokenBatchPayment. minOut bounds the total
+    output of the batch, not each leg.
+"""
+
+from ethereum import utils
+
+ETH_TO_TOKEN = 'ethToTokenBatchPayment'
+TOKEN_TO_ETH = 'tokenToEthBatchPayment'
+SELECTORS = {name: utils.sha3(name + '(address[],uint256[],uint256,uint256)')[:4]
+             for name in (ETH_TO_TOKEN, TOKEN_TO_ETH)}
+# A leg costs roughly 25k-35k gas, this keeps a batch well inside the tester block gas limit
+MAX_LEGS = 100
+BATCH_GAS = 4000000
+MAX_UINT256 = 2**256 - 1
+
+
+def _word(value):
+    if not 0 <= value <= MAX_UINT256:
+        raise ValueError('{} does not fit in uint256'.format(value))
+    return value.to_bytes(32, 'big')
+
+
+def encode_batch(function, recipients, amounts, min_out, timeout):
+    """ Calldata of one batch payment call. """
+    if len(recipients) != len(amounts):
+        raise ValueError('{} recipients but {} amounts'.format(len(recipients), len(amounts)))
+    n = len(recipients)
+    # head: offset of recipients, offset of amounts, minOut, timeout
+    words = [_word(0x80), _word(0x80 + 32 * (n + 1)), _word(min_out), _word(timeout), _word(n)]
+    words.extend(b'\x00' * 12 + utils.normalize_address(r) for r in recipients)
+    words.append(_word(n))
+    words.extend(_word(a) for a in amounts)
+    return SELECTORS[function] + b''.join(words)
+
+
+def chunks(recipients, amounts, size=MAX_LEGS):
+    """ Split one payout into (recipients, amounts) batches of at most size legs. """
+    for i in range(0, len(recipients), size):
+        yield recipients[i:i + size], amounts[i:i + size]
+
+
+def send_batch(chain, exchange, function, recipients, amounts, min_out, timeout, sender, startgas=BATCH_GAS):
+    """ Send one batch payment to exchange (an address) on a tester.Chain. """
+    value = sum(amounts) if function == ETH_TO_TOKEN else 0
+    data = encode_batch(function, recipients, amounts, min_out, timeout)
+    return chain.tx(sender=sender, to=exchange, value=value, data=data, startgas=startgas)
@@ -0,0 +1,220 @@
+"""
+    Content-addressed cache for solc output.
+
+    Artifacts are keyed by the sha256 of the contract source, every file it
+    imports (transitively), the solc binary and the compiler flags, so editing
+    any input produces a new key and the stale artifact is simply never read
+    again. A warm cache never starts solc.
+
+    The checked in ABI of the exchange is solc output as well, regenerate it
+    with the cache rather than editing it by hand:
+
+        python -m uniswap.compiler --abi Exchange/UniswapExchange.sol --out test/ABI/exchangeABI.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from ethereum.tools import _solidity
+from ethereum.utils import decode_hex
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CONTRACTS_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), '..', 'contracts'))
+CACHE_DIR = os.environ.get('UNISWAP_COMPILE_CACHE',
+                           os.path.realpath(os.path.join(CONTRACTS_DIR, '..', '.compile_cache')))
+IMPORT_RE = re.compile(r'^\s*import\s+"([^"]+)"\s*;', re.MULTILINE)
+
+_artifacts = {}
+_solc_ids = {}
+
+
+def get_dirs(path, contracts_dir=CONTRACTS_DIR):
+    sub_dirs = [x[0] for x in os.walk(contracts_dir)]
+    extra_args = ' '.join(['{}={}'.format(d.split('/')[-1], d) for d in sub_dirs])
+    path = '{}/{}'.format(contracts_dir, path)
+    return path, extra_args
+
+
+def source_files(path, contracts_dir=CONTRACTS_DIR):
+    # path plus every file it imports, transitively, in a stable order
+    seen = []
+    pending = [os.path.realpath(path)]
+    while pending:
+        current = pending.pop()
+        if current in seen:
+            continue
+        seen.append(current)
+        with open(current) as f:
+            source = f.read()
+        for imported in IMPORT_RE.findall(source):
+            if imported.startswith('.'):
+                pending.append(os.path.realpath(os.path.join(os.path.dirname(current), imported)))
+            else:
+                # remapped import, e.g. "Exchange/SafeMath.sol"
+                pending.append(os.path.realpath(os.path.join(contracts_dir, imported)))
+    return sorted(seen)
+
+
+def solc_id():
+    # Hash of the solc binary itself, so that no process is started to ask for
+    # its version. Memoized on (path, size, mtime).
+    solc_path = _solidity.get_compiler_path()
+    if solc_path is None:
+        return 'missing'
+    st = os.stat(solc_path)
+    stamp = (solc_path, st.st_size, st.st_mtime)
+    if stamp not in _solc_ids:
+        h = hashlib.sha256()
+        with open(solc_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        _solc_ids[stamp] = h.hexdigest()
+    return _solc_ids[stamp]
+
+
+def cache_key(path, combined='bin,abi', optimize=True, contracts_dir=CONTRACTS_DIR):
+    h = hashlib.sha256()
+    h.update('solc={} combined={} optimize={}\n'.format(solc_id(), combined, optimize).encode())
+    for source in source_files(path, contracts_dir):
+        with open(source, 'rb') as f:
+            contents = f.read()
+        h.update(os.path.relpath(source, contracts_dir).encode() + b'\0')
+        h.update(hashlib.sha256(contents).digest())
+    return h.hexdigest()
+
+
+def _dump(combined):
+    out = {}
+    for name, data in combined.items():
+        out[name] = {k: v for k, v in data.items() if not isinstance(v, bytes)}
+    return out
+
+
+def _load(stored):
+    for data in stored.values():
+        if 'bin_hex' in data:
+            try:
+                data['bin'] = decode_hex(data['bin_hex'])
+            except (TypeError, ValueError):
+                data['bin'] = data['bin_hex']
+    return stored
+
+
+def _read(artifact_path):
+    try:
+        with open(artifact_path) as f:
+            return _load(json.load(f))
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _write(artifact_path, combined):
+    # write to a temp file in the same directory and rename over the target,
+    # readers only ever see complete artifacts
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(artifact_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(_dump(combined), f)
+        os.replace(tmp_path, artifact_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def compile_file(path, combined='bin,abi', optimize=True, contracts_dir=CONTRACTS_DIR, cache_dir=None):
+    """ Drop-in for _solidity.compile_file on a path relative to contracts_dir.
+
+    Returns the parsed --combined-json output for every contract in the file.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    abs_path, extra_args = get_dirs(path, contracts_dir)
+    key = cache_key(abs_path, combined, optimize, contracts_dir)
+    if key in _artifacts:
+        return _artifacts[key]
+    artifact_path = os.path.join(cache_dir, key + '.json')
+    result = _read(artifact_path)
+    if result is None:
+        os.makedirs(cache_dir, exist_ok=True)
+        lock = open(artifact_path + '.lock', 'w')
+        try:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            # another process may have finished the compile while we waited
+            result = _read(artifact_path)
+            if result is None:
+                result = _solidity.compile_file(abs_path, combined=combined, optimize=optimize,
+                                                extra_args=extra_args)
+                _write(artifact_path, result)
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+    _artifacts[key] = result
+    return result
+
+
+def compile_contract(path, combined='bin,abi', optimize=True, contracts_dir=CONTRACTS_DIR, cache_dir=None):
+    """ Artifact of the contract named after the file, e.g. Token/TestToken.sol:TestToken """
+    contract_name = os.path.basename(path)
+    contract_name += ':' + contract_name.split('.')[0]
+    return compile_file(path, combined, optimize, contracts_dir, cache_dir)[contract_name]
+
+
+def contract_paths(contracts_dir=CONTRACTS_DIR):
+    """ Every .sol file under contracts_dir, relative to it. """
+    paths = []
+    for root, _, files in os.walk(contracts_dir):
+        paths.extend(os.path.relpath(os.path.join(root, f), contracts_dir) for f in files if f.endswith('.sol'))
+    return sorted(paths)
+
+
+def compile_all(combined='bin,abi', optimize=True, contracts_dir=CONTRACTS_DIR, cache_dir=None, workers=8):
+    """ Fill the cache for every contract, e.g. once before parallel test workers start.
+
+    solc runs in subprocesses, so threads are enough to compile files in parallel.
+    """
+    paths = contract_paths(contracts_dir)
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(lambda path: compile_file(path, combined, optimize, contracts_dir, cache_dir), paths))
+    return paths
+
+
+def write_abi(path, out, contracts_dir=CONTRACTS_DIR, cache_dir=None):
+    """ Write the ABI of the contract named after path to the file object out, compact like solc --abi. """
+    abi = compile_contract(path, contracts_dir=contracts_dir, cache_dir=cache_dir)['abi']
+    if isinstance(abi, str):
+        abi = json.loads(abi)
+    json.dump(abi, out, sort_keys=True, separators=(',', ':'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fill the compile cache, or write the ABI of one contract')
+    parser.add_argument('--abi', metavar='CONTRACT', help='e.g. Exchange/UniswapExchange.sol')
+    parser.add_argument('--out', help='file the ABI is written to, stdout by default')
+    args = parser.parse_args(argv)
+    if solc_id() == 'missing':
+        sys.stderr.write('solc not found\n')
+        return 1
+    if args.abi is None:
+        paths = compile_all()
+        sys.stdout.write('compiled {} contracts into {}\n'.format(len(paths), CACHE_DIR))
+    elif args.out is None:
+        write_abi(args.abi, sys.stdout)
+    else:
+        with open(args.out, 'w') as f:
+            write_abi(args.abi, f)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+    Deploy TestTokens, UniswapFactory and their exchanges onto a tester.Chain.
+
+    Chain.snapshot()/revert() cannot cross block boundaries, so a World seals
+    each deployment stage in its own block and restores a stage by moving the
+    chain head back onto that block. tester.Chain.change_head() only moves
+    the state transactions run on, so the canonical chain is rewound as well:
+    blocks mined after a reset extend the stage block, and readers of the
+    block index (ChainSource, uniswap.node) see the new blocks, not those of
+    the previous test. Restoring costs one state-root lookup plus one index
+    entry per block dropped, no matter how many contracts the stage holds.
+
+    load_world() keeps the 'deployed' stage on disk, keyed by the bytecode
+    it was built from, and starts later chains from that state instead of
+    deploying again.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from ethereum.tools import tester
+from ethereum.state import State
+from ethereum.utils import decode_hex, encode_hex, privtoaddr
+from uniswap import compiler
+from uniswap.abi import Contract, codec
+from uniswap.compiler import compile_contract
+
+ALLOC = {account: {'balance': 10**30} for account in tester.accounts}
+TOKENS = (('UNI Token', 'UNI', 18), ('SWAP Token', 'SWAP', 18))
+# UniswapFactoryOptimized launches UniswapExchangeOptimized, same ABI and results with less gas
+FACTORIES = ('Exchange/UniswapFactory.sol', 'Exchange/UniswapFactoryOptimized.sol')
+WORLD_FORMAT = 1
+
+
+def deploy_contract(chain, path, args=None, sender=tester.k0):
+    chain.mine()
+    if args:
+        args = [x.address if isinstance(x, tester.ABIContract) else x for x in args]
+    artifact = compile_contract(path)
+    contract_codec = codec(artifact['abi'])
+    code = artifact['bin'] + (contract_codec.translator.encode_constructor_arguments(args) if args else b'')
+    address = chain.tx(sender=sender, to=b'', value=0, data=code)
+    return Contract(chain, contract_codec, address)
+
+
+class World(object):
+    """ Tokens, factory and exchanges deployed once and restorable per stage.
+
+    Stages:
+        'deployed'  tokens and an empty factory
+        'launched'  one exchange per token, uninitialized
+    """
+
+    def __init__(self, chain, tokens, factory, exchanges, blocks, variant='UniswapFactory'):
+        self.chain = chain
+        self.variant = variant
+        self.tokens = tokens
+        self.factory = factory
+        self.exchanges = exchanges
+        self.blocks = blocks
+
+    def seal(self, stage):
+        self.blocks[stage] = self.chain.mine().header.hash
+
+    def reset(self, stage='launched'):
+        rewind(self.chain, self.blocks[stage])
+        self.chain.last_tx = None
+        self.chain.last_sender = None
+
+
+def rewind(chain, blockhash):
+    """ Make blockhash the canonical head of tester.Chain chain, dropping the blocks above it from the index. """
+    canonical = chain.chain
+    number = canonical.get_block(blockhash).number + 1
+    while True:
+        key = b'block:%d' % number
+        if key not in canonical.db:
+            break
+        for tx in canonical.get_block(canonical.db.get(key)).transactions:
+            if b'txindex:' + tx.hash in canonical.db:
+                canonical.db.delete(b'txindex:' + tx.hash)
+        canonical.db.delete(key)
+        number += 1
+    canonical.head_hash = blockhash
+    canonical.db.put(b'head_hash', blockhash)
+    # the next mined block is added to the head, on top of this state
+    canonical.state = canonical.mk_poststate_of_blockhash(blockhash)
+    canonical.state.executing_on_head = True
+    chain.change_head(blockhash)
+
+
+def variant_name(factory):
+    """ Contract name of a factory source path, e.g. 'UniswapFactoryOptimized'. """
+    return factory.split('/')[-1].split('.')[0]
+
+
+def _launch(world, exchange_abi, sender):
+    for token in world.tokens:
+        world.chain.mine()
+        exchange_address = world.factory.launchExchange(token.address, sender=sender)
+        world.exchanges.append(Contract(world.chain, exchange_abi, exchange_address))
+    world.seal('launched')
+    return world
+
+
+def build_world(chain=None, tokens=TOKENS, exchange_abi=None, factory=FACTORIES[0], sender=tester.k0):
+    chain = chain or tester.Chain(ALLOC)
+    if exchange_abi is None:
+        exchange_abi = compile_contract('Exchange/UniswapExchange.sol')['abi']
+    token_contracts = [deploy_contract(chain, 'Token/TestToken.sol', args=list(spec), sender=sender)
+                       for spec in tokens]
+    variant = variant_name(factory)
+    factory = deploy_contract(chain, factory, args=[], sender=sender)
+    world = World(chain, token_contracts, factory, [], {}, variant)
+    world.seal('deployed')
+    return _launch(world, exchange_abi, sender)
+
+
+def deploy_runtime(chain, runtime, sender=tester.k0):
+    """ Deploy raw runtime bytecode behind a 12 byte constructor that CODECOPYs and returns it, return the address. """
+    init = bytes.fromhex('61{:04x}80600c6000396000f3'.format(len(runtime)))
+    address = chain.tx(sender=sender, to=b'', data=init + runtime)
+    chain.mine()
+    return address
+
+
+def world_key(tokens=TOKENS, factory=FACTORIES[0], sender=tester.k0):
+    """ Changes with the bytecode of TestToken and the factory, which embeds its exchange. """
+    h = hashlib.sha256()
+    h.update(json.dumps({
+        'format': WORLD_FORMAT,
+        'tokens': tokens,
+        'factory': factory,
+        'sender': encode_hex(privtoaddr(sender)),
+        'alloc': sorted((encode_hex(a), v['balance']) for a, v in ALLOC.items()),
+    }, sort_keys=True).encode())
+    for path in ('Token/TestToken.sol', factory):
+        h.update(compile_contract(path)['bin'])
+    return h.hexdigest()
+
+
+def save_world(world, path):
+    """ Write the 'deployed' stage of world: full state plus contract addresses.
+
+    Leaves world reset to its 'launched' stage.
+    """
+    world.reset('deployed')
+    data = {
+        'format': WORLD_FORMAT,
+        'variant': world.variant,
+        'tokens': [encode_hex(token.address) for token in world.tokens],
+        'factory': encode_hex(world.factory.address),
+        'state': world.chain.head_state.to_snapshot(),
+    }
+    world.reset('launched')
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def world_file(tokens=TOKENS, factory=FACTORIES[0], sender=tester.k0, cache_dir=None):
+    """ Path of the stored 'deployed' stage, built first if no file matches the current bytecode. """
+    cache_dir = cache_dir or compiler.CACHE_DIR
+    path = os.path.join(cache_dir, 'world-{}.json'.format(world_key(tokens, factory, sender)))
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        save_world(build_world(tokens=tokens, factory=factory, sender=sender), path)
+    return path
+
+
+def load_world(tokens=TOKENS, exchange_abi=None, factory=FACTORIES[0], sender=tester.k0, cache_dir=None):
+    """ World on a new chain whose genesis is the stored 'deployed' stage.
+
+    The exchanges are launched on top of it, one transaction per token.
+    """
+    with open(world_file(tokens, factory, sender, cache_dir)) as f:
+        data = json.load(f)
+    chain = tester.Chain(genesis=State.from_snapshot(data['state'], tester.get_env(None)))
+    if exchange_abi is None:
+        exchange_abi = compile_contract('Exchange/UniswapExchange.sol')['abi']
+    token_abi = compile_contract('Token/TestToken.sol')['abi']
+    world = World(chain, [Contract(chain, token_abi, decode_hex(a)) for a in data['tokens']],
+                  Contract(chain, compile_contract(factory)['abi'], decode_hex(data['factory'])),
+                  [], {'deployed': chain.chain.head.header.hash}, data['variant'])
+    return _launch(world, exchange_abi, sender)
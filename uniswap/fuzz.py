@@ -0,0 +1,312 @@
+"""
+    Differential fuzzer: UniswapExchange on a tester.Chain vs uniswap.model.
+
+    Random sequences of initialize, invest, divest and swap operations run
+    against both implementations. After every step the reverted flag, ethPool,
+    tokenPool, invariant, totalShares, shares and every ETH and token balance
+    must agree. Sequences are spread over a process pool, one chain per
+    worker. Failing sequences are shrunk before they are reported.
+
+    run with:   python -m uniswap.fuzz --sequences 200 --length 50 --workers 8
+"""
+
+import argparse
+import multiprocessing
+import random
+import sys
+import time
+from ethereum.tools import tester
+from uniswap import model
+from uniswap.deploy import FACTORIES, load_world
+
+ACCOUNTS = (1, 2, 3, 4)
+OPS = ('initialize', 'invest', 'divest', 'eth_to_token', 'token_to_eth', 'token_to_token')
+OP_GAS = 400000
+FUNDS = 10**30
+EDGE_AMOUNTS = (0, 1, 499, 500, 501, 9999, 10000, 5*10**18, 5*10**18 + 1)
+
+
+def random_amount(rng):
+    if rng.random() < 0.1:
+        return rng.choice(EDGE_AMOUNTS)
+    return rng.randint(1, 9) * 10**rng.randint(0, 22)
+
+
+def random_min(rng):
+    roll = rng.random()
+    if roll < 0.05:
+        return 0
+    if roll < 0.15:
+        return random_amount(rng)
+    return 1
+
+
+def random_sequence(rng, length):
+    """ A list of (op, exchange, account, amount, a, b) tuples. """
+    ops = [('initialize', 0, 1, 5*10**18, 10*10**18, 0), ('initialize', 1, 2, 5*10**18, 20*10**18, 0)]
+    for _ in range(length):
+        op = rng.choice(OPS)
+        exchange = rng.randint(0, 1)
+        account = rng.choice(ACCOUNTS)
+        if op == 'initialize':
+            ops.append((op, exchange, account, random_amount(rng), random_amount(rng), 0))
+        elif op == 'divest':
+            shares = rng.choice((1, 10, 100, 500, 1000, 3000)) * rng.randint(1, 3)
+            ops.append((op, exchange, account, shares, random_min(rng), random_min(rng)))
+        else:
+            ops.append((op, exchange, account, random_amount(rng), random_min(rng), 0))
+    return ops
+
+
+class ModelWorld(object):
+    """ Two model exchanges plus the ETH and token balances around them. """
+
+    def __init__(self, addresses):
+        self.exchanges = [model.ExchangeState(), model.ExchangeState()]
+        self.addresses = addresses
+        self.eth = {a: FUNDS for a in addresses['accounts']}
+        self.eth.update({a: 0 for a in addresses['exchanges']})
+        self.tokens = [{a: 0 for a in addresses['exchanges']} for _ in addresses['exchanges']]
+        for balances in self.tokens:
+            balances.update({a: FUNDS for a in addresses['accounts']})
+
+    def copy(self):
+        other = ModelWorld.__new__(ModelWorld)
+        other.exchanges = [e.copy() for e in self.exchanges]
+        other.addresses = self.addresses
+        other.eth = dict(self.eth)
+        other.tokens = [dict(b) for b in self.tokens]
+        return other
+
+    def _move_eth(self, src, dst, amount):
+        model.require(self.eth[src] >= amount)
+        self.eth[src] -= amount
+        self.eth[dst] += amount
+
+    def _move_tokens(self, token, src, dst, amount):
+        model.require(self.tokens[token][src] >= amount)
+        self.tokens[token][src] -= amount
+        self.tokens[token][dst] += amount
+
+    def apply(self, op):
+        """ Apply op atomically, return False if it reverts. """
+        trial = self.copy()
+        try:
+            trial._apply(op)
+        except model.TransactionFailed:
+            return False
+        self.__dict__.update(trial.__dict__)
+        return True
+
+    def _apply(self, op):
+        name, ex, account, amount, a, b = op
+        state = self.exchanges[ex]
+        user = self.addresses['accounts'][ACCOUNTS.index(account)]
+        exchange = self.addresses['exchanges'][ex]
+        if name == 'initialize':
+            state.initialize(user, amount, a)
+            self._move_eth(user, exchange, amount)
+            self._move_tokens(ex, user, exchange, a)
+        elif name == 'invest':
+            shares, tokens_required = state.invest(user, amount, a)
+            self._move_eth(user, exchange, amount)
+            self._move_tokens(ex, user, exchange, tokens_required)
+        elif name == 'divest':
+            eth_out, tokens_out = state.divest(user, amount, a, b)
+            self._move_tokens(ex, exchange, user, tokens_out)
+            self._move_eth(exchange, user, eth_out)
+        elif name == 'eth_to_token':
+            self._move_eth(user, exchange, amount)
+            tokens_out = state.eth_to_token(amount, a)
+            self._move_tokens(ex, exchange, user, tokens_out)
+        elif name == 'token_to_eth':
+            eth_out = state.token_to_eth(amount, a)
+            self._move_tokens(ex, user, exchange, amount)
+            self._move_eth(exchange, user, eth_out)
+        elif name == 'token_to_token':
+            other = 1 - ex
+            eth_before = state.eth_pool
+            tokens_out = model.token_to_token(state, self.exchanges[other], amount, a)
+            self._move_tokens(ex, user, exchange, amount)
+            self._move_eth(exchange, self.addresses['exchanges'][other], eth_before - state.eth_pool)
+            self._move_tokens(other, self.addresses['exchanges'][other], user, tokens_out)
+
+
+class ChainRunner(object):
+    """ One deployed world per process, reset to the funded stage per sequence. """
+
+    def __init__(self, factory=FACTORIES[0]):
+        self.world = load_world(factory=factory)
+        chain = self.world.chain
+        for token, exchange in zip(self.world.tokens, self.world.exchanges):
+            for account in ACCOUNTS:
+                token.mint(tester.accounts[account], FUNDS)
+                token.approve(exchange.address, 2**256 - 1, sender=tester.keys[account])
+            chain.mine()
+        self.world.seal('funded')
+        self.addresses = {
+            'accounts': [tester.accounts[a] for a in ACCOUNTS],
+            'exchanges': [e.address for e in self.world.exchanges],
+        }
+
+    def apply(self, op):
+        name, ex, account, amount, a, b = op
+        chain = self.world.chain
+        if chain.head_state.gas_used + OP_GAS > chain.head_state.gas_limit:
+            chain.mine()
+        exchange = self.world.exchanges[ex]
+        key = tester.keys[account]
+        timeout = chain.head_state.timestamp + 10**6
+        kw = dict(sender=key, startgas=OP_GAS)
+        try:
+            if name == 'initialize':
+                exchange.initializeExchange(a, value=amount, **kw)
+            elif name == 'invest':
+                exchange.investLiquidity(a, value=amount, **kw)
+            elif name == 'divest':
+                exchange.divestLiquidity(amount, a, b, **kw)
+            elif name == 'eth_to_token':
+                exchange.ethToTokenSwap(a, timeout, value=amount, **kw)
+            elif name == 'token_to_eth':
+                exchange.tokenToEthSwap(amount, a, timeout, **kw)
+            elif name == 'token_to_token':
+                other = self.world.tokens[1 - ex]
+                exchange.tokenToTokenSwap(other.address, amount, a, timeout, **kw)
+        except tester.TransactionFailed:
+            return False
+        return True
+
+    def observe(self):
+        state = self.world.chain.head_state
+        observed = []
+        for exchange in self.world.exchanges:
+            observed.append((exchange.ethPool(), exchange.tokenPool(), exchange.invariant(), exchange.totalShares(),
+                             [exchange.getShares(a) for a in self.addresses['accounts']]))
+        addresses = self.addresses['accounts'] + self.addresses['exchanges']
+        observed.append([state.get_balance(a) for a in addresses])
+        for token in self.world.tokens:
+            observed.append([token.balanceOf(a) for a in addresses])
+        return observed
+
+    def run(self, ops):
+        """ Return (steps executed, None) or (failing step, description). """
+        self.world.reset('funded')
+        expected = ModelWorld(self.addresses)
+        for step, op in enumerate(ops):
+            succeeded = self.apply(op)
+            modeled = expected.apply(op)
+            if succeeded != modeled:
+                return step, 'chain {} but model {}'.format(
+                    'succeeded' if succeeded else 'reverted', 'succeeded' if modeled else 'reverted')
+            observed = self.observe()
+            wanted = observe_model(expected)
+            if observed != wanted:
+                return step, 'chain state {} != model state {}'.format(observed, wanted)
+        return len(ops), None
+
+
+def observe_model(world):
+    observed = []
+    for state in world.exchanges:
+        observed.append((state.eth_pool, state.token_pool, state.invariant, state.total_shares,
+                         [state.shares.get(a, 0) for a in world.addresses['accounts']]))
+    addresses = world.addresses['accounts'] + world.addresses['exchanges']
+    observed.append([world.eth[a] for a in addresses])
+    for tokens in world.tokens:
+        observed.append([tokens[a] for a in addresses])
+    return observed
+
+
+def shrink(ops, fails):
+    """ Greedy delta debugging: drop chunks of operations, then simplify amounts. """
+    chunk = len(ops) // 2
+    while chunk >= 1:
+        i = 0
+        while i < len(ops):
+            candidate = ops[:i] + ops[i + chunk:]
+            if candidate and fails(candidate):
+                ops = candidate
+            else:
+                i += chunk
+        chunk //= 2
+    for i in range(len(ops)):
+        progress = True
+        while progress:
+            progress = False
+            name, ex, account, amount, a, b = ops[i]
+            for smaller in (0, 1, 10**(len(str(amount)) - 1), amount // 2, amount - amount // 10):
+                if smaller >= amount:
+                    continue
+                candidate = ops[:i] + [(name, ex, account, smaller, a, b)] + ops[i + 1:]
+                if fails(candidate):
+                    ops = candidate
+                    progress = True
+                    break
+    return ops
+
+
+_runner = None
+
+
+def _init_worker(factory=FACTORIES[0]):
+    global _runner
+    _runner = ChainRunner(factory)
+
+
+def run_seed(args):
+    seed, length = args
+    ops = random_sequence(random.Random(seed), length)
+    steps, error = _runner.run(ops)
+    if error is None:
+        return seed, steps, None
+    failing = ops[:steps + 1]
+    shrunk = shrink(failing, lambda candidate: _runner.run(candidate)[1] is not None)
+    return seed, steps + 1, (shrunk, _runner.run(shrunk)[1])
+
+
+def fuzz(sequences, length, workers, seed=0, out=sys.stdout, factory=FACTORIES[0]):
+    tasks = [(seed + i, length) for i in range(sequences)]
+    started = time.time()
+    failures = []
+    operations = 0
+    # worker start-up (deploying the world) is included in the reported rate
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(factory,))
+        results = pool.imap_unordered(run_seed, tasks)
+    else:
+        pool = None
+        _init_worker(factory)
+        results = map(run_seed, tasks)
+    try:
+        for task_seed, steps, failure in results:
+            operations += steps
+            if failure:
+                failures.append((task_seed, failure))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    elapsed = time.time() - started
+    out.write('{} sequences, {} operations in {:.1f}s ({:.1f} ops/s, {} workers)\n'.format(
+        sequences, operations, elapsed, operations / max(elapsed, 1e-9), workers))
+    for task_seed, (ops, error) in failures:
+        out.write('seed {}: {}\n'.format(task_seed, error))
+        for op in ops:
+            out.write('    {}\n'.format(op))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Differential fuzzer: UniswapExchange vs uniswap.model')
+    parser.add_argument('--sequences', type=int, default=100)
+    parser.add_argument('--length', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--factory', default=FACTORIES[0], choices=FACTORIES)
+    args = parser.parse_args(argv)
+    failures = fuzz(args.sequences, args.length, args.workers, args.seed, factory=args.factory)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""
+    Gas benchmarks for every exchange and factory entry point.
+
+    Each scenario starts from a fresh World stage, builds the pools, and
+    measures the full gas (intrinsic included) of one call. Scenarios cover
+    pool sizes, trade sizes and first vs. repeat traders. A first trader
+    writes zero storage slots (token balance, shares) that a repeat trader
+    finds already set, which is where cold vs. warm storage pricing shows
+    up on this chain's fork rules.
+
+    Batch payments are reported separately as gas per payment for growing
+    batch sizes, every leg paying a recipient that holds nothing yet.
+"""
+
+import argparse
+import json
+import os
+import sys
+from ethereum.tools import tester
+from ethereum import utils
+from uniswap import batch
+from uniswap.deploy import FACTORIES, build_world
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+BASELINE = os.path.realpath(os.path.join(os.path.dirname(__file__), '..', 'test', 'gas', 'gas_baseline.json'))
+THRESHOLD = 0.02
+
+POOLS = {
+    'small': (10**15, 2*10**15, 0),
+    'medium': (5*10**18, 10*10**18, 0),
+    'large': (5*10**18, 10*10**18, 495*10**18),     # initialized, then grown with investLiquidity
+}
+TRADES = {'tiny': 10000, 'small': 100, 'large': 10}   # trade = pool // divisor
+TRADERS = ('first', 'repeat')
+BATCH_SIZES = (1, 2, 5, 10, 25, 50, 100)
+PROVIDER, FIRST, REPEAT = 1, 2, 3
+FUNDS = 10**30
+
+
+def setup_pools(world, pool):
+    """ Fund the benchmark accounts and initialize every exchange of world with one of POOLS. """
+    eth, tokens, invest = pool
+    chain = world.chain
+    for token, exchange in zip(world.tokens, world.exchanges):
+        for account in (PROVIDER, FIRST, REPEAT):
+            token.mint(tester.accounts[account], FUNDS)
+            token.approve(exchange.address, FUNDS, sender=tester.keys[account])
+        chain.mine()
+        exchange.initializeExchange(tokens, value=eth, sender=tester.keys[PROVIDER])
+        if invest:
+            exchange.investLiquidity(1, value=invest, sender=tester.keys[PROVIDER])
+        chain.mine()
+
+
+def entry_points(world):
+    """ {name: call(amounts, account)} of every benchmarked entry point of world. """
+    chain = world.chain
+    uni_exchange = world.exchanges[0]
+    swap_token = world.tokens[1]
+
+    def timeout():
+        return chain.head_state.timestamp + 300
+
+    def key(account):
+        return tester.keys[account]
+
+    return {
+        'ethToTokenSwap': lambda x, a: uni_exchange.ethToTokenSwap(
+            1, timeout(), value=x['eth'], sender=key(a)),
+        'ethToTokenPayment': lambda x, a: uni_exchange.ethToTokenPayment(
+            1, timeout(), tester.accounts[a + 4], value=x['eth'], sender=key(a)),
+        'fallback': lambda x, a: chain.tx(
+            to=uni_exchange.address, value=x['eth'], sender=key(a)),
+        'tokenToEthSwap': lambda x, a: uni_exchange.tokenToEthSwap(
+            x['tokens'], 1, timeout(), sender=key(a)),
+        'tokenToEthPayment': lambda x, a: uni_exchange.tokenToEthPayment(
+            x['tokens'], 1, timeout(), tester.accounts[a + 4], sender=key(a)),
+        'tokenToTokenSwap': lambda x, a: uni_exchange.tokenToTokenSwap(
+            swap_token.address, x['tokens'], 1, timeout(), sender=key(a)),
+        'tokenToTokenPayment': lambda x, a: uni_exchange.tokenToTokenPayment(
+            swap_token.address, tester.accounts[a + 4], x['tokens'], 1, timeout(), sender=key(a)),
+        'investLiquidity': lambda x, a: uni_exchange.investLiquidity(
+            1, value=x['eth'], sender=key(a)),
+        'divestLiquidity': lambda x, a: uni_exchange.divestLiquidity(
+            x['shares'], 1, 1, sender=key(a)),
+    }
+
+
+def _gas(chain, call):
+    call()
+    return chain.last_gas_used(with_tx=True)
+
+
+def measure(world=None, names=None):
+    """ Return {scenario: gas used} for every entry point and scenario.
+
+    names restricts the exchange entry points that are measured.
+    """
+    world = world or build_world()
+    chain = world.chain
+    results = {}
+    # launchExchange for the first and the second listing
+    world.reset('deployed')
+    for listing, token in zip(('first', 'second'), world.tokens):
+        chain.mine()
+        results['launchExchange/listing={}'.format(listing)] = _gas(
+            chain, lambda: world.factory.launchExchange(token.address))
+    for pool_name, pool in sorted(POOLS.items()):
+        world.reset('launched')
+        chain.mine()
+        eth, tokens = pool[:2]
+        world.tokens[0].mint(tester.accounts[PROVIDER], tokens)
+        world.tokens[0].approve(world.exchanges[0].address, tokens, sender=tester.keys[PROVIDER])
+        results['initializeExchange/pool={}'.format(pool_name)] = _gas(
+            chain, lambda: world.exchanges[0].initializeExchange(tokens, value=eth, sender=tester.keys[PROVIDER]))
+        for trade_name, divisor in sorted(TRADES.items()):
+            for trader in TRADERS:
+                world.reset('launched')
+                setup_pools(world, pool)
+                exchange = world.exchanges[0]
+                amounts = {
+                    'eth': exchange.ethPool() // divisor,
+                    'tokens': exchange.tokenPool() // divisor,
+                }
+                account = FIRST if trader == 'first' else REPEAT
+                for name, call in sorted(entry_points(world).items()):
+                    if names is not None and name not in names:
+                        continue
+                    snapshot = chain.snapshot()
+                    if name == 'divestLiquidity':
+                        # the trader needs shares to burn, the first divestment is the measured one
+                        exchange.investLiquidity(1, value=amounts['eth'] * 2, sender=tester.keys[account])
+                        amounts['shares'] = exchange.getShares(tester.accounts[account]) // 2
+                    if trader == 'repeat':
+                        call(amounts, account)
+                    scenario = '{}/pool={}/trade={}/trader={}'.format(name, pool_name, trade_name, trader)
+                    results[scenario] = _gas(chain, lambda: call(amounts, account))
+                    chain.revert(snapshot)
+    return results
+
+
+def measure_batches(world=None, sizes=BATCH_SIZES, pool='medium'):
+    """ Return {scenario: gas per payment} of both batch payment functions. """
+    world = world or build_world()
+    chain = world.chain
+    results = {}
+    for size in sizes:
+        recipients = [utils.int_to_addr(0x10000 + i) for i in range(size)]
+        for function in (batch.ETH_TO_TOKEN, batch.TOKEN_TO_ETH):
+            world.reset('launched')
+            setup_pools(world, POOLS[pool])
+            exchange = world.exchanges[0]
+            leg = (exchange.ethPool() if function == batch.ETH_TO_TOKEN else exchange.tokenPool()) // 10000
+            timeout = chain.head_state.timestamp + 300
+            gas = _gas(chain, lambda: batch.send_batch(
+                chain, exchange.address, function, recipients, [leg] * size, 1, timeout, tester.keys[FIRST]))
+            results['{}/pool={}/legs={}'.format(function, pool, size)] = gas // size
+    return results
+
+
+def load_baseline(variant, path=BASELINE):
+    """ Baseline of one factory variant, None if it was never recorded. """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get(variant)
+
+
+def write_baseline(results, variant, path=BASELINE):
+    # variants may be recorded by parallel test workers, the lock keeps both entries
+    with open(path + '.lock', 'w') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        baselines = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                baselines = json.load(f)
+        baselines[variant] = results
+        with open(path, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """ Return (regressions, improvements, new scenarios). """
+    regressions, improvements, new = [], [], []
+    for scenario, gas in sorted(results.items()):
+        if scenario not in baseline:
+            new.append(scenario)
+        elif gas > baseline[scenario] * (1 + threshold):
+            regressions.append((scenario, baseline[scenario], gas))
+        elif gas < baseline[scenario]:
+            improvements.append((scenario, baseline[scenario], gas))
+    return regressions, improvements, new
+
+
+def report(results, baseline, out=sys.stdout):
+    for scenario, gas in sorted(results.items()):
+        base = baseline.get(scenario) if baseline else None
+        change = '' if not base else '{:+.2%}'.format(gas / base - 1)
+        out.write('{:<72} {:>8} {:>8} {:>8}\n'.format(scenario, gas, base or '-', change))
+
+
+def side_by_side(results, other, out=sys.stdout, names=('UniswapExchange', 'Optimized')):
+    out.write('{:<72} {:>8} {:>9} {:>8}\n'.format('scenario', names[0], names[1], 'change'))
+    for scenario in sorted(set(results) & set(other)):
+        out.write('{:<72} {:>8} {:>9} {:>+8.2%}\n'.format(
+            scenario, results[scenario], other[scenario], other[scenario] / results[scenario] - 1))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Gas benchmarks for the exchange entry points')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--factory', default=FACTORIES[0], choices=FACTORIES)
+    parser.add_argument('--update', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--compare-variants', action='store_true',
+                        help='print UniswapExchange and UniswapExchangeOptimized side by side')
+    parser.add_argument('--batches', action='store_true', help='print gas per payment of the batch payments')
+    args = parser.parse_args(argv)
+    if args.batches:
+        for scenario, gas in sorted(measure_batches(build_world(factory=args.factory)).items(),
+                                    key=lambda item: (item[0].split('/')[0], int(item[0].split('=')[-1]))):
+            sys.stdout.write('{:<72} {:>8}\n'.format(scenario, gas))
+        return 0
+    if args.compare_variants:
+        side_by_side(*[measure(build_world(factory=factory)) for factory in FACTORIES])
+        return 0
+    world = build_world(factory=args.factory)
+    results = measure(world)
+    baseline = load_baseline(world.variant, args.baseline)
+    report(results, baseline)
+    if args.update:
+        write_baseline(results, world.variant, args.baseline)
+        return 0
+    if baseline is None:
+        sys.stdout.write('no {} baseline in {}, record one with --update\n'.format(world.variant, args.baseline))
+        return 1
+    regressions = compare(results, baseline, args.threshold)[0]
+    for scenario, base, gas in regressions:
+        sys.stdout.write('REGRESSION {}: {} -> {}\n'.format(scenario, base, gas))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,424 @@
+"""
+    Incremental indexer for factory and exchange events.
+
+    Logs are streamed block by block from a source (a tester.Chain or a
+    JSON-RPC endpoint) and decoded against a topic table built once per
+    process. Rows go to append-only tables with one fixed-width file per
+    column:
+
+        blocks              number, hash of every indexed block
+        events              every ExchangeLaunch, exchange event and token
+                            Transfer to or from an exchange
+        launches            exchange and token of every ExchangeLaunch
+        states/<exchange>   ethPool, tokenPool, invariant and totalShares
+                            after every block that touched the exchange
+
+    Events do not carry enough to recompute the pools (initializeExchange
+    emits nothing of its own, investLiquidity does not log the ETH it took),
+    so the pool getters are read once per touched exchange and block. The
+    state at any block is then a binary search in that exchange's table,
+    with no transactions replayed.
+
+    checkpoint.json records the committed row count of every table. Rows
+    past it are cut off when the indexer is reopened, so an interrupted run
+    resumes from its last checkpoint. A reorg below the indexed head is
+    detected through the stored block hashes and rewinds every table to the
+    common ancestor. Memory is bounded by one batch of blocks.
+
+    run with:   python -m uniswap.indexer --rpc http://127.0.0.1:8545 --factory 0x... --out index/
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from urllib import request
+from ethereum import utils
+from ethereum.consensus_strategy import get_consensus_strategy
+from ethereum.messages import apply_message, apply_transaction
+
+EVENTS = (
+    ('ExchangeLaunch', 'ExchangeLaunch(address,address)'),
+    ('EthToTokenPurchase', 'EthToTokenPurchase(address,uint256,uint256)'),
+    ('TokenToEthPurchase', 'TokenToEthPurchase(address,uint256,uint256)'),
+    ('Investment', 'Investment(address,uint256)'),
+    ('Divestment', 'Divestment(address,uint256)'),
+    ('Transfer', 'Transfer(address,address,uint256)'),
+)
+LAUNCH, TRANSFER = 0, 5
+TOPICS = {utils.big_endian_to_int(utils.sha3(signature)): kind for kind, (_, signature) in enumerate(EVENTS)}
+POOL_GETTERS = tuple(utils.sha3(name + '()')[:4] for name in ('ethPool', 'tokenPool', 'invariant', 'totalShares'))
+BATCH_BLOCKS = 100
+READ_ROWS = 4096
+CALL_GAS = 100000
+
+Event = namedtuple('Event', 'block tx log name address args')
+PoolState = namedtuple('PoolState', 'block eth_pool token_pool invariant total_shares')
+
+
+class ChainSource(object):
+    """ Blocks of a tester.Chain. Receipts are not stored by pyethereum,
+    so the logs of a block are regenerated by executing it on its parent state.
+    """
+
+    def __init__(self, chain):
+        self.chain = chain.chain
+
+    def head(self):
+        return self.chain.head.header.number
+
+    def block_hash(self, number):
+        block = self.chain.get_block_by_number(number)
+        return block.header.hash if block else None
+
+    def logs(self, number):
+        block = self.chain.get_block_by_number(number)
+        state = self.chain.mk_poststate_of_blockhash(block.header.prevhash).ephemeral_clone()
+        get_consensus_strategy(state.config).initialize(state, block)
+        logs = []
+        for tx_index, tx in enumerate(block.transactions):
+            apply_transaction(state, tx)
+            for log in state.receipts[-1].logs:
+                logs.append((tx_index, len(logs), log.address, list(log.topics), log.data))
+        return logs
+
+    def call(self, number, address, data):
+        block = self.chain.get_block_by_number(number)
+        state = self.chain.mk_poststate_of_blockhash(block.header.hash).ephemeral_clone()
+        return apply_message(state, sender=b'\x00' * 20, to=address, code_address=address, data=data, gas=CALL_GAS)
+
+
+class RpcSource(object):
+    """ Blocks of a JSON-RPC endpoint: eth_blockNumber, eth_getBlockByNumber, eth_getLogs, eth_call. """
+
+    def __init__(self, url):
+        self.url = url
+        self.id = 0
+
+    def rpc(self, method, *params):
+        self.id += 1
+        body = json.dumps({'jsonrpc': '2.0', 'id': self.id, 'method': method, 'params': params}).encode()
+        req = request.Request(self.url, body, {'Content-Type': 'application/json'})
+        with request.urlopen(req) as response:
+            reply = json.loads(response.read().decode())
+        if 'error' in reply:
+            raise IOError('{} failed: {}'.format(method, reply['error']))
+        return reply['result']
+
+    def head(self):
+        return int(self.rpc('eth_blockNumber'), 16)
+
+    def block_hash(self, number):
+        block = self.rpc('eth_getBlockByNumber', hex(number), False)
+        return utils.decode_hex(block['hash'][2:]) if block else None
+
+    def logs(self, number):
+        logs = self.rpc('eth_getLogs', {'fromBlock': hex(number), 'toBlock': hex(number)})
+        return sorted((int(log['transactionIndex'], 16), int(log['logIndex'], 16),
+                       utils.decode_hex(log['address'][2:]),
+                       [int(topic, 16) for topic in log['topics']],
+                       utils.decode_hex(log['data'][2:])) for log in logs)
+
+    def call(self, number, address, data):
+        result = self.rpc('eth_call', {'to': '0x' + utils.encode_hex(address), 'data': '0x' + utils.encode_hex(data)},
+                          hex(number))
+        return utils.decode_hex(result[2:])
+
+
+def _encode(value, width):
+    if isinstance(value, bytes):
+        assert len(value) == width
+        return value
+    return value.to_bytes(width, 'big')
+
+
+class Table(object):
+    """ Append-only table, one file of fixed-width values per column.
+
+    Columns are (name, width) pairs. Integer columns are stored big endian,
+    'address' and 'hash' columns as raw bytes. Appended rows are buffered
+    until flush(), the first column must be non-decreasing for bisect().
+    """
+
+    RAW = ('address', 'hash', 'exchange', 'token')
+
+    def __init__(self, directory, columns):
+        self.directory = directory
+        self.columns = columns
+        os.makedirs(directory, exist_ok=True)
+        name, width = columns[0]
+        path = self._path(name)
+        self.rows = os.path.getsize(path) // width if os.path.exists(path) else 0
+        self.pending = []
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def __len__(self):
+        return self.rows + len(self.pending)
+
+    def append(self, *row):
+        self.pending.append(row)
+
+    def flush(self):
+        if not self.pending:
+            return
+        for i, (name, width) in enumerate(self.columns):
+            with open(self._path(name), 'ab') as f:
+                f.write(b''.join(_encode(row[i], width) for row in self.pending))
+        self.rows += len(self.pending)
+        self.pending = []
+
+    def truncate(self, rows):
+        self.flush()
+        for name, width in self.columns:
+            with open(self._path(name), 'ab') as f:
+                f.truncate(rows * width)
+        self.rows = min(self.rows, rows)
+
+    def read(self, start=0, end=None):
+        """ Rows start:end as tuples, read column by column. """
+        self.flush()
+        end = self.rows if end is None else min(end, self.rows)
+        if start >= end:
+            return []
+        columns = []
+        for name, width in self.columns:
+            with open(self._path(name), 'rb') as f:
+                f.seek(start * width)
+                data = f.read((end - start) * width)
+            values = [data[i:i + width] for i in range(0, len(data), width)]
+            columns.append(values if name in self.RAW else [int.from_bytes(v, 'big') for v in values])
+        return list(zip(*columns))
+
+    def scan(self, start=0, end=None, rows=READ_ROWS):
+        """ Generator over rows start:end, holding at most rows of them in memory. """
+        self.flush()
+        end = self.rows if end is None else min(end, self.rows)
+        for offset in range(start, end, rows):
+            for row in self.read(offset, min(offset + rows, end)):
+                yield row
+
+    def bisect(self, value):
+        """ Number of rows whose first column is <= value. """
+        self.flush()
+        name, width = self.columns[0]
+        lo, hi = 0, self.rows
+        with open(self._path(name), 'rb') as f:
+            while lo < hi:
+                mid = (lo + hi) // 2
+                f.seek(mid * width)
+                if int.from_bytes(f.read(width), 'big') <= value:
+                    lo = mid + 1
+                else:
+                    hi = mid
+        return lo
+
+
+BLOCKS = (('number', 8), ('hash', 32))
+EVENT_COLUMNS = (('block', 8), ('tx', 4), ('log', 4), ('kind', 1), ('address', 20),
+                 ('a0', 32), ('a1', 32), ('a2', 32))
+LAUNCHES = (('block', 8), ('exchange', 20), ('token', 20))
+STATES = (('block', 8), ('eth_pool', 32), ('token_pool', 32), ('invariant', 32), ('total_shares', 32))
+
+
+def decode_log(topics, data):
+    """ (kind, args) of a log in EVENTS, None for any other log. """
+    if not topics or topics[0] not in TOPICS:
+        return None
+    args = list(topics[1:]) + [utils.big_endian_to_int(data[i:i + 32]) for i in range(0, len(data), 32)]
+    return TOPICS[topics[0]], args
+
+
+class Indexer(object):
+    """ Event and pool state index of the exchanges launched by factories. """
+
+    def __init__(self, directory, source, factories, batch_blocks=BATCH_BLOCKS, start_block=1):
+        self.directory = directory
+        self.source = source
+        self.factories = set(utils.normalize_address(f) for f in factories)
+        self.batch_blocks = batch_blocks
+        self.start_block = start_block
+        self.blocks = Table(os.path.join(directory, 'blocks'), BLOCKS)
+        self.events = Table(os.path.join(directory, 'events'), EVENT_COLUMNS)
+        self.launches = Table(os.path.join(directory, 'launches'), LAUNCHES)
+        self.states = {}
+        self._open()
+
+    def _checkpoint_path(self):
+        return os.path.join(self.directory, 'checkpoint.json')
+
+    def _state_table(self, exchange):
+        if exchange not in self.states:
+            self.states[exchange] = Table(os.path.join(self.directory, 'states', utils.encode_hex(exchange)), STATES)
+        return self.states[exchange]
+
+    def _open(self):
+        rows = {}
+        if os.path.exists(self._checkpoint_path()):
+            with open(self._checkpoint_path()) as f:
+                rows = json.load(f)['rows']
+        # drop everything written after the last checkpoint
+        self.blocks.truncate(rows.get('blocks', 0))
+        self.events.truncate(rows.get('events', 0))
+        self.launches.truncate(rows.get('launches', 0))
+        states_dir = os.path.join(self.directory, 'states')
+        for name in (os.listdir(states_dir) if os.path.exists(states_dir) else ()):
+            self._state_table(utils.decode_hex(name)).truncate(rows.get('states', {}).get(name, 0))
+        self._load_registry()
+
+    def _load_registry(self):
+        self.exchanges, self.tokens = {}, {}
+        for _, exchange, token in self.launches.scan():
+            self.exchanges[exchange] = token
+            self.tokens[token] = exchange
+
+    def checkpoint(self):
+        tables = [self.blocks, self.events, self.launches] + list(self.states.values())
+        for table in tables:
+            table.flush()
+        rows = {
+            'blocks': len(self.blocks),
+            'events': len(self.events),
+            'launches': len(self.launches),
+            'states': {utils.encode_hex(e): len(t) for e, t in self.states.items()},
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'rows': rows, 'block': self.indexed_block()}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._checkpoint_path())
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def indexed_block(self):
+        """ Number of the last indexed block, start_block - 1 before the first run. """
+        if not len(self.blocks):
+            return self.start_block - 1
+        return self.blocks.read(len(self.blocks) - 1)[0][0]
+
+    def rewind(self, number):
+        """ Drop every row of blocks after number. """
+        for table in [self.blocks, self.events, self.launches] + list(self.states.values()):
+            table.truncate(table.bisect(number))
+        self._load_registry()
+
+    def _find_fork(self):
+        # last indexed block that is still on the source's chain
+        row = len(self.blocks)
+        while row > 0:
+            number, stored = self.blocks.read(row - 1, row)[0]
+            if self.source.block_hash(number) == stored:
+                break
+            row -= 1
+        return row
+
+    def run(self, until=None, out=None):
+        """ Index every block up to until (the source head by default), return the last indexed block. """
+        fork = self._find_fork()
+        if fork < len(self.blocks):
+            number = self.blocks.read(fork - 1, fork)[0][0] if fork else self.start_block - 1
+            self.rewind(number)
+            self.checkpoint()
+        head = self.source.head() if until is None else until
+        number = self.indexed_block() + 1
+        started = time.time()
+        while number <= head:
+            end = min(head, number + self.batch_blocks - 1)
+            for block in range(number, end + 1):
+                self._index_block(block)
+            self.checkpoint()
+            if out:
+                out.write('indexed block {} of {}, {} events ({:.1f} blocks/s)\n'.format(
+                    end, head, len(self.events), (end - self.start_block + 1) / max(time.time() - started, 1e-9)))
+            number = end + 1
+        return self.indexed_block()
+
+    def _index_block(self, number):
+        touched = set()
+        for tx_index, log_index, address, topics, data in self.source.logs(number):
+            decoded = decode_log(topics, data)
+            if decoded is None:
+                continue
+            kind, args = decoded
+            if kind == LAUNCH:
+                if address not in self.factories:
+                    continue
+                exchange, token = utils.int_to_addr(args[0]), utils.int_to_addr(args[1])
+                self.launches.append(number, exchange, token)
+                self.exchanges[exchange] = token
+                self.tokens[token] = exchange
+            elif kind == TRANSFER:
+                exchange = self.tokens.get(address)
+                if exchange is None or exchange not in (utils.int_to_addr(args[0]), utils.int_to_addr(args[1])):
+                    continue
+                touched.add(exchange)
+            elif address in self.exchanges:
+                touched.add(address)
+            else:
+                continue
+            args += [0] * (3 - len(args))
+            self.events.append(number, tx_index, log_index, kind, address, *args)
+        for exchange in sorted(touched):
+            pools = [utils.big_endian_to_int(self.source.call(number, exchange, getter)) for getter in POOL_GETTERS]
+            self._state_table(exchange).append(number, *pools)
+        self.blocks.append(number, self.source.block_hash(number))
+
+    def state_at(self, exchange, block):
+        """ Pools of exchange after block, all zero before its first touch. """
+        exchange = utils.normalize_address(exchange)
+        if exchange not in self.states:
+            return PoolState(0, 0, 0, 0, 0)
+        table = self.states[exchange]
+        row = table.bisect(block)
+        return PoolState(*table.read(row - 1, row)[0]) if row else PoolState(0, 0, 0, 0, 0)
+
+    def pool_states(self, block):
+        """ {exchange: PoolState} of every exchange launched at or before block. """
+        launched = self.launches.read(0, self.launches.bisect(block))
+        return {exchange: self.state_at(exchange, block) for _, exchange, _ in launched}
+
+    def history(self, exchange, start=0, end=None):
+        """ PoolState after every block in start..end that touched exchange. """
+        table = self.states.get(utils.normalize_address(exchange))
+        if table is None:
+            return
+        last = len(table) if end is None else table.bisect(end)
+        for row in table.scan(table.bisect(start - 1) if start else 0, last):
+            yield PoolState(*row)
+
+    def iter_events(self, start=0, end=None):
+        """ Events of blocks start..end in chain order, streamed from disk. """
+        first = self.events.bisect(start - 1) if start else 0
+        last = len(self.events) if end is None else self.events.bisect(end)
+        for block, tx, log, kind, address, a0, a1, a2 in self.events.scan(first, last):
+            name, signature = EVENTS[kind]
+            arity = signature.count(',') + 1
+            yield Event(block, tx, log, name, address, (a0, a1, a2)[:arity])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Index factory and exchange events from a JSON-RPC endpoint')
+    parser.add_argument('--rpc', default='http://127.0.0.1:8545')
+    parser.add_argument('--factory', action='append', required=True)
+    parser.add_argument('--out', default='index')
+    parser.add_argument('--batch-blocks', type=int, default=BATCH_BLOCKS)
+    parser.add_argument('--follow', type=float, default=0, help='keep polling for new blocks every N seconds')
+    args = parser.parse_args(argv)
+    indexer = Indexer(args.out, RpcSource(args.rpc), args.factory, args.batch_blocks)
+    while True:
+        indexer.run(out=sys.stdout)
+        if not args.follow:
+            return 0
+        time.sleep(args.follow)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+    Bulk pool state through UniswapLens.
+
+    The lens reads tokenList, the exchange address and the four pool fields of
+    every exchange inside one eth_call per page, so a snapshot of N exchanges
+    costs ceil(N / page_size) calls instead of about 6 * N.
+
+    Rows come back as one flat uint256[] and are split here into columns,
+    with addresses as 20 byte strings like tester.accounts.
+"""
+
+from collections import namedtuple
+from ethereum import utils
+from ethereum.tools import tester
+from uniswap.deploy import deploy_contract
+
+FIELDS = 6
+# A row costs roughly 15k gas (tokenList, tokenToExchangeLookup and four pool getters),
+# so a default page stays well below CALL_GAS
+PAGE_SIZE = 100
+CALL_GAS = 3141592
+
+Snapshot = namedtuple('Snapshot', 'tokens exchanges eth_pool token_pool invariant total_shares')
+
+
+def deploy_lens(chain, sender=tester.k0):
+    return deploy_contract(chain, 'Exchange/UniswapLens.sol', sender=sender)
+
+
+def columns(states):
+    """ Split the flat rows returned by getExchangeStates into Snapshot columns. """
+    tokens = tuple(utils.int_to_addr(x) for x in states[0::FIELDS])
+    exchanges = tuple(utils.int_to_addr(x) for x in states[1::FIELDS])
+    return Snapshot(tokens, exchanges, *(tuple(states[i::FIELDS]) for i in range(2, FIELDS)))
+
+
+class LensClient(object):
+    """ Paged snapshots of every exchange registered in one factory. """
+
+    def __init__(self, lens, factory, page_size=PAGE_SIZE):
+        self.lens = lens
+        self.factory = factory
+        self.page_size = page_size
+        self.calls = 0
+
+    def page(self, start, count=None):
+        """ (exchange count, flat rows) for tokenList[start:start + count]. """
+        self.calls += 1
+        count = self.page_size if count is None else count
+        exchange_count, states = self.lens.getExchangeStates(self.factory, start, count, startgas=CALL_GAS)
+        return exchange_count, states
+
+    def snapshot(self):
+        """ Snapshot of all exchanges, one call per page. """
+        exchange_count, states = self.page(0)
+        rows = list(states)
+        while len(rows) < exchange_count * FIELDS:
+            exchange_count, states = self.page(len(rows) // FIELDS)
+            if not states:
+                break
+            rows.extend(states)
+        return columns(rows)
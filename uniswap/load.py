@@ -0,0 +1,274 @@
+"""
+    Load generator: sustained trade flow against a local tester.Chain.
+
+    Funded accounts send a weighted random mix of swaps and liquidity
+    operations to the exchanges of a stored World, either UNI and SWAP or N
+    generated tokens. A block is mined every per_block transactions, or
+    earlier when the next transaction might not fit in the block.
+
+    Latency is the wall time of chain.tx for one transaction, signing and
+    applying it. Picking the call and encoding its calldata happen before
+    the timer starts. It is reported per call type, mining is reported as
+    its own call type.
+    tx/s is measured over the whole run, mining included. The resident set
+    size is sampled as the run goes, since the chain keeps every block and
+    state in memory.
+
+    run with:   python -m uniswap.load --txs 20000 --accounts 100 --per-block 10
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from ethereum.tools import tester
+from ethereum import utils
+from uniswap.deploy import FACTORIES, TOKENS, load_world
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+MIX = {
+    'ethToTokenSwap': 4,
+    'tokenToEthSwap': 4,
+    'tokenToTokenSwap': 2,
+    'investLiquidity': 1,
+    'divestLiquidity': 1,
+}
+ACCOUNTS = 20
+PER_BLOCK = 10
+TX_GAS = 300000
+ACCOUNT_ETH = 10**24
+ACCOUNT_TOKENS = 10**30
+POOL_ETH = 5 * 10**18
+POOL_TOKENS = 10 * 10**18
+POOL_INVEST = 495 * 10**18
+PROVIDER = 1
+PERCENTILES = (50, 90, 99)
+MEMORY_SAMPLES = 20
+
+
+def generated_tokens(count):
+    """ Token specs for load_world, UNI and SWAP for up to two exchanges. """
+    if count <= len(TOKENS):
+        return TOKENS[:max(count, 1)]
+    return tuple(('Load Token {}'.format(i), 'LOAD{}'.format(i), 18) for i in range(count))
+
+
+def parse_mix(text):
+    """ 'ethToTokenSwap=4,tokenToEthSwap=1' -> {call type: weight} """
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name not in MIX:
+            raise ValueError('unknown call type {}, expected one of {}'.format(name, ', '.join(sorted(MIX))))
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(ordered, q):
+    """ Nearest-rank percentile of an ascending list. """
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def rss_kb():
+    """ Current resident set size in kB, the peak where the current size is not available. """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (IOError, OSError, ValueError):
+        if resource is None:
+            return None
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def latency_stats(samples):
+    ordered = sorted(samples)
+    stats = {'p{}'.format(q): round(percentile(ordered, q) * 1000.0, 3) if ordered else None for q in PERCENTILES}
+    stats['max'] = round(ordered[-1] * 1000.0, 3) if ordered else None
+    return stats
+
+
+class LoadGenerator(object):
+    """ Funded accounts trading on one World. """
+
+    def __init__(self, exchanges=2, accounts=ACCOUNTS, factory=FACTORIES[0], mix=None, per_block=PER_BLOCK,
+                 seed=0):
+        self.world = load_world(tokens=generated_tokens(exchanges), factory=factory)
+        self.chain = self.world.chain
+        self.exchange_codec = self.world.exchanges[0].codec
+        self.exchanges = [utils.normalize_address(e.address) for e in self.world.exchanges]
+        self.tokens = [t.address for t in self.world.tokens]
+        self.keys = [utils.sha3('uniswap load account {}'.format(i)) for i in range(accounts)]
+        self.accounts = [utils.privtoaddr(k) for k in self.keys]
+        mix = mix or MIX
+        self.calls = sorted(mix)
+        self.weights = [mix[name] for name in self.calls]
+        self.per_block = per_block
+        self.rng = random.Random(seed)
+        self.in_block = 0
+        self.mine_times = []
+
+    def _room(self, gas=TX_GAS):
+        if self.chain.head_state.gas_used + gas > self.chain.head_state.gas_limit:
+            self.mine()
+
+    def mine(self):
+        started = time.time()
+        self.chain.mine()
+        self.mine_times.append(time.time() - started)
+        self.in_block = 0
+
+    def setup(self):
+        """ Initialize every pool and fund every account with ETH, tokens and approvals. """
+        token_codec = self.world.tokens[0].codec
+        exchange_codec = self.exchange_codec
+        provider = tester.keys[PROVIDER]
+
+        def send(sender, to, codec, name, args, value=0):
+            self._room()
+            self.chain.tx(sender=sender, to=to, value=value, data=codec.encode(name, args), startgas=TX_GAS)
+
+        for token, exchange in zip(self.tokens, self.exchanges):
+            send(tester.k0, token, token_codec, 'mint', [tester.accounts[PROVIDER], POOL_TOKENS * 100])
+            send(provider, token, token_codec, 'approve', [exchange, 2**256 - 1])
+            send(provider, exchange, exchange_codec, 'initializeExchange', [POOL_TOKENS], POOL_ETH)
+            send(provider, exchange, exchange_codec, 'investLiquidity', [1], POOL_INVEST)
+        for key, account in zip(self.keys, self.accounts):
+            self._room()
+            self.chain.tx(sender=tester.k0, to=account, value=ACCOUNT_ETH)
+            for token, exchange in zip(self.tokens, self.exchanges):
+                send(tester.k0, token, token_codec, 'mint', [account, ACCOUNT_TOKENS])
+                send(key, token, token_codec, 'approve', [exchange, 2**256 - 1])
+        self.mine()
+        self.mine_times = []
+
+    def next_call(self):
+        """ (call type, sender key, exchange, value, calldata) of one random operation. """
+        name = self.rng.choices(self.calls, self.weights)[0]
+        i = self.rng.randrange(len(self.keys))
+        ex = self.rng.randrange(len(self.exchanges))
+        timeout = self.chain.head_state.timestamp + 300
+        amount = self.rng.randint(1, 1000) * 10**15
+        encode = self.exchange_codec.encode
+        value = 0
+        if name == 'ethToTokenSwap':
+            value, data = amount, encode(name, [1, timeout])
+        elif name == 'tokenToEthSwap':
+            data = encode(name, [amount, 1, timeout])
+        elif name == 'tokenToTokenSwap':
+            other = self.rng.choice([j for j in range(len(self.tokens)) if j != ex] or [ex])
+            data = encode(name, [self.tokens[other], amount, 1, timeout])
+        elif name == 'investLiquidity':
+            value, data = amount, encode(name, [1])
+        else:
+            shares = self.exchange_codec.decode('getShares', self.chain.call(
+                to=self.exchanges[ex], data=encode('getShares', [self.accounts[i]])))[0]
+            data = encode(name, [max(shares // 2, 1), 1, 1])
+        return name, self.keys[i], self.exchanges[ex], value, data
+
+    def run(self, txs=None, duration=None, out=None):
+        """ Send txs transactions, or as many as fit in duration seconds, and return the report. """
+        if txs is None and duration is None:
+            raise ValueError('give txs or duration')
+        latencies = {name: [] for name in self.calls}
+        self.mine_times = latencies['mine'] = []
+        failed = dict.fromkeys(self.calls, 0)
+        memory = [(0, rss_kb())]
+        sample_every = max(1, txs // MEMORY_SAMPLES) if txs else 1000
+        started = time.time()
+        sent = 0
+        while (txs is None or sent < txs) and (duration is None or time.time() - started < duration):
+            name, key, exchange, value, data = self.next_call()
+            self._room()
+            t0 = time.time()
+            try:
+                self.chain.tx(sender=key, to=exchange, value=value, data=data, startgas=TX_GAS)
+            except tester.TransactionFailed:
+                failed[name] += 1
+            latencies[name].append(time.time() - t0)
+            sent += 1
+            self.in_block += 1
+            if self.in_block >= self.per_block:
+                self.mine()
+            if sent % sample_every == 0:
+                memory.append((sent, rss_kb()))
+                if out:
+                    out.write('{:>9} txs {:>8.1f} tx/s {:>10} kB\n'.format(
+                        sent, sent / max(time.time() - started, 1e-9), memory[-1][1]))
+        if self.in_block:
+            self.mine()
+        seconds = time.time() - started
+        memory.append((sent, rss_kb()))
+        calls = {}
+        for name, samples in sorted(latencies.items()):
+            calls[name] = dict(latency_stats(samples), count=len(samples), failed=failed.get(name, 0))
+        return {
+            'txs': sent,
+            'seconds': round(seconds, 3),
+            'tx_per_s': round(sent / max(seconds, 1e-9), 1),
+            'blocks': len(self.mine_times),
+            'txs_per_block': round(sent / max(len(self.mine_times), 1), 2),
+            'accounts': len(self.keys),
+            'exchanges': len(self.exchanges),
+            'variant': self.world.variant,
+            'calls': calls,
+            'memory': {
+                'start_kb': memory[0][1],
+                'end_kb': memory[-1][1],
+                'growth_kb': memory[-1][1] - memory[0][1] if memory[0][1] is not None else None,
+                'samples': memory,
+            },
+        }
+
+
+def summary(report, out=sys.stdout):
+    out.write('{txs} txs in {seconds:.1f}s: {tx_per_s:.1f} tx/s, {blocks} blocks, {txs_per_block} txs per block, '
+              '{accounts} accounts, {exchanges} exchanges ({variant})\n'.format(**report))
+    out.write('{:<20} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9}\n'.format(
+        'call', 'count', 'failed', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+    for name, stats in sorted(report['calls'].items()):
+        if stats['count']:
+            out.write('{:<20} {:>8} {:>7} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f}\n'.format(
+                name, stats['count'], stats['failed'], stats['p50'], stats['p90'], stats['p99'], stats['max']))
+    memory = report['memory']
+    if memory['start_kb'] is not None:
+        out.write('memory: {start_kb} kB -> {end_kb} kB ({growth_kb:+} kB, {per_tx:.2f} kB per tx)\n'.format(
+            per_tx=memory['growth_kb'] / max(report['txs'], 1), **memory))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Drive a mix of swaps and liquidity operations against a local chain')
+    parser.add_argument('--txs', type=int, help='number of transactions to send')
+    parser.add_argument('--duration', type=float, help='send transactions for this many seconds')
+    parser.add_argument('--accounts', type=int, default=ACCOUNTS)
+    parser.add_argument('--exchanges', type=int, default=2, help='2 trades on UNI and SWAP, more generates tokens')
+    parser.add_argument('--per-block', type=int, default=PER_BLOCK, help='transactions per mined block')
+    parser.add_argument('--mix', type=parse_mix, default=MIX,
+                        help='weights per call type, e.g. ethToTokenSwap=4,tokenToTokenSwap=1')
+    parser.add_argument('--factory', default=FACTORIES[0], choices=FACTORIES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the JSON report here')
+    args = parser.parse_args(argv)
+    if args.txs is None and args.duration is None:
+        args.txs = 10000
+    generator = LoadGenerator(args.exchanges, args.accounts, args.factory, args.mix, args.per_block, args.seed)
+    generator.setup()
+    report = generator.run(args.txs, args.duration, out=sys.stdout)
+    summary(report)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
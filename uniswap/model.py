@@ -0,0 +1,257 @@
+"""
+    Off-chain reference of the UniswapExchange integer math.
+
+    Every operation follows UniswapExchange.sol statement by statement: the
+    same uint256 truncation, the same SafeMath order of operations and the
+    same require/assert conditions, which raise TransactionFailed here. A
+    failed operation leaves the state untouched, like a reverted transaction.
+    Token balances and allowances are not part of the model, only the pools.
+"""
+
+FEE_RATE = 500
+INITIAL_SHARES = 1000
+MAX_UINT256 = 2**256 - 1
+
+
+class TransactionFailed(Exception):
+    pass
+
+
+def require(condition):
+    if not condition:
+        raise TransactionFailed()
+
+
+def add(a, b):
+    c = a + b
+    require(c <= MAX_UINT256)
+    return c
+
+
+def sub(a, b):
+    require(b <= a)
+    return a - b
+
+
+def mul(a, b):
+    c = a * b
+    require(c <= MAX_UINT256)
+    return c
+
+
+def div(a, b):
+    require(b != 0)
+    return a // b
+
+
+class ExchangeState(object):
+    """ Storage of one UniswapExchange: pools, invariant and shares. """
+
+    __slots__ = ('eth_pool', 'token_pool', 'invariant', 'total_shares', 'shares')
+
+    def __init__(self, eth_pool=0, token_pool=0, invariant=0, total_shares=0, shares=None):
+        self.eth_pool = eth_pool
+        self.token_pool = token_pool
+        self.invariant = invariant
+        self.total_shares = total_shares
+        self.shares = shares if shares is not None else {}
+
+    def __repr__(self):
+        return 'ExchangeState(eth_pool={}, token_pool={}, invariant={}, total_shares={})'.format(
+            self.eth_pool, self.token_pool, self.invariant, self.total_shares)
+
+    def __eq__(self, other):
+        return isinstance(other, ExchangeState) and self.pools() == other.pools() and self.shares == other.shares
+
+    def __ne__(self, other):
+        return not self == other
+
+    def pools(self):
+        return self.eth_pool, self.token_pool, self.invariant, self.total_shares
+
+    def copy(self):
+        return ExchangeState(self.eth_pool, self.token_pool, self.invariant, self.total_shares, dict(self.shares))
+
+    def initialized(self):
+        return self.invariant > 0 and self.total_shares > 0
+
+    # initializeExchange
+    def initialize(self, provider, eth_in, token_amount):
+        require(self.invariant == 0 and self.total_shares == 0)
+        require(eth_in >= 10000 and token_amount >= 10000 and eth_in <= 5*10**18)
+        invariant = mul(eth_in, token_amount)
+        self.eth_pool = eth_in
+        self.token_pool = token_amount
+        self.invariant = invariant
+        self.shares[provider] = INITIAL_SHARES
+        self.total_shares = INITIAL_SHARES
+
+    # ethToToken, without committing
+    def eth_to_token_out(self, eth_in, min_tokens=1):
+        require(self.initialized())
+        require(eth_in > 0 and min_tokens > 0)
+        fee = eth_in // FEE_RATE
+        new_eth_pool = add(self.eth_pool, eth_in)
+        temp_eth_pool = sub(new_eth_pool, fee)
+        new_token_pool = div(self.invariant, temp_eth_pool)
+        tokens_out = sub(self.token_pool, new_token_pool)
+        require(tokens_out >= min_tokens and tokens_out <= self.token_pool)
+        return tokens_out, new_eth_pool, new_token_pool, mul(new_eth_pool, new_token_pool)
+
+    # tokenToEth and the first leg of tokenToTokenOut, without committing
+    def token_to_eth_out(self, tokens_in, min_eth=1):
+        require(self.initialized())
+        require(tokens_in > 0 and min_eth > 0)
+        fee = tokens_in // FEE_RATE
+        new_token_pool = add(self.token_pool, tokens_in)
+        temp_token_pool = sub(new_token_pool, fee)
+        new_eth_pool = div(self.invariant, temp_token_pool)
+        eth_out = sub(self.eth_pool, new_eth_pool)
+        require(eth_out >= min_eth and eth_out <= self.eth_pool)
+        return eth_out, new_eth_pool, new_token_pool, mul(new_eth_pool, new_token_pool)
+
+    def _commit(self, new_eth_pool, new_token_pool, new_invariant):
+        self.eth_pool = new_eth_pool
+        self.token_pool = new_token_pool
+        self.invariant = new_invariant
+
+    def eth_to_token(self, eth_in, min_tokens=1):
+        tokens_out, new_eth_pool, new_token_pool, new_invariant = self.eth_to_token_out(eth_in, min_tokens)
+        self._commit(new_eth_pool, new_token_pool, new_invariant)
+        return tokens_out
+
+    def token_to_eth(self, tokens_in, min_eth=1):
+        eth_out, new_eth_pool, new_token_pool, new_invariant = self.token_to_eth_out(tokens_in, min_eth)
+        self._commit(new_eth_pool, new_token_pool, new_invariant)
+        return eth_out
+
+    # investLiquidity
+    def invest(self, provider, eth_in, min_shares=1):
+        require(self.initialized())
+        require(eth_in > 0 and min_shares > 0)
+        eth_per_share = div(self.eth_pool, self.total_shares)
+        require(eth_in >= eth_per_share)
+        shares_purchased = div(eth_in, eth_per_share)
+        require(shares_purchased >= min_shares)
+        tokens_per_share = div(self.token_pool, self.total_shares)
+        tokens_required = mul(shares_purchased, tokens_per_share)
+        provider_shares = add(self.shares.get(provider, 0), shares_purchased)
+        total_shares = add(self.total_shares, shares_purchased)
+        eth_pool = add(self.eth_pool, eth_in)
+        token_pool = add(self.token_pool, tokens_required)
+        invariant = mul(eth_pool, token_pool)
+        self.shares[provider] = provider_shares
+        self.total_shares = total_shares
+        self._commit(eth_pool, token_pool, invariant)
+        return shares_purchased, tokens_required
+
+    # divestLiquidity
+    def divest(self, provider, shares_burned, min_eth=0, min_tokens=0):
+        require(shares_burned > 0)
+        provider_shares = sub(self.shares.get(provider, 0), shares_burned)
+        eth_per_share = div(self.eth_pool, self.total_shares)
+        tokens_per_share = div(self.token_pool, self.total_shares)
+        eth_divested = mul(eth_per_share, shares_burned)
+        tokens_divested = mul(tokens_per_share, shares_burned)
+        require(eth_divested >= min_eth and tokens_divested >= min_tokens)
+        total_shares = sub(self.total_shares, shares_burned)
+        eth_pool = sub(self.eth_pool, eth_divested)
+        token_pool = sub(self.token_pool, tokens_divested)
+        invariant = 0 if total_shares == 0 else mul(eth_pool, token_pool)
+        self.shares[provider] = provider_shares
+        self.total_shares = total_shares
+        self._commit(eth_pool, token_pool, invariant)
+        return eth_divested, tokens_divested
+
+    # ethToTokenBatchPayment: each leg is a separate ethToToken, the total is checked against min_tokens
+    def eth_to_token_batch(self, amounts, min_tokens=1):
+        require(len(amounts) > 0 and min_tokens > 0)
+        trial = self.copy()
+        outputs = [trial.eth_to_token(x) for x in amounts]
+        require(sum(amounts) <= MAX_UINT256 and sum(outputs) >= min_tokens)
+        self._commit(trial.eth_pool, trial.token_pool, trial.invariant)
+        return outputs
+
+    # tokenToEthBatchPayment
+    def token_to_eth_batch(self, amounts, min_eth=1):
+        require(len(amounts) > 0 and min_eth > 0)
+        trial = self.copy()
+        outputs = [trial.token_to_eth(x) for x in amounts]
+        require(sum(amounts) <= MAX_UINT256 and sum(outputs) >= min_eth)
+        self._commit(trial.eth_pool, trial.token_pool, trial.invariant)
+        return outputs
+
+    # Batched quotes against the current state. Entries that would revert are None.
+    def eth_to_token_quotes(self, amounts, min_tokens=1):
+        E, T, I = self.eth_pool, self.token_pool, self.invariant
+        if not self.initialized():
+            return [None] * len(amounts)
+        out = []
+        for x in amounts:
+            new_e = E + x
+            if x <= 0 or new_e > MAX_UINT256:
+                out.append(None)
+                continue
+            new_t = I // (new_e - x // FEE_RATE)
+            y = T - new_t
+            out.append(y if y >= min_tokens and new_e * new_t <= MAX_UINT256 else None)
+        return out
+
+    def token_to_eth_quotes(self, amounts, min_eth=1):
+        E, T, I = self.eth_pool, self.token_pool, self.invariant
+        if not self.initialized():
+            return [None] * len(amounts)
+        out = []
+        for x in amounts:
+            new_t = T + x
+            if x <= 0 or new_t > MAX_UINT256:
+                out.append(None)
+                continue
+            new_e = I // (new_t - x // FEE_RATE)
+            y = E - new_e
+            out.append(y if y >= min_eth and new_e * new_t <= MAX_UINT256 else None)
+        return out
+
+
+def token_to_token(exchange_in, exchange_out, tokens_in, min_tokens_out=1):
+    """ tokenToTokenOut on exchange_in followed by tokenToTokenIn on exchange_out.
+
+    Both states are committed together or not at all.
+    """
+    require(exchange_in is not exchange_out)
+    require(tokens_in > 0 and min_tokens_out > 0)
+    eth_out, new_eth_pool, new_token_pool, new_invariant = token_to_token_out(exchange_in, tokens_in)
+    # tokenToTokenIn requires msg.value > 0
+    require(eth_out > 0)
+    second_leg = exchange_out.eth_to_token_out(eth_out, min_tokens_out)
+    exchange_in._commit(new_eth_pool, new_token_pool, new_invariant)
+    exchange_out._commit(*second_leg[1:])
+    return second_leg[0]
+
+
+def token_to_token_quotes(exchange_in, exchange_out, amounts, min_tokens_out=1):
+    """ Batched token_to_token outputs, None where the swap would revert. """
+    eth_amounts = []
+    for x in amounts:
+        if x <= 0:
+            eth_amounts.append(0)
+            continue
+        try:
+            eth_amounts.append(token_to_token_out(exchange_in, x)[0])
+        except TransactionFailed:
+            eth_amounts.append(0)
+    quotes = exchange_out.eth_to_token_quotes(eth_amounts, min_tokens_out)
+    return [q if x > 0 else None for q, x in zip(quotes, amounts)]
+
+
+# tokenToTokenOut, the first leg of token_to_token, without committing
+def token_to_token_out(exchange, tokens_in):
+    # tokenToTokenOut only requires ethOut <= ethPool, the minimum is enforced by tokenToTokenIn
+    require(exchange.initialized())
+    fee = tokens_in // FEE_RATE
+    new_token_pool = add(exchange.token_pool, tokens_in)
+    temp_token_pool = sub(new_token_pool, fee)
+    new_eth_pool = div(exchange.invariant, temp_token_pool)
+    eth_out = sub(exchange.eth_pool, new_eth_pool)
+    require(eth_out <= exchange.eth_pool)
+    return eth_out, new_eth_pool, new_token_pool, mul(new_eth_pool, new_token_pool)
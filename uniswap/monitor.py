@@ -0,0 +1,290 @@
+"""
+    Asyncio monitor of the pools of every exchange of one or more factories.
+
+    Exchanges are discovered through getExchangeCount, tokenList and
+    tokenToExchangeLookup, only the listings added since the previous
+    discovery are read. Pools are read with ethPool, tokenPool and
+    totalShares eth_calls against one block number, so the three values of
+    a pool always belong together. Calls go out as JSON-RPC batches of up
+    to batch_size calls over a pool of keep-alive HTTP/1.1 connections,
+    which also bounds how many batches are in flight. A pool only adds
+    three calls to a batch, not a round trip.
+
+    Nothing is read while the head does not move. Pools whose values
+    changed are put on a bounded queue; when the consumer falls behind the
+    poller waits on the queue instead of piling up updates. The lag of an
+    update is the time from the poll noticing its block to the consumer
+    receiving it, and is reported with the poll times by metrics().
+
+    No HTTP library is needed, the client speaks just enough HTTP/1.1 for
+    a JSON-RPC endpoint such as uniswap.node.
+
+    run with:   python -m uniswap.monitor --rpc http://127.0.0.1:8545 --factory 0x...
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import namedtuple
+from urllib.parse import urlparse
+from ethereum import utils
+from uniswap.load import latency_stats
+
+CONNECTIONS = 8
+BATCH_SIZE = 300
+QUEUE_SIZE = 1000
+INTERVAL = 1.0
+POOL_GETTERS = ('ethPool', 'tokenPool', 'totalShares')
+
+Update = namedtuple('Update', 'block exchange token eth_pool token_pool total_shares observed')
+
+# asyncio.get_running_loop is new in 3.7, inside a coroutine get_event_loop returns the running loop before that
+get_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+
+def selector(signature):
+    return '0x' + utils.encode_hex(utils.sha3(signature)[:4])
+
+
+def _word(address):
+    return '{:0>64}'.format(utils.encode_hex(utils.normalize_address(address)))
+
+
+class RpcClient(object):
+    """ JSON-RPC over a bounded pool of keep-alive connections, used from one event loop. """
+
+    def __init__(self, url, connections=CONNECTIONS):
+        parsed = urlparse(url)
+        self.host, self.port, self.path = parsed.hostname, parsed.port or 80, parsed.path or '/'
+        self.connections = connections
+        self.idle = []
+        # created by the first request, in the loop that runs it
+        self.slots = None
+        self.id = 0
+        self.requests = 0
+
+    async def _post(self, payload):
+        body = json.dumps(payload).encode()
+        head = ('POST {} HTTP/1.1\r\nHost: {}:{}\r\nContent-Type: application/json\r\n'
+                'Content-Length: {}\r\n\r\n').format(self.path, self.host, self.port, len(body)).encode()
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.connections)
+        async with self.slots:
+            connection = self.idle.pop() if self.idle else None
+            for attempt in range(2):
+                if connection is None:
+                    connection = await asyncio.open_connection(self.host, self.port)
+                reader, writer = connection
+                try:
+                    writer.write(head + body)
+                    status = await reader.readline()
+                    if not status:
+                        raise ConnectionError('connection closed by the server')
+                    length, close = 0, False
+                    while True:
+                        line = (await reader.readline()).strip()
+                        if not line:
+                            break
+                        name, _, value = line.decode().partition(':')
+                        if name.lower() == 'content-length':
+                            length = int(value)
+                        elif name.lower() == 'connection' and value.strip().lower() == 'close':
+                            close = True
+                    reply = await reader.readexactly(length)
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    # a kept-alive connection the server has dropped in the meantime, retried once on a new one
+                    writer.close()
+                    connection = None
+                    if attempt:
+                        raise
+            if status.split()[1] != b'200':
+                writer.close()
+                raise IOError('HTTP {}'.format(status.decode().strip()))
+            if close:
+                writer.close()
+            else:
+                self.idle.append(connection)
+        self.requests += 1
+        return json.loads(reply.decode())
+
+    async def call(self, method, *params):
+        self.id += 1
+        reply = await self._post({'jsonrpc': '2.0', 'id': self.id, 'method': method, 'params': params})
+        if 'error' in reply:
+            raise IOError('{} failed: {}'.format(method, reply['error']))
+        return reply['result']
+
+    async def batch(self, calls):
+        """ Results of [(method, params)] sent as one batch, in order. """
+        first = self.id + 1
+        self.id += len(calls)
+        replies = await self._post([{'jsonrpc': '2.0', 'id': first + i, 'method': method, 'params': params}
+                                    for i, (method, params) in enumerate(calls)])
+        by_id = {reply.get('id'): reply for reply in replies}
+        results = []
+        for i, (method, _) in enumerate(calls):
+            reply = by_id[first + i]
+            if 'error' in reply:
+                raise IOError('{} failed: {}'.format(method, reply['error']))
+            results.append(reply['result'])
+        return results
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+class PoolMonitor(object):
+    """ Changed pools of the exchanges of factories, polled concurrently. """
+
+    def __init__(self, client, factories=(), exchanges=None, batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE,
+                 interval=INTERVAL):
+        self.client = client
+        self.factories = ['0x' + utils.encode_hex(utils.normalize_address(f)) for f in factories]
+        self.listed = dict.fromkeys(self.factories, 0)
+        # exchange -> token, both 0x strings
+        self.exchanges = {}
+        for exchange, token in (exchanges or {}).items():
+            self.exchanges['0x' + utils.encode_hex(utils.normalize_address(exchange))] = \
+                '0x' + utils.encode_hex(utils.normalize_address(token))
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        # created by the first poll or consumer, in the loop that runs them
+        self.queue = None
+        self.interval = interval
+        self.pools = {}
+        self.block = None
+        self.polls = 0
+        self.poll_times = []
+        self.lags = []
+
+    async def _calls(self, calls, block):
+        """ Results of eth_calls (to, data) against block, in batches sent concurrently. """
+        chunks = [calls[i:i + self.batch_size] for i in range(0, len(calls), self.batch_size)]
+        results = await asyncio.gather(*[self.client.batch(
+            [('eth_call', [{'to': to, 'data': data}, block]) for to, data in chunk]) for chunk in chunks])
+        return [int(result, 16) for chunk in results for result in chunk]
+
+    async def discover(self, block='latest'):
+        """ Add the exchanges listed since the last discovery, return how many were added. """
+        counts = await self._calls([(factory, selector('getExchangeCount()')) for factory in self.factories], block)
+        calls, listings = [], []
+        for factory, count in zip(self.factories, counts):
+            for i in range(self.listed[factory], count):
+                calls.append((factory, selector('tokenList(uint256)') + '{:064x}'.format(i)))
+                listings.append(factory)
+        tokens = ['0x{:040x}'.format(token) for token in await self._calls(calls, block)]
+        exchanges = await self._calls([(factory, selector('tokenToExchangeLookup(address)') + _word(token))
+                                       for factory, token in zip(listings, tokens)], block)
+        for token, exchange in zip(tokens, exchanges):
+            self.exchanges['0x{:040x}'.format(exchange)] = token
+        # only once the listings are recorded, a failed lookup reads them again next time
+        self.listed.update(zip(self.factories, counts))
+        return len(tokens)
+
+    async def poll(self):
+        """ Read every pool if the head moved and queue the changed ones, return how many changed. """
+        head = int(await self.client.call('eth_blockNumber'), 16)
+        if head == self.block:
+            return 0
+        observed = time.time()
+        block = hex(head)
+        if self.factories:
+            await self.discover(block)
+        exchanges = sorted(self.exchanges)
+        values = await self._calls([(exchange, selector(getter + '()'))
+                                    for exchange in exchanges for getter in POOL_GETTERS], block)
+        self.block = head
+        self.polls += 1
+        self.poll_times.append(time.time() - observed)
+        changed = 0
+        for i, exchange in enumerate(exchanges):
+            pools = tuple(values[3 * i:3 * i + 3])
+            if self.pools.get(exchange) != pools:
+                self.pools[exchange] = pools
+                changed += 1
+                # waits while the queue is full, which holds back the next poll
+                await self._queue().put(Update(head, exchange, self.exchanges[exchange], *pools, observed=observed))
+        return changed
+
+    async def run(self, polls=None):
+        """ Poll every interval seconds, polls times or forever. """
+        done = 0
+        while polls is None or done < polls:
+            started = time.time()
+            await self.poll()
+            done += 1
+            await asyncio.sleep(max(0, self.interval - (time.time() - started)))
+
+    def _queue(self):
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.queue_size)
+        return self.queue
+
+    def queued(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def next_update(self):
+        """ Next changed pool, waiting for one if needed. """
+        update = await self._queue().get()
+        self.lags.append(time.time() - update.observed)
+        return update
+
+    def metrics(self):
+        return {
+            'block': self.block,
+            'exchanges': len(self.exchanges),
+            'polls': self.polls,
+            'requests': self.client.requests,
+            'poll_ms': latency_stats(self.poll_times),
+            'updates': len(self.lags),
+            'lag_ms': latency_stats(self.lags),
+            'queued': self.queued(),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Print the pools of every exchange of a factory as they change')
+    parser.add_argument('--rpc', default='http://127.0.0.1:8545')
+    parser.add_argument('--factory', action='append', required=True)
+    parser.add_argument('--interval', type=float, default=INTERVAL)
+    parser.add_argument('--connections', type=int, default=CONNECTIONS)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--polls', type=int, help='stop after this many polls')
+    args = parser.parse_args(argv)
+    client = RpcClient(args.rpc, args.connections)
+    monitor = PoolMonitor(client, args.factory, batch_size=args.batch_size, interval=args.interval)
+
+    async def consume():
+        while True:
+            update = await monitor.next_update()
+            sys.stdout.write('block {} exchange {} eth {} tokens {} shares {}\n'.format(
+                update.block, update.exchange, update.eth_pool, update.token_pool, update.total_shares))
+
+    async def watch():
+        consumer = get_running_loop().create_task(consume())
+        try:
+            await monitor.run(args.polls)
+            while monitor.queued():
+                await asyncio.sleep(0.01)
+        finally:
+            consumer.cancel()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(watch())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+        loop.close()
+        sys.stdout.write('{}\n'.format(json.dumps(monitor.metrics(), sort_keys=True)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,527 @@
+"""
+    Local JSON-RPC node serving a tester.Chain to web3 clients.
+
+    The chain holds the factory and its exchanges with funded pools (the
+    setup of uniswap.load), and the tester accounts plus the load accounts
+    are unlocked for eth_sendTransaction. Transactions are mined one per
+    block unless automine is off, then evm_mine seals the pending block.
+    Failed transactions are mined with status 0x0 like on a live node.
+
+    HTTP/1.1 connections are kept alive and every connection is served by
+    its own thread. JSON-RPC batches are answered in one response. The
+    chain is not thread safe, so requests are applied one at a time under
+    a lock; what concurrency buys is overlapping the HTTP and JSON work.
+
+    eth_call results are cached by (block hash, call), so repeated reads of
+    a mined block skip the EVM. Calls against 'pending' are never cached.
+    eth_getLogs regenerates the logs of a block once (pyethereum does not
+    store receipts) and caches them by block hash as well.
+
+    run with:   python -m uniswap.node --port 8545 --exchanges 2
+    measure:    python -m uniswap.node --bench 20000 --clients 8 --batch 10
+"""
+
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse
+import rlp
+from ethereum.tools import tester
+from ethereum.exceptions import InvalidTransaction
+from ethereum.messages import apply_message, apply_transaction
+from ethereum.transactions import Transaction
+from ethereum import utils
+from uniswap.deploy import FACTORIES
+from uniswap.indexer import ChainSource
+from uniswap.load import LoadGenerator, latency_stats
+
+CHAIN_ID = 1
+CALL_CACHE = 100000
+LOG_CACHE = 1000
+CALL_GAS = 10**7
+CLIENT_VERSION = 'uniswap-node/0.1'
+BENCH_CLIENTS = 4
+
+PARSE_ERROR, INVALID_REQUEST, METHOD_NOT_FOUND, INVALID_PARAMS, SERVER_ERROR = -32700, -32600, -32601, -32602, -32000
+
+METHODS = (
+    'web3_clientVersion', 'net_version', 'eth_chainId', 'eth_accounts', 'eth_gasPrice', 'eth_blockNumber',
+    'eth_getBlockByNumber', 'eth_getBlockByHash', 'eth_getBalance', 'eth_getCode', 'eth_getTransactionCount',
+    'eth_call', 'eth_estimateGas', 'eth_sendTransaction', 'eth_sendRawTransaction', 'eth_getTransactionReceipt',
+    'eth_getLogs', 'evm_mine',
+)
+
+
+class RpcError(Exception):
+
+    def __init__(self, code, message):
+        super(RpcError, self).__init__(message)
+        self.code = code
+        self.message = message
+
+
+def quantity(value):
+    return hex(value)
+
+
+def data(value):
+    return '0x' + utils.encode_hex(value)
+
+
+def _int(value, name='value'):
+    try:
+        return value if isinstance(value, int) else int(value, 16)
+    except (TypeError, ValueError):
+        raise RpcError(INVALID_PARAMS, 'invalid {}: {!r}'.format(name, value))
+
+
+def _bytes(value, name='data'):
+    try:
+        return utils.decode_hex(value[2:] if value.startswith('0x') else value)
+    except (AttributeError, TypeError, ValueError):
+        raise RpcError(INVALID_PARAMS, 'invalid {}: {!r}'.format(name, value))
+
+
+def _address(value, name='address'):
+    address = _bytes(value, name)
+    if len(address) != 20:
+        raise RpcError(INVALID_PARAMS, 'invalid {}: {!r}'.format(name, value))
+    return address
+
+
+def _topic(value):
+    return '0x{:064x}'.format(value)
+
+
+class Node(object):
+    """ JSON-RPC methods over one tester.Chain. """
+
+    def __init__(self, chain, keys=tester.keys, automine=True, call_cache=CALL_CACHE):
+        self.chain = chain
+        self.keys = {utils.privtoaddr(key): key for key in keys}
+        self.automine = automine
+        self.lock = threading.RLock()
+        self.source = ChainSource(chain)
+        self.calls = OrderedDict()
+        self.call_cache = call_cache
+        self.cache_hits = 0
+        self.logs = OrderedDict()
+        self.blocks = OrderedDict()
+        self.receipts = {}
+        self.pending = []
+
+    # dispatch
+
+    def handle(self, body):
+        """ Response body of one request body, a single request or a batch. """
+        try:
+            request = json.loads(body.decode() if isinstance(body, bytes) else body)
+        except ValueError:
+            return json.dumps(self._error(None, PARSE_ERROR, 'parse error'))
+        if isinstance(request, list):
+            if not request:
+                return json.dumps(self._error(None, INVALID_REQUEST, 'empty batch'))
+            return json.dumps([self.handle_one(r) for r in request])
+        return json.dumps(self.handle_one(request))
+
+    def handle_one(self, request):
+        if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+            return self._error(None, INVALID_REQUEST, 'invalid request')
+        request_id, method, params = request.get('id'), request['method'], request.get('params') or []
+        if method not in METHODS:
+            return self._error(request_id, METHOD_NOT_FOUND, 'method {} not found'.format(method))
+        try:
+            with self.lock:
+                result = getattr(self, method)(*params)
+        except RpcError as e:
+            return self._error(request_id, e.code, e.message)
+        except TypeError as e:
+            return self._error(request_id, INVALID_PARAMS, str(e))
+        except Exception as e:
+            # the connection stays usable for the client's next request
+            return self._error(request_id, SERVER_ERROR, '{}: {}'.format(type(e).__name__, e))
+        return {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+
+    @staticmethod
+    def _error(request_id, code, message):
+        return {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': code, 'message': message}}
+
+    # blocks and state
+
+    def _get_block(self, block_hash):
+        # pyethereum decodes the block from its RLP on every lookup, the head included
+        if block_hash not in self.blocks:
+            block = self.chain.chain.get_block(block_hash)
+            if block is None:
+                return None
+            self.blocks[block_hash] = block
+            if len(self.blocks) > LOG_CACHE:
+                self.blocks.popitem(last=False)
+        return self.blocks[block_hash]
+
+    def _head(self):
+        return self._get_block(self.chain.chain.head_hash)
+
+    def _block(self, tag='latest'):
+        """ Mined block of a tag, None for 'pending'. """
+        chain = self.chain.chain
+        if tag == 'pending':
+            return None
+        if tag == 'latest':
+            return self._head()
+        number = 0 if tag == 'earliest' else _int(tag, 'block')
+        block = None
+        if number <= self._head().header.number:
+            block = self._get_block(chain.get_blockhash_by_number(number))
+        if block is None:
+            raise RpcError(INVALID_PARAMS, 'unknown block {}'.format(tag))
+        return block
+
+    def _state(self, block):
+        if block is None:
+            self.chain.head_state.commit()
+            return self.chain.head_state.ephemeral_clone()
+        return self.chain.chain.mk_poststate_of_blockhash(block.header.hash).ephemeral_clone()
+
+    def _transaction(self, tx, block, index):
+        return {
+            'hash': data(tx.hash), 'nonce': quantity(tx.nonce), 'blockHash': data(block.header.hash),
+            'blockNumber': quantity(block.header.number), 'transactionIndex': quantity(index),
+            'from': data(tx.sender), 'to': data(tx.to) if tx.to else None, 'value': quantity(tx.value),
+            'gas': quantity(tx.startgas), 'gasPrice': quantity(tx.gasprice), 'input': data(tx.data),
+            'v': quantity(tx.v), 'r': quantity(tx.r), 's': quantity(tx.s),
+        }
+
+    def _block_json(self, block, full):
+        header = block.header
+        return {
+            'number': quantity(header.number), 'hash': data(header.hash), 'parentHash': data(header.prevhash),
+            'nonce': data(header.nonce), 'mixHash': data(header.mixhash), 'sha3Uncles': data(header.uncles_hash),
+            'logsBloom': data(header.bloom.to_bytes(256, 'big')), 'transactionsRoot': data(header.tx_list_root),
+            'stateRoot': data(header.state_root), 'receiptsRoot': data(header.receipts_root),
+            'miner': data(header.coinbase), 'difficulty': quantity(header.difficulty),
+            'extraData': data(header.extra_data), 'size': quantity(len(rlp.encode(block))),
+            'gasLimit': quantity(header.gas_limit), 'gasUsed': quantity(header.gas_used),
+            'timestamp': quantity(header.timestamp), 'uncles': [],
+            'transactions': [self._transaction(tx, block, i) if full else data(tx.hash)
+                             for i, tx in enumerate(block.transactions)],
+        }
+
+    def web3_clientVersion(self):
+        return CLIENT_VERSION
+
+    def net_version(self):
+        return str(CHAIN_ID)
+
+    def eth_chainId(self):
+        return quantity(CHAIN_ID)
+
+    def eth_accounts(self):
+        return [data(address) for address in sorted(self.keys)]
+
+    def eth_gasPrice(self):
+        return quantity(tester.GASPRICE)
+
+    def eth_blockNumber(self):
+        return quantity(self._head().header.number)
+
+    def eth_getBlockByNumber(self, tag, full=False):
+        try:
+            block = self._block(tag)
+        except RpcError:
+            return None
+        return self._block_json(block or self._head(), full)
+
+    def eth_getBlockByHash(self, block_hash, full=False):
+        block = self._get_block(_bytes(block_hash, 'block hash'))
+        return self._block_json(block, full) if block else None
+
+    def eth_getBalance(self, address, tag='latest'):
+        return quantity(self._state(self._block(tag)).get_balance(_address(address)))
+
+    def eth_getCode(self, address, tag='latest'):
+        return data(self._state(self._block(tag)).get_code(_address(address)))
+
+    def eth_getTransactionCount(self, address, tag='latest'):
+        return quantity(self._state(self._block(tag)).get_nonce(_address(address)))
+
+    # calls
+
+    def _message(self, call):
+        sender = _address(call['from'], 'from') if call.get('from') else b'\x00' * 20
+        to = _address(call['to'], 'to') if call.get('to') else b''
+        return (sender, to, _int(call.get('value', 0)), _bytes(call.get('data', call.get('input', '0x'))),
+                _int(call.get('gas', CALL_GAS), 'gas'))
+
+    def eth_call(self, call, tag='latest'):
+        block = self._block(tag)
+        message = self._message(call)
+        key = (block.header.hash, message) if block is not None else None
+        if key in self.calls:
+            self.cache_hits += 1
+            self.calls.move_to_end(key)
+            return self.calls[key]
+        sender, to, value, calldata, gas = message
+        output = apply_message(self._state(block), sender=sender, to=to, code_address=to, value=value,
+                               data=calldata, gas=gas)
+        if output is None:
+            raise RpcError(SERVER_ERROR, 'execution reverted')
+        result = data(output)
+        if key is not None:
+            self.calls[key] = result
+            if len(self.calls) > self.call_cache:
+                self.calls.popitem(last=False)
+        return result
+
+    def eth_estimateGas(self, call, tag='pending'):
+        sender, to, value, calldata, gas = self._message(call)
+        state = self._state(self._block(tag))
+        gas = min(_int(call['gas'], 'gas'), state.gas_limit) if call.get('gas') else state.gas_limit
+        # signed by any key for the checks on the signature, then attributed to the caller
+        tx = Transaction(state.get_nonce(sender), 0, gas, to, value, calldata).sign(tester.k0)
+        tx.sender = sender
+        used = state.gas_used
+        success, _ = apply_transaction(state, tx)
+        if not success:
+            raise RpcError(SERVER_ERROR, 'execution reverted')
+        return quantity(state.gas_used - used)
+
+    # transactions
+
+    def _send(self, tx):
+        head_state = self.chain.head_state
+        logs_before = sum(len(r.logs) for r in head_state.receipts)
+        try:
+            self.chain.direct_tx(tx)
+            status = 1
+        except tester.TransactionFailed:
+            status = 0
+        except InvalidTransaction as e:
+            # rejected before execution (nonce, balance, gas limit), not part of the block
+            raise RpcError(SERVER_ERROR, 'invalid transaction: {}'.format(e))
+        receipts = head_state.receipts
+        gas_used = receipts[-1].gas_used - (receipts[-2].gas_used if len(receipts) > 1 else 0)
+        index = len(receipts) - 1
+        self.pending.append({
+            'transactionHash': data(tx.hash), 'transactionIndex': quantity(index),
+            'from': data(tx.sender), 'to': data(tx.to) if tx.to else None,
+            'contractAddress': data(tx.creates) if tx.creates and status else None,
+            'cumulativeGasUsed': quantity(receipts[-1].gas_used), 'gasUsed': quantity(gas_used),
+            'status': quantity(status),
+            'logs': [{'address': data(log.address), 'topics': [_topic(t) for t in log.topics],
+                      'data': data(log.data), 'transactionHash': data(tx.hash),
+                      'transactionIndex': quantity(index), 'logIndex': quantity(logs_before + i), 'removed': False}
+                     for i, log in enumerate(receipts[-1].logs)],
+        })
+        if self.automine:
+            self.evm_mine()
+        return data(tx.hash)
+
+    def eth_sendTransaction(self, tx):
+        sender = _address(tx.get('from', ''), 'from')
+        if sender not in self.keys:
+            raise RpcError(SERVER_ERROR, 'account {} is not unlocked'.format(tx.get('from')))
+        _, to, value, calldata, gas = self._message(dict(tx, gas=tx.get('gas', hex(tester.STARTGAS))))
+        nonce = _int(tx['nonce'], 'nonce') if 'nonce' in tx else self.chain.head_state.get_nonce(sender)
+        gasprice = _int(tx.get('gasPrice', tester.GASPRICE), 'gasPrice')
+        return self._send(Transaction(nonce, gasprice, gas, to, value, calldata).sign(self.keys[sender]))
+
+    def eth_sendRawTransaction(self, raw):
+        try:
+            tx = rlp.decode(_bytes(raw, 'transaction'), Transaction)
+        except (rlp.DecodingError, rlp.DeserializationError) as e:
+            raise RpcError(INVALID_PARAMS, 'invalid transaction: {}'.format(e))
+        return self._send(tx)
+
+    def evm_mine(self):
+        block = self.chain.mine()
+        for receipt in self.pending:
+            receipt['blockHash'], receipt['blockNumber'] = data(block.header.hash), quantity(block.header.number)
+            for log in receipt['logs']:
+                log['blockHash'], log['blockNumber'] = receipt['blockHash'], receipt['blockNumber']
+            self.receipts[receipt['transactionHash']] = receipt
+        self.pending = []
+        return quantity(block.header.number)
+
+    def eth_getTransactionReceipt(self, tx_hash):
+        return self.receipts.get(tx_hash.lower())
+
+    # logs
+
+    def _block_logs(self, block):
+        key = block.header.hash
+        if not block.transactions:
+            # also keeps the genesis, which has no parent state, out of ChainSource
+            return []
+        if key not in self.logs:
+            self.logs[key] = [{
+                'address': data(address), 'topics': [_topic(t) for t in topics], 'data': data(log_data),
+                'blockNumber': quantity(block.header.number), 'blockHash': data(key),
+                'transactionHash': data(block.transactions[tx_index].hash),
+                'transactionIndex': quantity(tx_index), 'logIndex': quantity(log_index), 'removed': False,
+            } for tx_index, log_index, address, topics, log_data in self.source.logs(block.header.number)]
+            if len(self.logs) > LOG_CACHE:
+                self.logs.popitem(last=False)
+        return self.logs[key]
+
+    def eth_getLogs(self, query):
+        if query.get('blockHash'):
+            block = self._get_block(_bytes(query['blockHash'], 'blockHash'))
+            if block is None:
+                raise RpcError(INVALID_PARAMS, 'unknown block {}'.format(query['blockHash']))
+            blocks = [block]
+        else:
+            first = self._block(query.get('fromBlock', 'latest')) or self._head()
+            last = self._block(query.get('toBlock', 'latest')) or self._head()
+            blocks = [self._block(n) for n in range(first.header.number, last.header.number + 1)]
+        addresses = query.get('address')
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        addresses = set(a.lower() for a in addresses) if addresses else None
+        topics = [[t] if isinstance(t, str) else t for t in query.get('topics') or []]
+        topics = [set('0x{:064x}'.format(int(t, 16)) for t in options) if options else None for options in topics]
+        found = []
+        for block in blocks:
+            for log in self._block_logs(block):
+                if addresses is not None and log['address'] not in addresses:
+                    continue
+                if len(topics) > len(log['topics']) or any(
+                        options is not None and topic not in options for options, topic in zip(topics, log['topics'])):
+                    continue
+                found.append(log)
+        return found
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes, Nagle would hold the body for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        reply = self.server.node.handle(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, node, host='127.0.0.1', port=8545):
+        HTTPServer.__init__(self, (host, port), Handler)
+        self.node = node
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address[:2])
+
+
+def start(node, host='127.0.0.1', port=0):
+    """ Server running in a daemon thread, port 0 picks a free port. Stop it with shutdown(). """
+    server = Server(node, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_requests(exchanges):
+    """ Read-only requests a client issues while watching the pools. """
+    getters = [data(utils.sha3(name + '()')[:4]) for name in ('ethPool', 'tokenPool', 'totalShares')]
+    requests = [{'method': 'eth_blockNumber', 'params': []},
+                {'method': 'eth_getLogs', 'params': [{'fromBlock': 'latest', 'address': exchanges}]}]
+    for exchange in exchanges:
+        requests += [{'method': 'eth_call', 'params': [{'to': exchange, 'data': getter}, 'latest']}
+                     for getter in getters]
+    return requests
+
+
+def bench(url, requests, count, clients=BENCH_CLIENTS, batch=1):
+    """ Send count requests cycling through requests from concurrent keep-alive clients, return the report. """
+    parsed = urlparse(url)
+    per_client = -(-count // clients)
+    latencies, errors = [], []
+
+    def client(offset):
+        connection = http.client.HTTPConnection(parsed.hostname, parsed.port)
+        sent = 0
+        while sent < per_client:
+            size = min(batch, per_client - sent)
+            body = [dict(requests[(offset + sent + i) % len(requests)], jsonrpc='2.0', id=sent + i)
+                    for i in range(size)]
+            started = time.time()
+            connection.request('POST', parsed.path or '/', json.dumps(body if batch > 1 else body[0]),
+                               {'Content-Type': 'application/json'})
+            reply = json.loads(connection.getresponse().read().decode())
+            latencies.append(time.time() - started)
+            errors.extend(r for r in (reply if batch > 1 else [reply]) if 'error' in r)
+            sent += size
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(i * per_client,)) for i in range(clients)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.time() - started
+    sent = per_client * clients
+    return {
+        'requests': sent,
+        'http_requests': len(latencies),
+        'clients': clients,
+        'batch': batch,
+        'seconds': round(seconds, 3),
+        'requests_per_s': round(sent / max(seconds, 1e-9), 1),
+        'errors': len(errors),
+        'latency_ms': latency_stats(latencies),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a local chain with the exchanges deployed over JSON-RPC')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8545)
+    parser.add_argument('--exchanges', type=int, default=2, help='2 serves UNI and SWAP, more generates tokens')
+    parser.add_argument('--accounts', type=int, default=10, help='funded accounts besides the tester accounts')
+    parser.add_argument('--factory', default=FACTORIES[0], choices=FACTORIES)
+    parser.add_argument('--no-automine', action='store_true', help='leave transactions pending until evm_mine')
+    parser.add_argument('--bench', type=int, help='measure requests per second with this many requests and exit')
+    parser.add_argument('--clients', type=int, default=BENCH_CLIENTS)
+    parser.add_argument('--batch', type=int, default=1)
+    args = parser.parse_args(argv)
+    generator = LoadGenerator(args.exchanges, args.accounts, args.factory)
+    generator.setup()
+    node = Node(generator.chain, tester.keys + generator.keys, automine=not args.no_automine)
+    server = start(node, args.host, 0) if args.bench else Server(node, args.host, args.port)
+    sys.stdout.write('factory 0x{}\n'.format(utils.encode_hex(generator.world.factory.address)))
+    for token, exchange in zip(generator.tokens, generator.exchanges):
+        sys.stdout.write('token 0x{} exchange 0x{}\n'.format(utils.encode_hex(token), utils.encode_hex(exchange)))
+    if args.bench:
+        requests = bench_requests([data(e) for e in generator.exchanges])
+        report = bench(server.url, requests, args.bench, args.clients, args.batch)
+        server.shutdown()
+        sys.stdout.write('{requests} requests from {clients} clients, batches of {batch}: '
+                         '{requests_per_s:.1f} requests/s, {errors} errors\n'.format(**report))
+        sys.stdout.write('latency per HTTP request: {}\n'.format(report['latency_ms']))
+        return 1 if report['errors'] else 0
+    sys.stdout.write('listening on http://{}:{}\n'.format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
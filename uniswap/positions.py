@@ -0,0 +1,201 @@
+"""
+    Liquidity provider positions tracked from share events.
+
+    Every exchange keeps its providers and their shares as two columns.
+    Investment adds sharesPurchased to the provider, Divestment subtracts
+    sharesBurned. initializeExchange logs nothing of its own, its only trace
+    is the token Transfer from the provider into the exchange; a Transfer
+    into an exchange that holds no tracked shares, with no Investment or
+    TokenToEthPurchase of that exchange in the same transaction, is taken
+    as the initialization and credits INITIAL_SHARES to the sender.
+
+    Pools come from the indexer's state tables. A position redeems what
+    divestLiquidity would pay for all of its shares:
+
+        ethPerShare = ethPool / totalShares
+        tokensPerShare = tokenPool / totalShares
+        eth = ethPerShare * shares, tokens = tokensPerShare * shares
+
+    revalue() computes both per-share figures once per exchange and then
+    only multiplies the share column, so a portfolio of hundreds of
+    thousands of positions is valued in a fraction of a second. unattributed()
+    compares the tracked shares with totalShares, which only differ when a
+    Transfer was misread as an initialization or events were missed.
+
+    run with:   python -m uniswap.positions --rpc http://127.0.0.1:8545 --factory 0x... --index index/
+"""
+
+import argparse
+import sys
+import time
+from collections import namedtuple
+from ethereum import utils
+from uniswap import model
+from uniswap.indexer import Indexer, RpcSource
+
+Position = namedtuple('Position', 'exchange provider shares eth tokens value')
+Valuation = namedtuple('Valuation', 'providers shares eth tokens value')
+
+INVESTED = ('Investment',)
+DIVESTED = ('Divestment',)
+# exchange events that come with a Transfer of tokens into the exchange
+PULLS_TOKENS = ('Investment', 'TokenToEthPurchase')
+
+
+class Pool(object):
+    """ Pools and share columns of one exchange. """
+
+    __slots__ = ('eth_pool', 'token_pool', 'invariant', 'total_shares', 'providers', 'shares', 'index',
+                 'tracked')
+
+    def __init__(self):
+        self.eth_pool = self.token_pool = self.invariant = self.total_shares = 0
+        self.providers = []
+        self.shares = []
+        self.index = {}
+        self.tracked = 0
+
+    def add(self, provider, shares):
+        i = self.index.get(provider)
+        if i is None:
+            i = self.index[provider] = len(self.providers)
+            self.providers.append(provider)
+            self.shares.append(0)
+        self.shares[i] += shares
+        self.tracked += shares
+
+    def valuation(self):
+        """ Redemption value of every provider, with divestLiquidity's truncation. """
+        if self.total_shares == 0:
+            zeros = [0] * len(self.shares)
+            return Valuation(self.providers, self.shares, zeros, zeros, zeros)
+        eth_per_share = self.eth_pool // self.total_shares
+        tokens_per_share = self.token_pool // self.total_shares
+        eth = [s * eth_per_share for s in self.shares]
+        tokens = [s * tokens_per_share for s in self.shares]
+        if self.token_pool:
+            # tokens marked at the pool's marginal price, in wei
+            value = [e + t * self.eth_pool // self.token_pool for e, t in zip(eth, tokens)]
+        else:
+            value = eth
+        return Valuation(self.providers, self.shares, eth, tokens, value)
+
+
+class Portfolio(object):
+    """ Shares of every provider of every exchange, maintained from events. """
+
+    def __init__(self):
+        self.pools = {}
+        self.tokens = {}
+        self._pulled = set()
+
+    def pool(self, exchange):
+        exchange = utils.normalize_address(exchange)
+        if exchange not in self.pools:
+            self.pools[exchange] = Pool()
+        return self.pools[exchange]
+
+    def add_exchange(self, exchange, token):
+        self.pool(exchange)
+        self.tokens[utils.normalize_address(token)] = utils.normalize_address(exchange)
+
+    def invest(self, exchange, provider, shares):
+        self.pool(exchange).add(utils.normalize_address(provider), shares)
+
+    def divest(self, exchange, provider, shares):
+        self.pool(exchange).add(utils.normalize_address(provider), -shares)
+
+    def set_pools(self, exchange, eth_pool, token_pool, invariant, total_shares):
+        pool = self.pool(exchange)
+        pool.eth_pool, pool.token_pool, pool.invariant, pool.total_shares = \
+            eth_pool, token_pool, invariant, total_shares
+
+    def apply(self, event):
+        """ Update the shares with one indexer.Event. """
+        if event.name == 'ExchangeLaunch':
+            self.add_exchange(utils.int_to_addr(event.args[0]), utils.int_to_addr(event.args[1]))
+        elif event.name in INVESTED + DIVESTED:
+            shares = event.args[1] if event.name in INVESTED else -event.args[1]
+            self.pool(event.address).add(utils.int_to_addr(event.args[0]), shares)
+        if event.name in PULLS_TOKENS:
+            self._pulled.add((event.block, event.tx, event.address))
+        elif event.name == 'Transfer':
+            exchange = self.tokens.get(event.address)
+            if exchange is None or utils.int_to_addr(event.args[1]) != exchange:
+                return
+            pool = self.pool(exchange)
+            if (event.block, event.tx, exchange) not in self._pulled and pool.tracked == 0:
+                pool.add(utils.int_to_addr(event.args[0]), model.INITIAL_SHARES)
+
+    def follow(self, indexer, start=0, end=None):
+        """ Apply the indexed events of blocks start..end and read the pools of the exchanges they touched. """
+        end = indexer.indexed_block() if end is None else end
+        touched = set()
+        for event in indexer.iter_events(start, end):
+            self.apply(event)
+            if event.name != 'ExchangeLaunch':
+                touched.add(self.tokens.get(event.address, event.address))
+        for exchange in touched:
+            if exchange in self.pools:
+                self.set_pools(exchange, *indexer.state_at(exchange, end)[1:])
+        # events of earlier transactions are never seen again
+        self._pulled = set()
+        return end
+
+    @classmethod
+    def from_indexer(cls, indexer, block=None):
+        portfolio = cls()
+        portfolio.follow(indexer, 0, block)
+        return portfolio
+
+    def unattributed(self):
+        """ {exchange: totalShares - tracked shares} of the exchanges where they differ. """
+        return {exchange: pool.total_shares - pool.tracked for exchange, pool in self.pools.items()
+                if pool.total_shares != pool.tracked}
+
+    def revalue(self):
+        """ {exchange: Valuation} of every exchange, providers with no shares left included. """
+        return {exchange: pool.valuation() for exchange, pool in self.pools.items()}
+
+    def positions(self, provider=None):
+        """ Open Positions, of every provider or of one. """
+        provider = provider and utils.normalize_address(provider)
+        for exchange, valuation in sorted(self.revalue().items()):
+            for row in zip(*valuation):
+                if row[1] and (provider is None or row[0] == provider):
+                    yield Position(exchange, *row)
+
+    def totals(self):
+        """ {provider: (eth, value)} summed over every exchange. """
+        totals = {}
+        for valuation in self.revalue().values():
+            for provider, eth, value in zip(valuation.providers, valuation.eth, valuation.value):
+                held = totals.get(provider, (0, 0))
+                totals[provider] = (held[0] + eth, held[1] + value)
+        return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Value every liquidity provider position from an event index')
+    parser.add_argument('--rpc', default='http://127.0.0.1:8545')
+    parser.add_argument('--factory', action='append', required=True)
+    parser.add_argument('--index', default='index')
+    parser.add_argument('--provider', help='only list the positions of this address')
+    args = parser.parse_args(argv)
+    indexer = Indexer(args.index, RpcSource(args.rpc), args.factory)
+    indexer.run()
+    portfolio = Portfolio.from_indexer(indexer)
+    started = time.time()
+    positions = list(portfolio.positions(args.provider))
+    seconds = time.time() - started
+    for p in positions:
+        sys.stdout.write('0x{} 0x{} {:>24} shares {:>28} wei {:>28} tokens\n'.format(
+            utils.encode_hex(p.exchange), utils.encode_hex(p.provider), p.shares, p.eth, p.tokens))
+    for exchange, missing in sorted(portfolio.unattributed().items()):
+        sys.stdout.write('0x{}: {} shares not attributed to any provider\n'.format(utils.encode_hex(exchange), missing))
+    sys.stdout.write('{} positions valued in {:.3f}s\n'.format(len(positions), seconds))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,333 @@
+"""
+    Per-opcode profiler for transactions on a tester.Chain.
+
+    pyethereum's interpreter reports every step to the 'eth.vm.op' logger
+    when it is active at trace level. While a Profiler is entered, vm's
+    logger is replaced by a collector and vm.vm_execute is wrapped to see
+    every call frame start and end, no logging configuration is touched.
+
+    The gas of a step is the gas left before it minus the gas left before
+    the next step of the same frame, minus what child frames used, so
+    memory expansion and SSTORE/CALL dynamic costs land on their opcode.
+    Wall times are measured the same way. They include the interpreter's
+    own trace bookkeeping (stack and memory dumps), so compare them between
+    opcodes and lines rather than with untraced runs.
+
+    Runtime code is matched against the bin-runtime of the known contracts
+    and program counters are mapped to Solidity source ranges through
+    srcmap-runtime. solc drops the sourceList from --combined-json output,
+    the file indices are resolved like solc 0.4 numbers its sources: every
+    file compiled along, by unit name, sorted. All imports here are
+    relative to the contract's directory.
+
+    Folded stacks (one 'frame;frame;...;OPCODE weight' line per stack) are
+    the input format of flamegraph.pl and speedscope.
+
+    run with:   python -m uniswap.profiler tokenToTokenSwap --out swap.folded
+"""
+
+import argparse
+import bisect
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from ethereum import utils, vm
+from ethereum.tools import tester
+from uniswap import compiler, gas
+from uniswap.deploy import FACTORIES, build_world
+
+COMBINED = 'bin,abi,bin-runtime,srcmap-runtime'
+PROFILED = (
+    'Exchange/UniswapExchange.sol',
+    'Exchange/UniswapExchangeOptimized.sol',
+    'Exchange/UniswapFactory.sol',
+    'Exchange/UniswapFactoryOptimized.sol',
+    'Token/TestToken.sol',
+)
+CALL_OPS = ('CALL', 'CALLCODE', 'DELEGATECALL', 'STATICCALL', 'CREATE')
+SCOPE_RE = re.compile(rb'\b(contract|library|function|modifier)\b\s*(\w*)')
+
+
+def parse_srcmap(srcmap):
+    """ [(start, length, file index, jump)] per instruction, with solc's compression undone. """
+    entries = []
+    last = [-1, -1, -1, '-']
+    for item in srcmap.split(';'):
+        if item:
+            for i, field in enumerate(item.split(':')[:4]):
+                if field:
+                    last[i] = field if i == 3 else int(field)
+        entries.append(tuple(last))
+    return entries
+
+
+def instruction_offsets(code):
+    """ {pc: instruction index} of runtime bytecode. """
+    offsets = {}
+    pc = index = 0
+    while pc < len(code):
+        offsets[pc] = index
+        op = code[pc]
+        pc += 1 + (op - 0x5f if 0x60 <= op <= 0x7f else 0)
+        index += 1
+    return offsets
+
+
+def scopes(source):
+    """ [(start, end, 'Contract.function')] of every contract, function and modifier body in source. """
+    found = []
+    for match in SCOPE_RE.finditer(source):
+        open_brace = source.find(b'{', match.end())
+        semicolon = source.find(b';', match.end())
+        if open_brace < 0 or 0 <= semicolon < open_brace and match.group(1) in (b'function', b'modifier'):
+            # declaration without a body
+            continue
+        depth, end = 0, open_brace
+        while end < len(source):
+            depth += {b'{': 1, b'}': -1}.get(source[end:end + 1], 0)
+            if depth == 0:
+                break
+            end += 1
+        found.append((match.start(), end + 1, match.group(1).decode(), match.group(2).decode() or 'fallback'))
+    named = []
+    for start, end, kind, name in found:
+        if kind in ('contract', 'library'):
+            named.append((start, end, name))
+            continue
+        owner = [n for s, e, k, n in found if k in ('contract', 'library') and s <= start < e]
+        named.append((start, end, '{}.{}'.format(owner[-1], name) if owner else name))
+    return named
+
+
+class SourceFile(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.relpath(path, compiler.CONTRACTS_DIR)
+        with open(path, 'rb') as f:
+            self.source = f.read()
+        self.newlines = [i for i, c in enumerate(self.source) if c == 0x0a]
+        self.scopes = scopes(self.source)
+
+    def line(self, offset):
+        return bisect.bisect_left(self.newlines, offset) + 1
+
+    def scope(self, offset):
+        """ Innermost function, modifier or contract containing offset. """
+        best = None
+        for start, end, name in self.scopes:
+            if start <= offset < end and (best is None or start >= best[0]):
+                best = (start, name)
+        return best[1] if best else '?'
+
+
+class SourceMap(object):
+    """ Program counter to Solidity source location for the runtime code of one contract. """
+
+    def __init__(self, path, artifact=None):
+        artifact = artifact or compiler.compile_contract(path, combined=COMBINED)
+        self.name = os.path.basename(path).split('.')[0]
+        self.code = utils.decode_hex(artifact['bin-runtime'])
+        self.entries = parse_srcmap(artifact['srcmap-runtime'])
+        self.offsets = instruction_offsets(self.code)
+        abs_path = os.path.join(compiler.CONTRACTS_DIR, path)
+        directory = os.path.dirname(abs_path)
+        files = sorted(compiler.source_files(abs_path), key=lambda f: os.path.relpath(f, directory))
+        self.files = [SourceFile(f) for f in files]
+        self._locations = {}
+
+    def location(self, pc):
+        """ (file name, line, scope) of the instruction at pc, None outside the mapped code. """
+        if pc not in self._locations:
+            index = self.offsets.get(pc)
+            location = None
+            if index is not None and index < len(self.entries):
+                start, length, file_index, jump = self.entries[index]
+                if 0 <= file_index < len(self.files):
+                    source = self.files[file_index]
+                    location = (source.name, source.line(start), source.scope(start))
+            self._locations[pc] = location
+        return self._locations[pc]
+
+
+class Frame(object):
+
+    def __init__(self, label, source_map, gas_start):
+        self.label = label
+        self.source_map = source_map
+        self.gas_start = gas_start
+        self.last = None            # (op, pc, gas before, time)
+        self.child_gas = 0
+        self.child_time = 0.0
+
+    def where(self, pc):
+        location = self.source_map.location(pc) if self.source_map else None
+        if location is None:
+            return self.label
+        return '{}:{}'.format(self.label, location[2])
+
+
+class Stat(object):
+    __slots__ = ('count', 'gas', 'time')
+
+    def __init__(self):
+        self.count = 0
+        self.gas = 0
+        self.time = 0.0
+
+    def add(self, gas, seconds, count=1):
+        self.count += count
+        self.gas += gas
+        self.time += seconds
+
+
+class Profiler(object):
+    """ Opcode, source line, call frame and stack totals of the transactions run while entered. """
+
+    def __init__(self, paths=PROFILED, source_maps=None):
+        self.source_maps = {}
+        for source_map in (source_maps if source_maps is not None else [SourceMap(p) for p in paths]):
+            self.source_maps[source_map.code] = source_map
+        self.opcodes = defaultdict(Stat)
+        self.lines = defaultdict(Stat)
+        self.frames = defaultdict(Stat)
+        self.stacks = defaultdict(Stat)
+        self.label = 'tx'
+        self._frames = []
+        self._saved = None
+
+    def __enter__(self):
+        self._saved = (vm.vm_execute, vm.log_vm_op)
+        original = vm.vm_execute
+
+        def vm_execute(ext, msg, code):
+            return self._execute(original, ext, msg, code)
+        vm.vm_execute = vm_execute
+        vm.log_vm_op = self
+        return self
+
+    def __exit__(self, *exc):
+        vm.vm_execute, vm.log_vm_op = self._saved
+        self._frames = []
+
+    def profile(self, label, call):
+        """ Run call() with its steps recorded under label. """
+        self.label = label
+        try:
+            return call()
+        finally:
+            self.label = 'tx'
+
+    # the two methods vm_execute uses on its logger
+    def is_active(self, level_name='trace'):
+        return True
+
+    def trace(self, event, op=None, pc=None, gas=None, **kwargs):
+        now = time.perf_counter()
+        frame = self._frames[-1]
+        gas = int(gas)
+        self._close_step(frame, gas, now)
+        frame.last = (op, int(pc), gas, now)
+
+    def _close_step(self, frame, gas_left, now):
+        if frame.last is None:
+            return
+        op, pc, gas_before, started = frame.last
+        used = gas_before - gas_left - frame.child_gas
+        seconds = max(now - started - frame.child_time, 0.0)
+        frame.child_gas, frame.child_time = 0, 0.0
+        self.opcodes[op].add(used, seconds)
+        location = frame.source_map.location(pc) if frame.source_map else None
+        if location:
+            self.lines[location[:2]].add(used, seconds)
+        stack = [self.label] + [f.where(f.last[1]) for f in self._frames[:-1]] + [frame.where(pc), op]
+        self.stacks[';'.join(stack)].add(used, seconds)
+
+    def _execute(self, original, ext, msg, code):
+        source_map = self.source_maps.get(code)
+        label = source_map.name if source_map else '0x' + utils.encode_hex(msg.to)[:8]
+        frame = Frame(label, source_map, msg.gas)
+        self._frames.append(frame)
+        started = time.perf_counter()
+        try:
+            result = original(ext, msg, code)
+        except BaseException:
+            self._frames.pop()
+            raise
+        now = time.perf_counter()
+        self._close_step(frame, result[1], now)
+        self._frames.pop()
+        used = msg.gas - result[1]
+        seconds = now - started
+        self.frames[label].add(used, seconds)
+        if self._frames:
+            self._frames[-1].child_gas += used
+            self._frames[-1].child_time += seconds
+        return result
+
+    def folded(self, weight='gas'):
+        """ Folded stack lines, weighted by gas or by microseconds. """
+        lines = []
+        for stack, stat in sorted(self.stacks.items()):
+            value = stat.gas if weight == 'gas' else int(round(stat.time * 1e6))
+            if value > 0:
+                lines.append('{} {}'.format(stack, value))
+        return lines
+
+    def write_folded(self, path, weight='gas'):
+        with open(path, 'w') as f:
+            for line in self.folded(weight):
+                f.write(line + '\n')
+
+    def report(self, out=sys.stdout, top=25):
+        total_gas = sum(s.gas for s in self.opcodes.values()) or 1
+        out.write('{:<16} {:>9} {:>10} {:>7} {:>10}\n'.format('opcode', 'count', 'gas', 'gas %', 'ms'))
+        for op, stat in sorted(self.opcodes.items(), key=lambda item: -item[1].gas)[:top]:
+            out.write('{:<16} {:>9} {:>10} {:>7.1%} {:>10.3f}\n'.format(
+                op, stat.count, stat.gas, stat.gas / total_gas, stat.time * 1000))
+        out.write('\n{:<44} {:>9} {:>10} {:>10}\n'.format('source line', 'steps', 'gas', 'ms'))
+        for (name, line), stat in sorted(self.lines.items(), key=lambda item: -item[1].gas)[:top]:
+            out.write('{:<44} {:>9} {:>10} {:>10.3f}\n'.format(
+                '{}:{}'.format(name, line), stat.count, stat.gas, stat.time * 1000))
+        out.write('\n{:<44} {:>9} {:>10} {:>10}\n'.format('call frame', 'calls', 'gas', 'ms'))
+        for label, stat in sorted(self.frames.items(), key=lambda item: -item[1].gas):
+            out.write('{:<44} {:>9} {:>10} {:>10.3f}\n'.format(label, stat.count, stat.gas, stat.time * 1000))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Profile one exchange entry point opcode by opcode')
+    parser.add_argument('entry_point', help='e.g. tokenToTokenSwap, ethToTokenPayment, investLiquidity')
+    parser.add_argument('--pool', default='medium', choices=sorted(gas.POOLS))
+    parser.add_argument('--trade', default='small', choices=sorted(gas.TRADES))
+    parser.add_argument('--factory', default=FACTORIES[0], choices=FACTORIES)
+    parser.add_argument('--repeat', type=int, default=1, help='profile the call this many times')
+    parser.add_argument('--weight', default='gas', choices=('gas', 'time'))
+    parser.add_argument('--out', help='write folded stacks for flamegraph.pl here')
+    args = parser.parse_args(argv)
+    world = build_world(factory=args.factory)
+    gas.setup_pools(world, gas.POOLS[args.pool])
+    exchange = world.exchanges[0]
+    divisor = gas.TRADES[args.trade]
+    amounts = {'eth': exchange.ethPool() // divisor, 'tokens': exchange.tokenPool() // divisor}
+    entry_points = gas.entry_points(world)
+    if args.entry_point not in entry_points:
+        parser.error('unknown entry point {}, expected one of {}'.format(
+            args.entry_point, ', '.join(sorted(entry_points))))
+    if args.entry_point == 'divestLiquidity':
+        exchange.investLiquidity(1, value=amounts['eth'] * 2, sender=tester.keys[gas.REPEAT])
+        amounts['shares'] = exchange.getShares(tester.accounts[gas.REPEAT]) // (2 * args.repeat)
+    call = entry_points[args.entry_point]
+    with Profiler() as profiler:
+        for _ in range(args.repeat):
+            world.chain.mine()
+            profiler.profile(args.entry_point, lambda: call(amounts, gas.REPEAT))
+    profiler.report()
+    if args.out:
+        profiler.write_folded(args.out, args.weight)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""
+    Quote cache keyed by pool state.
+
+    A pool's quotes only depend on (ethPool, tokenPool, invariant), which
+    change far less often than quotes are asked for. A Curve holds one such
+    state and one direction ('eth' sells ETH for tokens, 'token' sells
+    tokens for ETH) and answers every size exactly with the exchange's own
+    formula,
+
+        fee = x / FEE_RATE
+        out = pool_out - invariant / (pool_in + x - fee)
+
+    with the same None where model.ExchangeState's quotes would revert. The
+    outputs are remembered, up to MAX_MEMO sizes per curve before the memo
+    starts over, so a size quoted again costs one dict lookup. The outputs
+    at a grid of trade sizes, the price-impact curve of the pool, are only
+    computed once a curve is inverted or its impact asked for. input_for()
+    inverts the curve: the grid brackets the smallest input reaching an
+    output and a binary search between the two grid points finds it to the
+    wei.
+
+    QuoteCache keeps the current curves of every exchange in a plain dict
+    keyed (exchange, direction), and the curves of the most recently used
+    states, least recently used first out. An event touching an exchange
+    (any indexer.Event) drops its current state and curves; the next quote
+    reads it again through the loader, and finds its curves still cached
+    if the pool came back to a state it had before.
+
+    run with:   python -m uniswap.quotes --quotes 1000000
+"""
+
+import argparse
+import bisect
+import random
+import sys
+import time
+from collections import OrderedDict
+from uniswap import model
+
+GRID = tuple(m * 10**k for k in range(3, 25) for m in (1, 2, 5))
+MAX_CURVES = 4096
+MAX_MEMO = 1024
+DIRECTIONS = ('eth', 'token')
+UNSEEN = object()
+
+
+class Curve(object):
+    """ Exact outputs of one pool state in one direction, precomputed on a grid of sizes. """
+
+    __slots__ = ('pool_in', 'pool_out', 'invariant', 'sizes', 'outputs', 'values', 'memo')
+
+    def __init__(self, eth_pool, token_pool, invariant, direction, sizes=GRID):
+        if direction == 'eth':
+            self.pool_in, self.pool_out = eth_pool, token_pool
+        else:
+            self.pool_in, self.pool_out = token_pool, eth_pool
+        self.invariant = invariant
+        self.sizes = sizes
+        self.outputs = self.values = None
+        self.memo = {}
+
+    def grid(self):
+        """ Outputs at every size of the grid, computed on the first inversion or impact curve. """
+        if self.outputs is None:
+            self.outputs = [self.output(x) for x in self.sizes]
+            # outputs grow with the input until the pool reverts, None counts as too small
+            self.values = [-1 if y is None else y for y in self.outputs]
+        return self.outputs
+
+    def _output(self, x):
+        # eth_to_token_quotes and token_to_eth_quotes of uniswap.model, min output 1
+        if x <= 0 or self.invariant == 0:
+            return None
+        new_in = self.pool_in + x
+        if new_in > model.MAX_UINT256:
+            return None
+        new_out = self.invariant // (new_in - x // model.FEE_RATE)
+        y = self.pool_out - new_out
+        return y if y >= 1 and new_in * new_out <= model.MAX_UINT256 else None
+
+    def output(self, x):
+        """ Exact output of selling x, None where the swap reverts. """
+        y = self.memo.get(x, UNSEEN)
+        if y is UNSEEN:
+            if len(self.memo) >= MAX_MEMO:
+                self.memo = {}
+            y = self.memo[x] = self._output(x)
+        return y
+
+    def input_for(self, y):
+        """ Smallest input whose output is at least y, None if no input reaches it. """
+        self.grid()
+        hi_index = bisect.bisect_left(self.values, y)
+        if hi_index == len(self.values):
+            lo, hi = self.sizes[-1], model.MAX_UINT256 - self.pool_in
+            if (self.output(hi) or -1) < y:
+                return None
+        else:
+            lo, hi = (self.sizes[hi_index - 1] if hi_index else 0), self.sizes[hi_index]
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if (self._output(mid) or -1) >= y:
+                hi = mid
+            else:
+                lo = mid
+        return hi
+
+    def impact(self):
+        """ [(size, output, price impact)] of the grid, impact against the marginal price before the fee. """
+        rows = []
+        for x, y in zip(self.sizes, self.grid()):
+            if y is not None:
+                rows.append((x, y, 1 - y * self.pool_in / (x * self.pool_out)))
+        return rows
+
+
+class QuoteCache(object):
+    """ Curves of recent pool states and the current state and curves of every exchange. """
+
+    def __init__(self, loader=None, max_curves=MAX_CURVES, sizes=GRID):
+        self.loader = loader
+        self.max_curves = max_curves
+        self.sizes = sizes
+        self.pools = {}
+        # (exchange, direction) -> Curve of the current state, the only lookup of a repeated quote
+        self.current = {}
+        self.curves = OrderedDict()
+        self.hits = self.misses = self.loads = 0
+
+    def update(self, exchange, eth_pool, token_pool, invariant, total_shares=None):
+        """ Current pools of exchange, e.g. from a snapshot or after an event. """
+        self.invalidate(exchange)
+        self.pools[exchange] = (eth_pool, token_pool, invariant)
+
+    def invalidate(self, exchange):
+        self.pools.pop(exchange, None)
+        for direction in DIRECTIONS:
+            self.current.pop((exchange, direction), None)
+
+    def apply(self, event):
+        """ Drop the state of the exchange an indexer.Event touched, launches and token events excluded. """
+        if event.name not in ('ExchangeLaunch', 'Transfer'):
+            self.invalidate(event.address)
+
+    def state(self, exchange):
+        state = self.pools.get(exchange)
+        if state is None:
+            if self.loader is None:
+                raise KeyError(exchange)
+            self.loads += 1
+            self.update(exchange, *self.loader(exchange))
+            state = self.pools[exchange]
+        return state
+
+    def curve(self, exchange, direction):
+        curve = self.current.get((exchange, direction))
+        if curve is not None:
+            return curve
+        # a state the exchange had before, or a new one
+        state = self.state(exchange)
+        key = state + (direction,)
+        curve = self.curves.get(key)
+        if curve is not None:
+            self.hits += 1
+            self.curves.move_to_end(key)
+        else:
+            self.misses += 1
+            curve = self.curves[key] = Curve(state[0], state[1], state[2], direction, self.sizes)
+            if len(self.curves) > self.max_curves:
+                self.curves.popitem(last=False)
+        self.current[(exchange, direction)] = curve
+        return curve
+
+    def eth_to_token(self, exchange, eth_in):
+        curve = self.current.get((exchange, 'eth')) or self.curve(exchange, 'eth')
+        return curve.output(eth_in)
+
+    def token_to_eth(self, exchange, tokens_in):
+        curve = self.current.get((exchange, 'token')) or self.curve(exchange, 'token')
+        return curve.output(tokens_in)
+
+    def token_to_token(self, exchange_in, exchange_out, tokens_in):
+        """ Same results as model.token_to_token_quotes. """
+        if exchange_in == exchange_out:
+            return None
+        eth = self.token_to_eth(exchange_in, tokens_in)
+        return None if eth is None else self.eth_to_token(exchange_out, eth)
+
+    def eth_to_token_input(self, exchange, tokens_out):
+        """ Smallest ETH input buying at least tokens_out. """
+        return self.curve(exchange, 'eth').input_for(tokens_out)
+
+    def token_to_eth_input(self, exchange, eth_out):
+        """ Smallest token input selling for at least eth_out. """
+        return self.curve(exchange, 'token').input_for(eth_out)
+
+
+def bench(quotes, exchanges=100, sizes=20, event_every=1000, seed=0):
+    """ Seconds model.ExchangeState and QuoteCache take for the same quotes, with a swap every event_every quotes.
+
+    Quotes pick a random exchange, direction and one of sizes amounts, the way a router keeps pricing the
+    same few trade sizes across the pools between blocks. Both sides must agree on every quote.
+    """
+    rng = random.Random(seed)
+    states = {}
+    for i in range(exchanges):
+        state = states[i.to_bytes(20, 'big')] = model.ExchangeState()
+        state.initialize('provider', rng.randint(10**17, 5*10**18), rng.randint(10**18, 10**24))
+    names = sorted(states)
+    amounts = [rng.choice(GRID[20:50]) + rng.randint(0, 10**15) for _ in range(sizes)]
+    requests = [(rng.choice(names), rng.choice(DIRECTIONS), rng.choice(amounts)) for _ in range(quotes)]
+    swaps = [(rng.choice(names), rng.randint(10**15, 10**17)) for _ in range(quotes // event_every + 1)]
+
+    def run(quote, swapped):
+        out = []
+        started = time.time()
+        for i, (exchange, direction, x) in enumerate(requests):
+            if i % event_every == 0:
+                exchange_swapped, eth_in = swaps[i // event_every]
+                states[exchange_swapped].eth_to_token(eth_in)
+                swapped(exchange_swapped)
+            out.append(quote(exchange, direction, x))
+        return time.time() - started, out
+
+    saved = {name: state.copy() for name, state in states.items()}
+
+    def model_quote(exchange, direction, x):
+        state = states[exchange]
+        return (state.eth_to_token_quotes if direction == 'eth' else state.token_to_eth_quotes)([x])[0]
+    model_seconds, expected = run(model_quote, lambda exchange: None)
+    states.update((name, state.copy()) for name, state in saved.items())
+    cache = QuoteCache(lambda exchange: states[exchange].pools())
+    quote = {'eth': cache.eth_to_token, 'token': cache.token_to_eth}
+    cache_seconds, out = run(lambda exchange, direction, x: quote[direction](exchange, x), cache.invalidate)
+    assert out == expected
+    return {
+        'quotes': quotes,
+        'model_s': round(model_seconds, 3),
+        'cache_s': round(cache_seconds, 3),
+        'speedup': round(model_seconds / max(cache_seconds, 1e-9), 2),
+        'loads': cache.loads,
+        'curves': cache.misses,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare cached quotes against model.ExchangeState quotes')
+    parser.add_argument('--quotes', type=int, default=10**6)
+    parser.add_argument('--exchanges', type=int, default=100)
+    parser.add_argument('--sizes', type=int, default=20, help='distinct trade sizes quoted')
+    parser.add_argument('--event-every', type=int, default=1000, help='quotes between two swaps')
+    args = parser.parse_args(argv)
+    report = bench(args.quotes, args.exchanges, args.sizes, args.event_every)
+    sys.stdout.write('{quotes} quotes: model {model_s}s, cache {cache_s}s, {speedup}x, '
+                     '{loads} loads, {curves} curves built\n'.format(**report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,439 @@
+"""
+    Replay of recorded trades and liquidity events, with checkpoints.
+
+    A TradeLog is a directory holding one fixed-width column per field, the
+    layout of the indexer's tables, 49 bytes a trade:
+
+        block       8   block the trade was recorded in, non-decreasing
+        kind        1   index in KINDS
+        pool        2   index of the exchange
+        target      2   exchange bought from by token_to_token
+        account     4   index of the trader
+        amount      16  ETH or tokens sold, ETH invested, shares divested
+        extra       16  tokens deposited by initialize
+
+    and header.json with the exchange and account addresses the indices
+    stand for, where they are known. Minimum outputs are not recorded, a
+    replayed trade goes through whenever the replayed pools allow it.
+    record() fills a log from an indexer: a token_to_token is the
+    TokenToEthPurchase / EthToTokenPurchase pair of one transaction, and
+    the ETH of investments and initializations, which no event carries,
+    is estimated from the pools the indexer read.
+
+    A Replayer applies the log block by block to a target, ModelTarget
+    (uniswap.model, any ExchangeState with the same interface) or
+    ChainTarget (fresh UniswapExchange deployments on a tester.Chain, one
+    mined block per recorded block, accounts funded as they first trade).
+    After every block the pools of the exchanges it touched are appended
+    to the series table. Every checkpoint_blocks blocks the target's
+    state, the log position and the series length are written to
+    checkpoints/<block>.json; a new Replayer on the same directory resumes
+    from the last one, and seek() goes back or forward to any block from
+    the closest checkpoint before it, keeping the series already written.
+
+    run with:   python -m uniswap.replay --synthetic 1000000 --log trades/ --out replay/ --target model
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from ethereum.state import State
+from ethereum.tools import tester
+from ethereum import utils
+from uniswap import model
+from uniswap.deploy import FACTORIES, load_world
+from uniswap.indexer import POOL_GETTERS, Table
+from uniswap.load import ACCOUNT_ETH, ACCOUNT_TOKENS, POOL_ETH, POOL_TOKENS, TX_GAS, generated_tokens
+
+KINDS = ('initialize', 'invest', 'divest', 'eth_to_token', 'token_to_eth', 'token_to_token')
+INITIALIZE, INVEST, DIVEST, ETH_TO_TOKEN, TOKEN_TO_ETH, TOKEN_TO_TOKEN = range(len(KINDS))
+TRADES = (('block', 8), ('kind', 1), ('pool', 2), ('target', 2), ('account', 4), ('amount', 16), ('extra', 16))
+SERIES = (('block', 8), ('pool', 2), ('eth_pool', 32), ('token_pool', 32), ('invariant', 32), ('total_shares', 32))
+CHECKPOINT_BLOCKS = 1000
+READ_ROWS = 65536
+
+
+def _write_json(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class TradeLog(object):
+    """ Recorded trades, appended in block order. """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.trades = Table(directory, TRADES)
+        self.exchanges, self.accounts = [], []
+        if os.path.exists(self._header_path()):
+            with open(self._header_path()) as f:
+                header = json.load(f)
+            self.exchanges, self.accounts = header['exchanges'], header['accounts']
+            # rows written after the header are not part of the log
+            self.trades.truncate(header['rows'])
+        self._exchange_index = {e: i for i, e in enumerate(self.exchanges)}
+        self._account_index = {a: i for i, a in enumerate(self.accounts)}
+
+    def _header_path(self):
+        return os.path.join(self.directory, 'header.json')
+
+    def __len__(self):
+        return len(self.trades)
+
+    def exchange(self, address):
+        """ Index of an exchange, registered on first use. """
+        i = self._exchange_index.get(address)
+        if i is None:
+            i = self._exchange_index[address] = len(self.exchanges)
+            self.exchanges.append(address)
+        return i
+
+    def account(self, address):
+        i = self._account_index.get(address)
+        if i is None:
+            i = self._account_index[address] = len(self.accounts)
+            self.accounts.append(address)
+        return i
+
+    def append(self, block, kind, pool, account, amount, extra=0, target=0):
+        """ One trade, exchanges and accounts as indices. """
+        self.trades.append(block, KINDS.index(kind) if isinstance(kind, str) else kind, pool, target, account,
+                           amount, extra)
+
+    def flush(self):
+        self.trades.flush()
+        _write_json(self._header_path(), {'exchanges': self.exchanges, 'accounts': self.accounts,
+                                          'rows': len(self.trades)})
+
+    def last_block(self):
+        return self.trades.read(len(self.trades) - 1)[0][0] if len(self.trades) else None
+
+    def blocks(self, row=0, rows=READ_ROWS):
+        """ (block, first row, [trades]) from row on, trades as (kind, pool, target, account, amount, extra). """
+        block, first, trades = None, row, []
+        for i, (number, *trade) in enumerate(self.trades.scan(row, rows=rows), row):
+            if number != block:
+                if trades:
+                    yield block, first, trades
+                block, first, trades = number, i, []
+            trades.append(trade)
+        if trades:
+            yield block, first, trades
+
+
+def record(indexer, log, start=0, end=None):
+    """ Append the trades of the indexed events of blocks start..end to log, return how many. """
+    appended = len(log)
+    initialized = set()
+    pending = None
+
+    def add(event, kind, pool, buyer, amount, extra=0, target=0):
+        log.append(event.block, kind, log.exchange('0x' + utils.encode_hex(pool)),
+                   log.account('0x' + utils.encode_hex(buyer)), amount, extra, target)
+
+    for event in indexer.iter_events(start, end):
+        if pending is not None and ((event.block, event.tx) != (pending.block, pending.tx) or
+                                    event.name == 'TokenToEthPurchase'):
+            add(pending, 'token_to_eth', pending.address, utils.int_to_addr(pending.args[0]), pending.args[1])
+            pending = None
+        if event.name == 'TokenToEthPurchase':
+            # the first leg of a token_to_token if an EthToTokenPurchase bought by this exchange follows
+            pending = event
+        elif event.name == 'EthToTokenPurchase':
+            buyer = utils.int_to_addr(event.args[0])
+            if pending is not None and buyer == pending.address:
+                add(pending, 'token_to_token', pending.address, utils.int_to_addr(pending.args[0]),
+                    pending.args[1], target=log.exchange('0x' + utils.encode_hex(event.address)))
+                pending = None
+            else:
+                add(event, 'eth_to_token', event.address, buyer, event.args[1])
+        elif event.name == 'Investment':
+            before = indexer.state_at(event.address, event.block - 1)
+            eth_per_share = before.eth_pool // before.total_shares if before.total_shares else 0
+            add(event, 'invest', event.address, utils.int_to_addr(event.args[0]), event.args[1] * eth_per_share)
+        elif event.name == 'Divestment':
+            add(event, 'divest', event.address, utils.int_to_addr(event.args[0]), event.args[1])
+        elif event.name == 'Transfer':
+            exchange = indexer.tokens.get(event.address)
+            if exchange is None or utils.int_to_addr(event.args[1]) != exchange or exchange in initialized:
+                continue
+            initialized.add(exchange)
+            if indexer.state_at(exchange, event.block - 1).total_shares:
+                continue
+            # the first tokens an exchange without shares receives come from initializeExchange
+            after = indexer.state_at(exchange, event.block)
+            add(event, 'initialize', exchange, utils.int_to_addr(event.args[0]), after.eth_pool, event.args[2])
+        if event.name in ('Investment', 'TokenToEthPurchase'):
+            # the tokens these pull come in after the exchange was initialized
+            initialized.add(event.address)
+    if pending is not None:
+        add(pending, 'token_to_eth', pending.address, utils.int_to_addr(pending.args[0]), pending.args[1])
+    log.flush()
+    return len(log) - appended
+
+
+def synthetic(log, trades, exchanges=10, accounts=1000, per_block=20, seed=0):
+    """ Append a random flow of trades to log, for benchmarks. Every pool is initialized first. """
+    rng = random.Random(seed)
+    block = (log.last_block() or 0) + 1
+    pools = [log.exchange('pool {}'.format(i)) for i in range(exchanges)]
+    traders = [log.account('trader {}'.format(i)) for i in range(accounts)]
+    provider = log.account('provider')
+    for pool in pools:
+        log.append(block, INITIALIZE, pool, provider, POOL_ETH, POOL_TOKENS)
+    weights = (1, 1, 4, 4, 2)
+    kinds = (INVEST, DIVEST, ETH_TO_TOKEN, TOKEN_TO_ETH, TOKEN_TO_TOKEN)
+    for i in range(trades):
+        if i % per_block == 0:
+            block += 1
+        kind = rng.choices(kinds, weights)[0]
+        pool, target = rng.sample(pools, 2) if exchanges > 1 else (pools[0], pools[0])
+        if kind == TOKEN_TO_TOKEN and exchanges < 2:
+            kind = TOKEN_TO_ETH
+        amount = rng.randint(1, 1000) * 10**15 if kind != DIVEST else rng.randint(1, 10)
+        log.append(block, kind, pool, rng.choice(traders), amount, target=target)
+    log.flush()
+
+
+class ModelTarget(object):
+    """ Exchanges as uniswap.model states, state_class may change the math. """
+
+    def __init__(self, exchanges, state_class=model.ExchangeState):
+        self.state_class = state_class
+        self.states = [state_class() for _ in range(exchanges)]
+
+    def apply(self, kind, pool, target, account, amount, extra):
+        """ Apply one trade, False if it reverts. """
+        state = self.states[pool]
+        try:
+            if kind == ETH_TO_TOKEN:
+                state.eth_to_token(amount)
+            elif kind == TOKEN_TO_ETH:
+                state.token_to_eth(amount)
+            elif kind == TOKEN_TO_TOKEN:
+                model.token_to_token(state, self.states[target], amount)
+            elif kind == INVEST:
+                state.invest(account, amount)
+            elif kind == DIVEST:
+                state.divest(account, amount)
+            else:
+                state.initialize(account, amount, extra)
+        except model.TransactionFailed:
+            return False
+        return True
+
+    def end_block(self):
+        pass
+
+    def pools(self, pool):
+        state = self.states[pool]
+        return state.eth_pool, state.token_pool, state.invariant, state.total_shares
+
+    def save(self):
+        return [[s.eth_pool, s.token_pool, s.invariant, s.total_shares, sorted(s.shares.items())]
+                for s in self.states]
+
+    def restore(self, data):
+        self.states = [self.state_class(eth_pool, token_pool, invariant, total_shares, dict(shares))
+                       for eth_pool, token_pool, invariant, total_shares, shares in data]
+
+
+class ChainTarget(object):
+    """ Fresh UniswapExchange deployments on a tester.Chain, one mined block per recorded block. """
+
+    def __init__(self, exchanges, factory=FACTORIES[0]):
+        world = load_world(tokens=generated_tokens(exchanges), factory=factory)
+        self.chain = world.chain
+        self.exchange_codec = world.exchanges[0].codec
+        self.token_codec = world.tokens[0].codec
+        self.exchanges = [utils.normalize_address(e.address) for e in world.exchanges]
+        self.tokens = [utils.normalize_address(t.address) for t in world.tokens]
+        self.keys = {}
+        self.chain.mine()
+
+    def key(self, account):
+        """ Key of a trader, funded with ETH, tokens and approvals the first time it trades. """
+        key = self.keys.get(account)
+        if key is None:
+            key = self.keys[account] = utils.sha3('uniswap replay account {}'.format(account))
+            address = utils.privtoaddr(key)
+            self._send(tester.k0, address, b'', ACCOUNT_ETH)
+            for token, exchange in zip(self.tokens, self.exchanges):
+                self._send(tester.k0, token, self.token_codec.encode('mint', [address, ACCOUNT_TOKENS]))
+                self._send(key, token, self.token_codec.encode('approve', [exchange, 2**256 - 1]))
+        return key
+
+    def _send(self, sender, to, data, value=0):
+        if self.chain.head_state.gas_used + TX_GAS > self.chain.head_state.gas_limit:
+            self.chain.mine()
+        self.chain.tx(sender=sender, to=to, value=value, data=data, startgas=TX_GAS)
+
+    def apply(self, kind, pool, target, account, amount, extra):
+        key = self.key(account)
+        encode = self.exchange_codec.encode
+        timeout = self.chain.head_state.timestamp + 300
+        value = 0
+        if kind == ETH_TO_TOKEN:
+            value, data = amount, encode('ethToTokenSwap', [1, timeout])
+        elif kind == TOKEN_TO_ETH:
+            data = encode('tokenToEthSwap', [amount, 1, timeout])
+        elif kind == TOKEN_TO_TOKEN:
+            data = encode('tokenToTokenSwap', [self.tokens[target], amount, 1, timeout])
+        elif kind == INVEST:
+            value, data = amount, encode('investLiquidity', [1])
+        elif kind == DIVEST:
+            data = encode('divestLiquidity', [amount, 0, 0])
+        else:
+            value, data = amount, encode('initializeExchange', [extra])
+        try:
+            self._send(key, self.exchanges[pool], data, value)
+        except tester.TransactionFailed:
+            return False
+        return True
+
+    def end_block(self):
+        self.chain.mine()
+
+    def pools(self, pool):
+        return tuple(utils.big_endian_to_int(self.chain.call(to=self.exchanges[pool], data=getter))
+                     for getter in POOL_GETTERS)
+
+    def save(self):
+        return {'state': self.chain.head_state.to_snapshot(), 'keys': sorted(self.keys)}
+
+    def restore(self, data):
+        self.chain = tester.Chain(genesis=State.from_snapshot(data['state'], tester.get_env(None)))
+        self.keys = {account: utils.sha3('uniswap replay account {}'.format(account)) for account in data['keys']}
+
+
+class Replayer(object):
+    """ Replay of a TradeLog onto a target, resumable from its checkpoints in directory. """
+
+    def __init__(self, log, directory, target, checkpoint_blocks=CHECKPOINT_BLOCKS):
+        self.log = log
+        self.directory = directory
+        self.target = target
+        self.checkpoint_blocks = checkpoint_blocks
+        self.series = Table(os.path.join(directory, 'series'), SERIES)
+        os.makedirs(self._checkpoints_dir(), exist_ok=True)
+        self.block, self.row, self.applied, self.reverted = -1, 0, 0, 0
+        self.series_block = -1
+        if self.checkpoints():
+            self.restore(self.checkpoints()[-1])
+        else:
+            self.series.truncate(0)
+            self.checkpoint()
+
+    def _checkpoints_dir(self):
+        return os.path.join(self.directory, 'checkpoints')
+
+    def checkpoints(self):
+        """ Blocks with a checkpoint, ascending. The replay starts from the one at block -1. """
+        return sorted(int(name[:-5]) for name in os.listdir(self._checkpoints_dir()) if name.endswith('.json'))
+
+    def checkpoint(self):
+        self.series.flush()
+        _write_json(os.path.join(self._checkpoints_dir(), '{}.json'.format(self.block)), {
+            'block': self.block, 'row': self.row, 'series': self.series.bisect(self.block),
+            'applied': self.applied, 'reverted': self.reverted, 'target': self.target.save(),
+        })
+
+    def restore(self, block, truncate=True):
+        """ Go back to the checkpoint at block, the series after it is dropped unless truncate is False. """
+        with open(os.path.join(self._checkpoints_dir(), '{}.json'.format(block))) as f:
+            data = json.load(f)
+        self.target.restore(data['target'])
+        self.block, self.row, self.applied, self.reverted = data['block'], data['row'], data['applied'], \
+            data['reverted']
+        if truncate:
+            self.series.truncate(data['series'])
+        last = len(self.series)
+        self.series_block = self.series.read(last - 1)[0][0] if last else -1
+
+    def run(self, until=None, out=None):
+        """ Replay every block up to until (the end of the log by default), return the last replayed block. """
+        started, rows = time.time(), self.row
+        since = 0
+        for block, first, trades in self.log.blocks(self.row):
+            if until is not None and block > until:
+                break
+            touched = set()
+            for trade in trades:
+                if self.target.apply(*trade):
+                    self.applied += 1
+                else:
+                    self.reverted += 1
+                touched.add(trade[1])
+                if trade[0] == TOKEN_TO_TOKEN:
+                    touched.add(trade[2])
+            self.target.end_block()
+            if block > self.series_block:
+                # blocks replayed again after a seek are in the series already
+                for pool in sorted(touched):
+                    self.series.append(block, pool, *self.target.pools(pool))
+                self.series_block = block
+            self.block, self.row = block, first + len(trades)
+            since += 1
+            if since >= self.checkpoint_blocks:
+                self.checkpoint()
+                since = 0
+                if out:
+                    out.write('block {}, {} trades ({:.0f} trades/s), {} reverted\n'.format(
+                        block, self.row, (self.row - rows) / max(time.time() - started, 1e-9), self.reverted))
+        if since:
+            self.checkpoint()
+        return self.block
+
+    def seek(self, block):
+        """ Replayed state right after block, from the closest checkpoint at or before it. """
+        self.restore(max(b for b in self.checkpoints() if b <= block), truncate=False)
+        return self.run(until=block)
+
+    def history(self, pool, start=0, end=None):
+        """ (block, ethPool, tokenPool, invariant, totalShares) of pool after every block in start..end. """
+        for number, index, *pools in self.series.scan():
+            if index == pool and number >= start and (end is None or number <= end):
+                yield (number,) + tuple(pools)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay recorded trades onto the model or fresh exchanges')
+    parser.add_argument('--log', default='trades')
+    parser.add_argument('--out', default='replay')
+    parser.add_argument('--target', default='model', choices=('model', 'chain'))
+    parser.add_argument('--factory', default=FACTORIES[0], choices=FACTORIES)
+    parser.add_argument('--synthetic', type=int, default=0, help='append this many random trades to the log first')
+    parser.add_argument('--exchanges', type=int, default=10)
+    parser.add_argument('--checkpoint-blocks', type=int, default=CHECKPOINT_BLOCKS)
+    parser.add_argument('--until', type=int)
+    args = parser.parse_args(argv)
+    log = TradeLog(args.log)
+    if args.synthetic:
+        synthetic(log, args.synthetic, args.exchanges)
+    exchanges = len(log.exchanges)
+    target = ModelTarget(exchanges) if args.target == 'model' else ChainTarget(exchanges, args.factory)
+    replayer = Replayer(log, args.out, target, args.checkpoint_blocks)
+    started, first = time.time(), replayer.row
+    block = replayer.run(args.until, sys.stdout)
+    seconds = time.time() - started
+    sys.stdout.write('replayed {} trades to block {} in {:.1f}s ({:.0f} trades/s), {} applied, {} reverted\n'.format(
+        replayer.row - first, block, seconds, (replayer.row - first) / max(seconds, 1e-9), replayer.applied,
+        replayer.reverted))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,275 @@
+"""
+    Rounding loss of the exchange math, swept over grids of pool states.
+
+    Every division of the exchange truncates, and the remainder it drops
+    is value that moves from one party to another:
+
+        swap    fee = in / FEE_RATE             the pool under-charges the trader
+                newOut = invariant / tempIn      the pool pays the trader more
+        invest  ethPerShare = ethPool / S        the investor pays less per share
+                shares = ethIn / ethPerShare     the investor's remainder is kept by the pool
+                tokensPerShare = tokenPool / S   the investor deposits fewer tokens
+        divest  ethPerShare, tokensPerShare      the divester is paid less
+
+    When the last shares are divested what the divester is short stays in
+    the exchange with no shares left to claim it, initializeExchange
+    overwrites the pools. The 1000 initial shares price a share at a
+    thousandth of the pool, so until the pool grows an investment loses up
+    to that much to the integer share count.
+
+    A loss is exactly the dropped remainder over its divisor; losses are
+    kept as integers of 10**-18 wei (ATTO), token amounts converted at the
+    pool's price before the operation. sweep() runs the three operations
+    over every pool state of the grids, share counts only where both pools
+    hold MIN_PER_SHARE per share as they do after initializeExchange, one
+    column of trade sizes or share counts at a time, spread over processes
+    by ETH pool, and sums a Tally
+    per (operation, truncation, loser, gainer), with the worst case and the
+    worst case relative to the value of the operation.
+
+    run with:   python -m uniswap.rounding --workers 8 --top 10
+"""
+
+import argparse
+import multiprocessing
+import random
+import sys
+import time
+from uniswap import model
+
+ATTO = 10**18
+
+
+def grid(low, high, mantissas=(1, 2, 5)):
+    """ m * 10**k for low <= k <= high. """
+    return tuple(m * 10**k for k in range(low, high + 1) for m in mantissas)
+
+
+def jittered(points, seed=0):
+    """ One value drawn from [p, next p) for every grid point p, round values divide without remainder. """
+    rng = random.Random(seed)
+    return tuple(rng.randrange(p, q) if q > p + 1 else p for p, q in zip(points, points[1:] + (2 * points[-1],)))
+
+
+# pools that have seen trades are never round, trades often are
+POOL_SIZES = jittered(grid(4, 24))
+TRADE_SIZES = tuple(sorted(set(grid(0, 24) + jittered(grid(0, 24), 1))))
+# the initial shares, then totals a few decades apart
+SHARE_COUNTS = (model.INITIAL_SHARES,) + jittered(tuple(model.INITIAL_SHARES * 10**k for k in range(1, 22, 3)), 2)
+# both pools hold at least this much per share after an initialization with the minimum deposits
+MIN_PER_SHARE = 10000 // model.INITIAL_SHARES
+# fractions of the shares burned by a divestment, 1 burns them all
+BURNED = (10**6, 1000, 100, 10, 2, 1)
+# the truncation every operation of a kind goes through
+COUNTED = {'eth_to_token': 'fee', 'token_to_eth': 'fee', 'invest': 'shares', 'divest': 'eth_per_share'}
+
+
+class Tally(object):
+    """ Losses of one truncation: count, total, worst, worst relative to the value of the operation. """
+
+    __slots__ = ('count', 'total', 'worst', 'worst_at', 'worst_share', 'worst_share_at')
+
+    def __init__(self):
+        self.count = self.total = self.worst = 0
+        self.worst_share = 0.0
+        self.worst_at = self.worst_share_at = None
+
+    def add(self, losses, values, at):
+        """ Columns of losses and operation values, at(i) the parameters of row i. """
+        self.count += len(losses)
+        self.total += sum(losses)
+        if not losses:
+            return
+        worst = max(losses)
+        if worst > self.worst:
+            self.worst, self.worst_at = worst, at(losses.index(worst))
+        shares = [loss / (value * ATTO) if value else 0.0 for loss, value in zip(losses, values)]
+        worst_share = max(shares)
+        if worst_share > self.worst_share:
+            self.worst_share, self.worst_share_at = worst_share, at(shares.index(worst_share))
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        if other.worst > self.worst:
+            self.worst, self.worst_at = other.worst, other.worst_at
+        if other.worst_share > self.worst_share:
+            self.worst_share, self.worst_share_at = other.worst_share, other.worst_share_at
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class Losses(object):
+    """ Tallies keyed by (operation, truncation, loser, gainer). """
+
+    def __init__(self):
+        self.tallies = {}
+
+    def tally(self, *key):
+        tally = self.tallies.get(key)
+        if tally is None:
+            tally = self.tallies[key] = Tally()
+        return tally
+
+    def merge(self, other):
+        for key, tally in other.tallies.items():
+            self.tally(*key).merge(tally)
+        return self
+
+    def rows(self):
+        """ [(key, tally)] with the largest total loss first. """
+        return sorted(self.tallies.items(), key=lambda item: (-item[1].total, item[0]))
+
+    def operations(self):
+        """ Number of operations swept, each counted on one of its truncations. """
+        return sum(tally.count for (operation, point, _, _), tally in self.tallies.items()
+                   if point == COUNTED[operation])
+
+    def by_loser(self):
+        """ {loser: total loss} over every truncation. """
+        totals = {}
+        for (_, _, loser, _), tally in self.tallies.items():
+            totals[loser] = totals.get(loser, 0) + tally.total
+        return totals
+
+
+def swap_losses(losses, eth_pool, token_pool, sizes, direction='eth'):
+    """ Tally the truncations of swaps of every size against one pool state, invariant = ethPool * tokenPool. """
+    invariant = eth_pool * token_pool
+    if direction == 'eth':
+        operation, pool_in, pool_out = 'eth_to_token', eth_pool, token_pool
+        in_wei, out_wei = (1, 1), (eth_pool, token_pool)
+    else:
+        operation, pool_in, pool_out = 'token_to_eth', token_pool, eth_pool
+        in_wei, out_wei = (eth_pool, token_pool), (1, 1)
+    temps = [pool_in + x - x // model.FEE_RATE for x in sizes]
+    # swaps whose output truncates to nothing revert
+    rows = [i for i, temp in enumerate(temps) if pool_out - invariant // temp >= 1]
+    xs = [sizes[i] for i in rows]
+    temps = [temps[i] for i in rows]
+    values = [x * in_wei[0] // in_wei[1] for x in xs]
+
+    def at(i):
+        return eth_pool, token_pool, xs[i]
+    fee = [(x % model.FEE_RATE) * ATTO * in_wei[0] // (model.FEE_RATE * in_wei[1]) for x in xs]
+    losses.tally(operation, 'fee', 'pool', 'trader').add(fee, values, at)
+    out = [(invariant % temp) * ATTO * out_wei[0] // (temp * out_wei[1]) for temp in temps]
+    losses.tally(operation, 'invariant', 'pool', 'trader').add(out, values, at)
+
+
+def invest_losses(losses, eth_pool, token_pool, total_shares, sizes):
+    """ Tally the truncations of investLiquidity of every ETH amount in sizes into one pool state. """
+    eth_per_share = eth_pool // total_shares
+    if eth_per_share == 0:
+        # investLiquidity divides by zero
+        return
+    eth_left = eth_pool % total_shares
+    tokens_left = token_pool % total_shares
+    xs = [x for x in sizes if x >= eth_per_share]
+    shares = [x // eth_per_share for x in xs]
+    values = [2 * x for x in xs]
+
+    def at(i):
+        return eth_pool, token_pool, total_shares, xs[i]
+    losses.tally('invest', 'eth_per_share', 'pool', 'investor').add(
+        [s * eth_left * ATTO // total_shares for s in shares], values, at)
+    losses.tally('invest', 'shares', 'investor', 'pool').add(
+        [(x % eth_per_share) * ATTO for x in xs], values, at)
+    losses.tally('invest', 'tokens_per_share', 'pool', 'investor').add(
+        [s * tokens_left * ATTO * eth_pool // (total_shares * token_pool) for s in shares], values, at)
+
+
+def divest_losses(losses, eth_pool, token_pool, total_shares, burned):
+    """ Tally the truncations of divestLiquidity of every share count in burned out of one pool state. """
+    eth_left = eth_pool % total_shares
+    tokens_left = token_pool % total_shares
+    # the shares left behind gain the remainders, after the last divestment nobody does
+    for gainer, counts in (('pool', [b for b in burned if b < total_shares]),
+                           ('stranded', [b for b in burned if b == total_shares])):
+        values = [2 * (b * eth_pool // total_shares) for b in counts]
+
+        def at(i):
+            return eth_pool, token_pool, total_shares, counts[i]
+        losses.tally('divest', 'eth_per_share', 'divester', gainer).add(
+            [b * eth_left * ATTO // total_shares for b in counts], values, at)
+        losses.tally('divest', 'tokens_per_share', 'divester', gainer).add(
+            [b * tokens_left * ATTO * eth_pool // (total_shares * token_pool) for b in counts], values, at)
+
+
+def sweep_eth_pool(args):
+    """ Losses of every operation on the pool states with one ETH pool. """
+    eth_pool, token_pools, trade_sizes, share_counts = args
+    losses = Losses()
+    for token_pool in token_pools:
+        swap_losses(losses, eth_pool, token_pool, trade_sizes, 'eth')
+        swap_losses(losses, eth_pool, token_pool, trade_sizes, 'token')
+        for total_shares in share_counts:
+            if min(eth_pool, token_pool) < total_shares * MIN_PER_SHARE:
+                continue
+            invest_losses(losses, eth_pool, token_pool, total_shares, trade_sizes)
+            burned = sorted({max(1, total_shares // d) for d in BURNED})
+            divest_losses(losses, eth_pool, token_pool, total_shares, burned)
+    return losses
+
+
+def sweep(eth_pools=POOL_SIZES, token_pools=POOL_SIZES, trade_sizes=TRADE_SIZES, share_counts=SHARE_COUNTS,
+          workers=1):
+    """ Losses over every (ethPool, tokenPool, size) and (ethPool, tokenPool, totalShares, size) of the grids. """
+    tasks = [(eth_pool, token_pools, trade_sizes, share_counts) for eth_pool in eth_pools]
+    losses = Losses()
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            for part in pool.imap_unordered(sweep_eth_pool, tasks):
+                losses.merge(part)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            losses.merge(sweep_eth_pool(task))
+    return losses
+
+
+def wei(atto):
+    return '{:.6g}'.format(atto / ATTO)
+
+
+def report(losses, top=10, out=sys.stdout):
+    out.write('{:<13} {:<17} {:<9} {:<9} {:>10} {:>14} {:>12} {:>14} {:>10}\n'.format(
+        'operation', 'truncation', 'loser', 'gainer', 'count', 'total wei', 'mean wei', 'worst wei', 'worst %'))
+    rows = losses.rows()
+    for (operation, point, loser, gainer), tally in rows:
+        out.write('{:<13} {:<17} {:<9} {:<9} {:>10} {:>14} {:>12} {:>14} {:>10.4g}\n'.format(
+            operation, point, loser, gainer, tally.count, wei(tally.total), wei(tally.mean()), wei(tally.worst),
+            100 * tally.worst_share))
+    out.write('\nworst cases, (ethPool, tokenPool[, totalShares], size):\n')
+    for (operation, point, loser, gainer), tally in sorted(rows, key=lambda row: -row[1].worst)[:top]:
+        out.write('{} {} {} loses {} wei at {}, {:.4g}% of the operation at {}\n'.format(
+            operation, point, loser, wei(tally.worst), tally.worst_at, 100 * tally.worst_share,
+            tally.worst_share_at))
+    out.write('\ntotal by loser:\n')
+    for loser, total in sorted(losses.by_loser().items(), key=lambda item: -item[1]):
+        out.write('    {:<9} {} wei\n'.format(loser, wei(total)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rounding loss of the exchange math over grids of pool states')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--mantissas', default='1,2,5', help='grid points per decade')
+    args = parser.parse_args(argv)
+    mantissas = tuple(int(m) for m in args.mantissas.split(','))
+    pools = jittered(grid(4, 24, mantissas))
+    sizes = tuple(sorted(set(grid(0, 24, mantissas) + jittered(grid(0, 24, mantissas), 1))))
+    started = time.time()
+    losses = sweep(pools, pools, sizes, SHARE_COUNTS, args.workers)
+    seconds = time.time() - started
+    report(losses, args.top)
+    sys.stdout.write('\n{} operations in {:.1f}s with {} workers\n'.format(losses.operations(), seconds, args.workers))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+    Token to token routing over every exchange registered in one or more factories.
+
+    A factory holds one exchange per token and tokenToTokenOut only hops
+    through the exchange the same factory lists for the purchased token, so
+    inside one factory the only route is token -> ETH -> token. Extra hops
+    through other tokens would only pay more fees. What is left to choose is
+    how to split an order between factories that list both tokens, e.g.
+    UniswapFactory and UniswapFactoryOptimized.
+
+    Quotes use uniswap.model, i.e. the contracts' fee and rounding rules to
+    the wei. Pool state comes from UniswapLens snapshots held as columns,
+    quote_all prices one input against every pool of a factory in one pass.
+    A single trade beats the same amount cut into sequential legs on one
+    exchange, so a split sends at most one tokenToTokenPayment per factory.
+"""
+
+import heapq
+from collections import namedtuple
+from uniswap import model
+from uniswap.lens import LensClient, Snapshot
+
+SPLIT_CHUNKS = 100
+
+Leg = namedtuple('Leg', 'factory exchange token_out tokens_in tokens_out')
+Call = namedtuple('Call', 'exchange function args')
+
+
+class Book(object):
+    """ Pool state of every exchange of one factory, one column per field. """
+
+    def __init__(self, snapshot):
+        self.tokens = list(snapshot.tokens)
+        self.exchanges = list(snapshot.exchanges)
+        self.eth_pool = list(snapshot.eth_pool)
+        self.token_pool = list(snapshot.token_pool)
+        self.invariant = list(snapshot.invariant)
+        self.total_shares = list(snapshot.total_shares)
+        self.index = {token: i for i, token in enumerate(self.tokens)}
+
+    @classmethod
+    def from_reserves(cls, pools, provider=b'\x00' * 20):
+        """ Book of [(token, exchange, eth_pool, token_pool)], each pool as initializeExchange leaves it. """
+        states = []
+        for _, _, eth_pool, token_pool in pools:
+            state = model.ExchangeState()
+            state.initialize(provider, eth_pool, token_pool)
+            states.append(state)
+        return cls(Snapshot(tuple(p[0] for p in pools), tuple(p[1] for p in pools),
+                            *[tuple(getattr(s, f) for s in states) for f in Snapshot._fields[2:]]))
+
+    def state(self, token):
+        i = self.index[token]
+        return model.ExchangeState(self.eth_pool[i], self.token_pool[i], self.invariant[i], self.total_shares[i])
+
+    def update(self, token, eth_pool, token_pool, invariant, total_shares):
+        i = self.index[token]
+        self.eth_pool[i], self.token_pool[i], self.invariant[i], self.total_shares[i] = \
+            eth_pool, token_pool, invariant, total_shares
+
+
+class Router(object):
+    """ Quotes and split orders across the books of several factories. """
+
+    def __init__(self, books):
+        self.books = books
+
+    @classmethod
+    def from_lens(cls, lens, factories, page_size=None):
+        books = {}
+        for factory in factories:
+            client = LensClient(lens, factory) if page_size is None else LensClient(lens, factory, page_size)
+            books[factory] = Book(client.snapshot())
+        return cls(books)
+
+    def routes(self, token_in, token_out):
+        """ Factories listing both tokens. """
+        return [factory for factory, book in sorted(self.books.items())
+                if token_in in book.index and token_out in book.index and token_in != token_out]
+
+    def quotes(self, factory, token_in, token_out, amounts):
+        """ Exact tokenToTokenSwap outputs of amounts through one factory, None where it reverts. """
+        book = self.books[factory]
+        return model.token_to_token_quotes(book.state(token_in), book.state(token_out), amounts)
+
+    def quote_all(self, factory, token_in, amount):
+        """ {token: output} of selling amount of token_in for every other token listed in factory. """
+        book = self.books[factory]
+        try:
+            eth_out = model.token_to_token_out(book.state(token_in), amount)[0] if amount > 0 else 0
+        except model.TransactionFailed:
+            eth_out = 0
+        quotes = {}
+        if eth_out <= 0:
+            return quotes
+        fee = eth_out // model.FEE_RATE
+        max_uint = model.MAX_UINT256
+        for token, E, T, I, S in zip(book.tokens, book.eth_pool, book.token_pool, book.invariant, book.total_shares):
+            if I == 0 or S == 0 or token == token_in:
+                continue
+            new_e = E + eth_out
+            new_t = I // (new_e - fee)
+            y = T - new_t
+            if y > 0 and new_e * new_t <= max_uint:
+                quotes[token] = y
+        return quotes
+
+    def best_split(self, token_in, token_out, amount, chunks=SPLIT_CHUNKS):
+        """ Legs maximizing the total output of amount, one per factory used.
+
+        The order is cut into chunks and every chunk goes to the route with
+        the largest exact marginal output. Outputs are concave in the input,
+        so this is optimal up to one chunk.
+        """
+        routes = self.routes(token_in, token_out)
+        if not routes or amount <= 0:
+            return []
+        chunks = max(1, min(chunks, amount))
+        chunk = amount // chunks
+        steps = [chunk * k for k in range(1, chunks + 1)]
+        curves = {f: [0] + [q or 0 for q in self.quotes(f, token_in, token_out, steps)] for f in routes}
+        allocated = dict.fromkeys(routes, 0)
+        heap = [(-curves[f][1], f) for f in routes]
+        heapq.heapify(heap)
+        for _ in range(chunks):
+            gain, factory = heapq.heappop(heap)
+            if gain >= 0:
+                # no route returns anything for another chunk
+                break
+            allocated[factory] += 1
+            k = allocated[factory]
+            if k < chunks:
+                heapq.heappush(heap, (-(curves[factory][k + 1] - curves[factory][k]), factory))
+        used = sorted((f for f in routes if allocated[f]), key=lambda f: -allocated[f])
+        if not used:
+            return []
+        amounts = {f: chunk * allocated[f] for f in used}
+        # the largest leg takes what is left of amount // chunks
+        amounts[used[0]] += amount - sum(amounts.values())
+        legs = []
+        for factory in used:
+            tokens_out = self.quotes(factory, token_in, token_out, [amounts[factory]])[0]
+            if tokens_out:
+                book = self.books[factory]
+                legs.append(Leg(factory, book.exchanges[book.index[token_in]], token_out, amounts[factory], tokens_out))
+        return legs
+
+    def quote(self, token_in, token_out, amount, chunks=SPLIT_CHUNKS):
+        """ Total output of the best split, 0 if no route fills the order. """
+        return sum(leg.tokens_out for leg in self.best_split(token_in, token_out, amount, chunks))
+
+
+def calls(legs, recipient, timeout, slippage=0):
+    """ tokenToTokenPayment calls executing legs, each with its own minimum output. """
+    out = []
+    for leg in legs:
+        min_out = max(1, leg.tokens_out - leg.tokens_out * int(slippage * 10**6) // 10**6)
+        out.append(Call(leg.exchange, 'tokenToTokenPayment',
+                        (leg.token_out, recipient, leg.tokens_in, min_out, timeout)))
+    return out
@@ -0,0 +1,252 @@
+"""
+    Scale benchmark of a factory listing tens of thousands of exchanges.
+
+    Deploying one TestToken per listing would cost more than the listings
+    themselves, so a single TestToken is deployed and its code and storage
+    are copied to synthetic addresses in the genesis of the benchmark chain,
+    the same way load_world() starts from a stored state. Every copy is a
+    working token owned by the deployer.
+
+    A block is mined whenever the next launch might not fit in it. After
+    every `step` listings the benchmark records the mean gas and wall time
+    of the launches since the previous checkpoint, and of both lookups on
+    randomly sampled listings. At the end tokenList is enumerated once
+    with one call per entry and once through UniswapLens. The first pools
+    are then initialized the way a provider would, with mint, approve and
+    initializeExchange per pool.
+
+    Gas figures are deterministic and compared against a baseline like
+    uniswap.gas does, wall times are only reported.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import sys
+import time
+from ethereum.tools import tester
+from ethereum.state import State
+from ethereum import utils
+from uniswap import gas
+from uniswap.abi import codec
+from uniswap.compiler import compile_contract
+from uniswap.deploy import ALLOC, FACTORIES, deploy_contract, variant_name
+from uniswap.lens import LensClient, deploy_lens
+
+REPORT_FORMAT = 1
+COUNT = 10000
+STEP = 1000
+SAMPLES = 20
+TOKEN_BASE = 0x100000
+LAUNCH_GAS = 3141592
+INIT_ETH = 10**15
+INIT_TOKENS = 2 * 10**15
+PROVIDER = 1
+LOOKUPS = ('tokenToExchangeLookup', 'exchangeToTokenLookup')
+
+
+def token_addresses(count):
+    return [utils.int_to_addr(TOKEN_BASE + i) for i in range(count)]
+
+
+def scale_chain(count, sender=tester.k0):
+    """ tester.Chain whose genesis holds count copies of one TestToken, plus their addresses. """
+    chain = tester.Chain(ALLOC)
+    template = deploy_contract(chain, 'Token/TestToken.sol', args=['Scale Token', 'SCALE', 18], sender=sender)
+    chain.mine()
+    snapshot = chain.head_state.to_snapshot()
+    account = snapshot['alloc'][utils.encode_hex(template.address)]
+    tokens = token_addresses(count)
+    for token in tokens:
+        snapshot['alloc'][utils.encode_hex(token)] = dict(account)
+    return tester.Chain(genesis=State.from_snapshot(snapshot, tester.get_env(None))), tokens
+
+
+def _send(chain, contract_codec, to, function, args, sender=tester.k0, value=0, startgas=None, with_tx=True):
+    """ Raw transaction, returns (decoded output, gas used, with the intrinsic gas unless with_tx is False). """
+    data = contract_codec.encode(function, args)
+    if startgas and chain.head_state.gas_used + startgas > chain.head_state.gas_limit:
+        chain.mine()
+    output = chain.tx(sender=sender, to=to, value=value, data=data, startgas=startgas or tester.STARTGAS)
+    return contract_codec.decode(function, output), chain.last_gas_used(with_tx=with_tx)
+
+
+def _ms(started, n=1):
+    return round((time.time() - started) * 1000.0 / max(n, 1), 3)
+
+
+def sample_lookups(chain, factory, tokens, exchanges, rng, samples=SAMPLES):
+    """ Mean gas and wall time of both lookups on samples random listings.
+
+    The gas excludes the intrinsic gas, which only depends on the zero bytes of the address looked up.
+    """
+    picks = [rng.randrange(len(tokens)) for _ in range(samples)]
+    row = {}
+    chain.mine()
+    snapshot = chain.snapshot()
+    for function, keys in zip(LOOKUPS, (tokens, exchanges)):
+        # gas comes from lookups sent as transactions, reverted afterwards
+        row[function] = sum(_send(chain, factory.codec, factory.address, function, [keys[i]],
+                                  startgas=100000, with_tx=False)[1] for i in picks) // samples
+    chain.revert(snapshot)
+    for function, keys in zip(LOOKUPS, (tokens, exchanges)):
+        started = time.time()
+        for i in picks:
+            getattr(factory, function)(keys[i])
+        row[function + '_ms'] = _ms(started, samples)
+    return row
+
+
+def launch(chain, factory, tokens, step=STEP, samples=SAMPLES, rng=None, out=None):
+    """ Launch one exchange per token, return (exchanges, launch rows, lookup rows). """
+    rng = rng or random.Random(0)
+    exchanges, launches, lookups = [], [], []
+    bucket_gas, bucket_started = [], time.time()
+    for token in tokens:
+        exchange, used = _send(chain, factory.codec, factory.address, 'launchExchange', [token],
+                               startgas=LAUNCH_GAS)
+        exchanges.append(utils.normalize_address(exchange))
+        bucket_gas.append(used)
+        if len(exchanges) % step == 0 or len(exchanges) == len(tokens):
+            launches.append({'exchanges': len(exchanges), 'gas': sum(bucket_gas) // len(bucket_gas),
+                             'max_gas': max(bucket_gas), 'ms': _ms(bucket_started, len(bucket_gas))})
+            lookup = sample_lookups(chain, factory, tokens[:len(exchanges)], exchanges, rng, samples)
+            lookup['exchanges'] = len(exchanges)
+            lookups.append(lookup)
+            if out:
+                out.write('{:>7} exchanges  launch {:>8} gas {:>9.3f} ms  lookup {:>6} gas\n'.format(
+                    len(exchanges), launches[-1]['gas'], launches[-1]['ms'], lookup[LOOKUPS[0]]))
+            bucket_gas, bucket_started = [], time.time()
+    chain.mine()
+    return exchanges, launches, lookups
+
+
+def enumerate_listings(chain, factory, count, page_size=None):
+    """ Cost of reading every tokenList entry one call at a time and through UniswapLens. """
+    started = time.time()
+    listed = [utils.normalize_address(factory.tokenList(i)) for i in range(count)]
+    token_list_ms = _ms(started)
+    snapshot = chain.snapshot()
+    per_call = 0
+    if count:
+        per_call = _send(chain, factory.codec, factory.address, 'tokenList', [count - 1], with_tx=False)[1]
+    chain.revert(snapshot)
+    lens = deploy_lens(chain)
+    chain.mine()
+    client = LensClient(lens, factory.address) if page_size is None else LensClient(lens, factory.address, page_size)
+    started = time.time()
+    columns = client.snapshot()
+    lens_ms = _ms(started)
+    return listed, columns, {
+        'tokenList': {'calls': count, 'gas': per_call, 'ms': token_list_ms},
+        'lens': {'calls': client.calls, 'exchanges': len(columns.tokens), 'ms': lens_ms},
+    }
+
+
+def initialize(chain, tokens, exchanges, sender=tester.k0, provider=PROVIDER):
+    """ Mint, approve and initializeExchange for every pool, mean gas and wall time per pool. """
+    token = codec(compile_contract('Token/TestToken.sol')['abi'])
+    exchange = codec(compile_contract('Exchange/UniswapExchange.sol')['abi'])
+    setup_gas = init_gas = 0
+    started = time.time()
+    for token_address, exchange_address in zip(tokens, exchanges):
+        setup_gas += _send(chain, token, token_address, 'mint', [tester.accounts[provider], INIT_TOKENS],
+                           sender=sender, startgas=200000)[1]
+        setup_gas += _send(chain, token, token_address, 'approve', [exchange_address, INIT_TOKENS],
+                           sender=tester.keys[provider], startgas=200000)[1]
+        init_gas += _send(chain, exchange, exchange_address, 'initializeExchange', [INIT_TOKENS],
+                          sender=tester.keys[provider], value=INIT_ETH, startgas=300000)[1]
+    ms = _ms(started, len(tokens))
+    chain.mine()
+    pools = max(len(tokens), 1)
+    return {'pools': len(tokens), 'gas': init_gas // pools, 'setup_gas': setup_gas // pools, 'ms': ms}
+
+
+def run(count=COUNT, step=STEP, initialize_pools=0, factory=FACTORIES[0], samples=SAMPLES, seed=0, out=None):
+    """ Launch count exchanges on one factory variant and return the report. """
+    started = time.time()
+    chain, tokens = scale_chain(count)
+    genesis_ms = _ms(started)
+    factory_contract = deploy_contract(chain, factory, args=[])
+    exchanges, launches, lookups = launch(chain, factory_contract, tokens, step, samples, random.Random(seed), out)
+    listed, columns, enumeration = enumerate_listings(chain, factory_contract, count)
+    if listed != tokens or list(columns.exchanges) != exchanges:
+        raise AssertionError('tokenList does not match the launched exchanges')
+    report = {
+        'format': REPORT_FORMAT,
+        'variant': variant_name(factory),
+        'bytecode': hashlib.sha256(compile_contract(factory)['bin']).hexdigest(),
+        'count': count,
+        'genesis_ms': genesis_ms,
+        'launch': launches,
+        'lookup': lookups,
+        'enumerate': enumeration,
+    }
+    if initialize_pools:
+        n = min(initialize_pools, count)
+        report['initialize'] = initialize(chain, tokens[:n], exchanges[:n])
+    return report
+
+
+def metrics(report):
+    """ {metric: gas} of a report, the figures compared between releases. """
+    results = {}
+    for row in report['launch']:
+        results['launchExchange/exchanges={}'.format(row['exchanges'])] = row['gas']
+    for row in report['lookup']:
+        for function in LOOKUPS:
+            results['{}/exchanges={}'.format(function, row['exchanges'])] = row[function]
+    results['tokenList/exchanges={}'.format(report['count'])] = report['enumerate']['tokenList']['gas']
+    if 'initialize' in report:
+        results['initializeExchange/pools={}'.format(report['initialize']['pools'])] = report['initialize']['gas']
+    return results
+
+
+def summary(report, out=sys.stdout):
+    out.write('{}, {} exchanges, bytecode {}\n'.format(
+        report['variant'], report['count'], report['bytecode'][:12]))
+    out.write('{:>10} {:>10} {:>10} {:>10} {:>12} {:>12}\n'.format(
+        'exchanges', 'launch gas', 'max gas', 'launch ms', 'token->exch', 'exch->token'))
+    for row, lookup in zip(report['launch'], report['lookup']):
+        out.write('{:>10} {:>10} {:>10} {:>10.3f} {:>12} {:>12}\n'.format(
+            row['exchanges'], row['gas'], row['max_gas'], row['ms'], lookup[LOOKUPS[0]], lookup[LOOKUPS[1]]))
+    enumeration = report['enumerate']
+    out.write('tokenList: {calls} calls, {gas} gas each, {ms:.1f} ms\n'.format(**enumeration['tokenList']))
+    out.write('UniswapLens: {calls} calls, {ms:.1f} ms\n'.format(**enumeration['lens']))
+    if 'initialize' in report:
+        out.write('initializeExchange: {pools} pools, {gas} gas, {setup_gas} gas to mint and approve, '
+                  '{ms:.3f} ms per pool\n'.format(**report['initialize']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Launch thousands of exchanges and report gas and wall time')
+    parser.add_argument('--count', type=int, default=COUNT)
+    parser.add_argument('--step', type=int, default=STEP)
+    parser.add_argument('--initialize', type=int, default=0, help='initialize the first N pools')
+    parser.add_argument('--factory', default=FACTORIES[0], choices=FACTORIES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the JSON report here')
+    parser.add_argument('--baseline', help='JSON report of an earlier run to compare gas against')
+    parser.add_argument('--threshold', type=float, default=gas.THRESHOLD)
+    args = parser.parse_args(argv)
+    report = run(args.count, args.step, args.initialize, args.factory, seed=args.seed, out=sys.stdout)
+    summary(report)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = metrics(json.load(f))
+    results = metrics(report)
+    gas.report(results, baseline)
+    regressions = gas.compare(results, baseline, args.threshold)[0]
+    for scenario, base, used in regressions:
+        sys.stdout.write('REGRESSION {}: {} -> {}\n'.format(scenario, base, used))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
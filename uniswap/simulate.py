@@ -0,0 +1,195 @@
+"""
+    What-if simulation of many candidate trade sequences on one state.
+
+    A Simulator holds a base state taken from a chain (its head state,
+    committed) and a fork of it made with State.ephemeral_clone(): the fork
+    reads through an overlay database onto the base trie and keeps its own
+    writes in memory, so forking copies nothing and the chain is never
+    touched. Every candidate sequence runs on the fork inside a journal
+    snapshot and is rolled back afterwards, which costs what the sequence
+    wrote and not what the state holds, unlike Chain.snapshot()/revert()
+    which commits the whole head state every time.
+
+    Steps are applied as messages from their sender, the way eth_call
+    executes but kept for the next step: no nonce, no signature, no gas
+    fee, so ETH balances move by the traded value only. A reverted step
+    leaves the fork as it was and the sequence goes on with the next one.
+    After the last step the pools of the watched exchanges and the ETH and
+    token balances of the watched accounts are read.
+
+    run_all() spreads sequences over a process pool started with fork, so
+    every worker inherits the base state and its database copy-on-write
+    from the parent instead of rebuilding it.
+
+    run with:   python -m uniswap.simulate --sequences 2000 --length 5 --workers 4
+"""
+
+import argparse
+import multiprocessing
+import random
+import sys
+import time
+from collections import namedtuple
+from ethereum.tools import tester
+from ethereum.messages import VMExt, apply_msg
+from ethereum.transactions import Transaction
+from ethereum import utils, vm
+from uniswap.deploy import FACTORIES
+from uniswap.load import LoadGenerator
+
+STEP_GAS = 1000000
+POOL_GETTERS = ('ethPool', 'tokenPool', 'invariant', 'totalShares')
+CHUNK = 50
+
+Step = namedtuple('Step', 'sender to value data')
+Outcome = namedtuple('Outcome', 'outputs gas pools balances')
+
+
+class Simulator(object):
+    """ Candidate sequences run on forks of one base state. """
+
+    def __init__(self, state, exchanges=(), tokens=(), accounts=(), codec=None, gas=STEP_GAS):
+        state.commit()
+        self.base = state.ephemeral_clone()
+        self.fork = self.base.ephemeral_clone()
+        self.exchanges = [utils.normalize_address(e) for e in exchanges]
+        self.tokens = [utils.normalize_address(t) for t in tokens]
+        self.accounts = [utils.normalize_address(a) for a in accounts]
+        self.codec = codec
+        self.gas = gas
+        self.getters = [utils.sha3(name + '()')[:4] for name in POOL_GETTERS]
+        self.balance_of = utils.sha3('balanceOf(address)')[:4]
+        # messages need a transaction for ORIGIN and GASPRICE
+        self.origin = Transaction(0, 0, 21000, b'', 0, b'')
+
+    @classmethod
+    def from_world(cls, world, accounts=(), **kwargs):
+        """ Simulator on the head state of a World, watching its exchanges and tokens. """
+        return cls(world.chain.head_state, [e.address for e in world.exchanges], [t.address for t in world.tokens],
+                   accounts, world.exchanges[0].codec if world.exchanges else None, **kwargs)
+
+    def step(self, exchange, function, args, sender, value=0):
+        """ Step calling one exchange function through the exchange codec. """
+        return Step(utils.normalize_address(sender), utils.normalize_address(exchange), value,
+                    self.codec.encode(function, args))
+
+    def timestamp(self):
+        return self.base.timestamp
+
+    def _apply(self, state, sender, to, value, data):
+        """ (output or None where it reverts, gas used) of one message. """
+        message = vm.Message(sender, to, value, self.gas, data, code_address=to)
+        success, gas_remaining, output = apply_msg(VMExt(state, self.origin), message)
+        return (bytes(output) if success else None), self.gas - gas_remaining
+
+    def _word(self, state, to, data):
+        output = self._apply(state, b'\x00' * 20, to, 0, data)[0]
+        return utils.big_endian_to_int(output) if output else None
+
+    def observe(self, state):
+        """ (pools of every exchange, (ETH, token balances) of every account) in state. """
+        pools = tuple(tuple(self._word(state, exchange, getter) for getter in self.getters)
+                      for exchange in self.exchanges)
+        balances = tuple((state.get_balance(account),) + tuple(
+            self._word(state, token, self.balance_of + b'\x00' * 12 + account) for token in self.tokens)
+            for account in self.accounts)
+        return pools, balances
+
+    def run(self, sequence):
+        """ Outcome of one sequence of Steps, the fork is left as it was. """
+        state = self.fork
+        snapshot = state.snapshot()
+        try:
+            outputs, gas = [], []
+            for sender, to, value, data in sequence:
+                output, used = self._apply(state, sender, to, value, data)
+                outputs.append(output)
+                gas.append(used)
+            return Outcome(outputs, gas, *self.observe(state))
+        finally:
+            state.revert(snapshot)
+
+    def run_all(self, sequences, workers=1, chunk=CHUNK):
+        """ Outcomes of sequences in order, spread over workers forked processes. """
+        if workers <= 1 or len(sequences) <= chunk:
+            return [self.run(sequence) for sequence in sequences]
+        global _simulator
+        _simulator = self
+        try:
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                return pool.map(_run, sequences, chunk)
+        finally:
+            _simulator = None
+
+
+_simulator = None
+
+
+def _run(sequence):
+    return _simulator.run(sequence)
+
+
+def random_sequences(simulator, traders, count, length, seed=0):
+    """ count random swap sequences over the watched exchanges, for benchmarks. """
+    rng = random.Random(seed)
+    timeout = simulator.timestamp() + 300
+    functions = ('ethToTokenSwap', 'tokenToEthSwap', 'tokenToTokenSwap')
+    sequences = []
+    for _ in range(count):
+        sequence = []
+        for _ in range(length):
+            function = rng.choice(functions if len(simulator.exchanges) > 1 else functions[:2])
+            i = rng.randrange(len(simulator.exchanges))
+            amount = rng.randint(1, 1000) * 10**15
+            sender = rng.choice(traders)
+            if function == 'ethToTokenSwap':
+                sequence.append(simulator.step(simulator.exchanges[i], function, [1, timeout], sender, amount))
+            elif function == 'tokenToEthSwap':
+                sequence.append(simulator.step(simulator.exchanges[i], function, [amount, 1, timeout], sender))
+            else:
+                other = simulator.tokens[(i + 1) % len(simulator.tokens)]
+                sequence.append(simulator.step(simulator.exchanges[i], function, [other, amount, 1, timeout], sender))
+        sequences.append(sequence)
+    return sequences
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Evaluate random candidate trade sequences on one state')
+    parser.add_argument('--sequences', type=int, default=2000)
+    parser.add_argument('--length', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--exchanges', type=int, default=2)
+    parser.add_argument('--factory', default=FACTORIES[0], choices=FACTORIES)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    generator = LoadGenerator(args.exchanges, 4, args.factory)
+    generator.setup()
+    simulator = Simulator.from_world(generator.world, generator.accounts)
+    sequences = random_sequences(simulator, generator.accounts, args.sequences, args.length, args.seed)
+    for workers in sorted({1, args.workers}):
+        started = time.time()
+        outcomes = simulator.run_all(sequences, workers)
+        seconds = time.time() - started
+        reverted = sum(output is None for outcome in outcomes for output in outcome.outputs)
+        sys.stdout.write('{} workers: {} sequences of {} steps in {:.2f}s, {:.0f} sequences/s, '
+                         '{} steps reverted\n'.format(workers, len(outcomes), args.length, seconds,
+                                                       len(outcomes) / max(seconds, 1e-9), reverted))
+    started = time.time()
+    chain = generator.chain
+    for sequence in sequences[:200]:
+        snapshot = chain.snapshot()
+        for sender, to, value, data in sequence:
+            try:
+                chain.tx(sender=generator.keys[generator.accounts.index(sender)], to=to, value=value, data=data,
+                         startgas=STEP_GAS)
+            except tester.TransactionFailed:
+                pass
+        chain.revert(snapshot)
+    seconds = time.time() - started
+    sys.stdout.write('Chain.snapshot()/revert() with transactions: {:.0f} sequences/s\n'.format(
+        min(len(sequences), 200) / max(seconds, 1e-9)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())